@@ -3,21 +3,32 @@ AI分析API路由
 提供各种类型的口腔影像分析服务
 """
 
+import json
+import shutil
 import asyncio
+import tempfile
 import uuid
 from datetime import datetime
 from typing import Dict, Any, List, Optional
-from io import BytesIO
 
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form, BackgroundTasks
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field, field_validator
-from PIL import Image
 
 from app.core.config import settings
 from app.core.logger import analysis_logger, api_logger
-from app.services.model_manager import model_manager
-from app.core.redis import cache_set, cache_get, CacheKeys
+from app.services.analysis_processor import SUPPORTED_ANALYSIS_TYPES
+from app.services.analysis_queue import analysis_queue, payload_path, QueueUnavailableError
+from app.services.batch_ingest import (
+    BatchIngestor, detect_format, iter_multipart, iter_archive,
+    open_batch_session, claim_batch_session, read_batch_records, batch_events_key
+)
+from app.services.upload_spool import spool_upload, UploadTooLargeError
+from app.services.analysis_progress import (
+    BATCH_TTL, set_progress, get_progress, get_progress_many,
+    init_batch_counters, get_batch_counters, progress_broker
+)
+from app.core.redis import redis_manager, cache_set, cache_get, CacheKeys
 
 router = APIRouter()
 
@@ -47,45 +58,6 @@ class AnalysisStatus(BaseModel):
     message: Optional[str] = None
     estimated_time: Optional[int] = None
 
-# 支持的分析类型
-SUPPORTED_ANALYSIS_TYPES = {
-    "intraoral": {
-        "name": "口内照片分析",
-        "description": "分析口内照片，识别牙齿问题和口腔健康状况",
-        "model": "intraoral",
-        "max_file_size": 10 * 1024 * 1024,  # 10MB
-        "supported_formats": ["jpg", "jpeg", "png"]
-    },
-    "facial": {
-        "name": "面相照片分析", 
-        "description": "分析面部照片，检测颌面部发育异常",
-        "model": "facial",
-        "max_file_size": 10 * 1024 * 1024,  # 10MB
-        "supported_formats": ["jpg", "jpeg", "png"]
-    },
-    "cephalometric": {
-        "name": "头侧X光分析",
-        "description": "分析头颅侧位X光片，评估颅颌面结构",
-        "model": "cephalometric",
-        "max_file_size": 20 * 1024 * 1024,  # 20MB
-        "supported_formats": ["jpg", "jpeg", "png", "dcm"]
-    },
-    "panoramic": {
-        "name": "全景X光分析",
-        "description": "分析口腔全景片，全面评估牙齿和颌骨状况",
-        "model": "panoramic", 
-        "max_file_size": 20 * 1024 * 1024,  # 20MB
-        "supported_formats": ["jpg", "jpeg", "png", "dcm"]
-    },
-    "3d": {
-        "name": "3D模型分析",
-        "description": "分析三维模型，精确测量和评估",
-        "model": "3d",
-        "max_file_size": 50 * 1024 * 1024,  # 50MB
-        "supported_formats": ["stl", "obj", "ply"]
-    }
-}
-
 @router.get("/types", summary="获取支持的分析类型")
 async def get_analysis_types():
     """
@@ -99,7 +71,6 @@ async def get_analysis_types():
 
 @router.post("/upload", response_model=AnalysisResponse, summary="上传图像并开始分析")
 async def upload_and_analyze(
-    background_tasks: BackgroundTasks,
     analysis_type: str = Form(..., description="分析类型"),
     file: UploadFile = File(..., description="要分析的图像文件"),
     options: Optional[str] = Form(None, description="分析选项(JSON字符串)")
@@ -130,17 +101,6 @@ async def upload_and_analyze(
         if not file.filename:
             raise HTTPException(status_code=400, detail="文件名不能为空")
         
-        # 检查文件大小
-        file_size = 0
-        content = await file.read()
-        file_size = len(content)
-        
-        if file_size > analysis_config["max_file_size"]:
-            raise HTTPException(
-                status_code=413,
-                detail=f"文件大小超过限制 ({analysis_config['max_file_size'] / 1024 / 1024}MB)"
-            )
-        
         # 检查文件格式
         file_extension = file.filename.lower().split('.')[-1]
         if file_extension not in analysis_config["supported_formats"]:
@@ -152,44 +112,51 @@ async def upload_and_analyze(
         # 解析选项
         analysis_options = {}
         if options:
-            import json
             try:
                 analysis_options = json.loads(options)
             except json.JSONDecodeError:
                 raise HTTPException(status_code=400, detail="分析选项JSON格式错误")
         
-        # 记录分析开始
-        analysis_logger.analysis_start(
-            analysis_id=analysis_id,
-            analysis_type=analysis_type,
-            image_info={
-                "filename": file.filename,
-                "size": file_size,
-                "format": file_extension
-            }
-        )
-        
-        # 设置分析状态为处理中
-        await cache_set(
-            CacheKeys.format_key(CacheKeys.ANALYSIS_PROGRESS, analysis_id=analysis_id),
-            {
-                "status": "processing",
-                "progress": 0,
-                "message": "正在处理图像...",
-                "started_at": datetime.now().isoformat()
-            },
-            ttl=3600  # 1小时
-        )
+        # 分块直接写入共享的任务内容目录，超过大小限制立即中止
+        try:
+            upload = await spool_upload(file, analysis_config["max_file_size"], path=payload_path(analysis_id))
+        except UploadTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
         
-        # 后台执行分析任务
-        background_tasks.add_task(
-            process_analysis,
-            analysis_id,
-            analysis_type, 
-            content,
-            file.filename,
-            analysis_options
-        )
+        try:
+            # 记录分析开始
+            analysis_logger.analysis_start(
+                analysis_id=analysis_id,
+                analysis_type=analysis_type,
+                image_info={
+                    "filename": file.filename,
+                    "size": upload.size,
+                    "format": file_extension
+                }
+            )
+            
+            # 设置分析状态为处理中
+            await set_progress(
+                analysis_id,
+                {
+                    "status": "processing",
+                    "progress": 0,
+                    "message": "排队等待分析...",
+                    "started_at": datetime.now().isoformat()
+                }
+            )
+            
+            # 加入分析队列，由worker节点执行；消息中只包含分析ID，内容由worker从共享目录读取
+            await analysis_queue.enqueue(
+                analysis_id,
+                analysis_type,
+                file.filename,
+                analysis_options,
+                content_hash=upload.sha256
+            )
+        except BaseException:
+            upload.discard()
+            raise
         
         return AnalysisResponse(
             success=True,
@@ -201,144 +168,30 @@ async def upload_and_analyze(
         
     except HTTPException:
         raise
-    except Exception as e:
+    except QueueUnavailableError as e:
         analysis_logger.analysis_error(
             analysis_id=analysis_id,
             analysis_type=analysis_type,
             error=str(e)
         )
-        raise HTTPException(status_code=500, detail=f"分析启动失败: {str(e)}")
-
-async def process_analysis(
-    analysis_id: str,
-    analysis_type: str,
-    image_content: bytes,
-    filename: str,
-    options: Dict[str, Any]
-):
-    """
-    后台处理分析任务
-    """
-    start_time = datetime.now()
-    
-    try:
-        # 更新进度: 开始处理
-        await cache_set(
-            CacheKeys.format_key(CacheKeys.ANALYSIS_PROGRESS, analysis_id=analysis_id),
-            {
-                "status": "processing",
-                "progress": 10,
-                "message": "正在加载图像...",
-                "started_at": start_time.isoformat()
-            },
-            ttl=3600
-        )
-        
-        # 加载图像
-        image = Image.open(BytesIO(image_content))
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # 更新进度: 图像预处理
-        await cache_set(
-            CacheKeys.format_key(CacheKeys.ANALYSIS_PROGRESS, analysis_id=analysis_id),
-            {
-                "status": "processing", 
-                "progress": 30,
-                "message": "正在进行AI分析...",
-                "started_at": start_time.isoformat()
-            },
-            ttl=3600
-        )
-        
-        # 执行AI分析
-        model_name = SUPPORTED_ANALYSIS_TYPES[analysis_type]["model"]
-        results = await model_manager.inference(model_name, image)
-        
-        # 更新进度: 处理结果
-        await cache_set(
-            CacheKeys.format_key(CacheKeys.ANALYSIS_PROGRESS, analysis_id=analysis_id),
-            {
-                "status": "processing",
-                "progress": 80, 
-                "message": "正在生成报告...",
-                "started_at": start_time.isoformat()
-            },
-            ttl=3600
-        )
-        
-        # 计算处理时间
-        processing_time = (datetime.now() - start_time).total_seconds()
-        
-        # 添加分析元数据
-        final_results = {
-            **results,
-            "analysis_metadata": {
-                "analysis_id": analysis_id,
-                "filename": filename,
-                "file_size": len(image_content),
-                "image_size": image.size,
-                "processing_time": processing_time,
-                "options": options,
-                "completed_at": datetime.now().isoformat()
-            }
-        }
-        
-        # 保存最终结果
-        await cache_set(
-            CacheKeys.format_key(CacheKeys.ANALYSIS_RESULT, analysis_id=analysis_id),
-            final_results,
-            ttl=7 * 24 * 3600  # 保存7天
-        )
-        
-        # 更新最终状态
-        await cache_set(
-            CacheKeys.format_key(CacheKeys.ANALYSIS_PROGRESS, analysis_id=analysis_id),
-            {
-                "status": "completed",
-                "progress": 100,
-                "message": "分析完成",
-                "started_at": start_time.isoformat(),
-                "completed_at": datetime.now().isoformat(),
-                "processing_time": processing_time
-            },
-            ttl=3600
-        )
-        
-        # 记录分析完成
-        analysis_logger.analysis_complete(
-            analysis_id=analysis_id,
-            analysis_type=analysis_type,
-            duration=processing_time,
-            confidence=results.get("confidence", 0.0),
-            results={"summary": "analysis_completed"}
-        )
-        
+        raise HTTPException(status_code=503, detail="分析队列暂不可用，请稍后重试")
     except Exception as e:
-        # 记录错误
-        error_message = str(e)
-        processing_time = (datetime.now() - start_time).total_seconds()
-        
         analysis_logger.analysis_error(
             analysis_id=analysis_id,
             analysis_type=analysis_type,
-            error=error_message,
-            duration=processing_time
-        )
-        
-        # 保存错误状态
-        await cache_set(
-            CacheKeys.format_key(CacheKeys.ANALYSIS_PROGRESS, analysis_id=analysis_id),
-            {
-                "status": "failed",
-                "progress": 0,
-                "message": f"分析失败: {error_message}",
-                "error": error_message,
-                "started_at": start_time.isoformat(),
-                "failed_at": datetime.now().isoformat()
-            },
-            ttl=3600
+            error=str(e)
         )
+        raise HTTPException(status_code=500, detail=f"分析启动失败: {str(e)}")
+
+@router.get("/queue/stats", summary="获取分析队列状态")
+async def get_queue_stats():
+    """
+    获取各分析类型任务队列的积压量和执行中（待确认）任务数
+    """
+    return {
+        "success": True,
+        "queues": await analysis_queue.get_stats()
+    }
 
 @router.get("/status/{analysis_id}", response_model=AnalysisStatus, summary="查询分析状态")
 async def get_analysis_status(analysis_id: str):
@@ -347,9 +200,7 @@ async def get_analysis_status(analysis_id: str):
     """
     
     # 从缓存获取状态
-    status_data = await cache_get(
-        CacheKeys.format_key(CacheKeys.ANALYSIS_PROGRESS, analysis_id=analysis_id)
-    )
+    status_data = await get_progress(analysis_id)
     
     if not status_data:
         raise HTTPException(status_code=404, detail="分析任务不存在或已过期")
@@ -362,6 +213,160 @@ async def get_analysis_status(analysis_id: str):
         estimated_time=status_data.get("estimated_time")
     )
 
+def _sse_message(event: str, data: Dict[str, Any]) -> str:
+    """格式化为服务器推送事件"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def _parse_analysis_ids(ids: str) -> List[str]:
+    """解析逗号分隔的分析ID并检查数量"""
+    analysis_ids = list(dict.fromkeys(i.strip() for i in ids.split(",") if i.strip()))
+    if not analysis_ids:
+        raise HTTPException(status_code=400, detail="分析ID不能为空")
+    if len(analysis_ids) > settings.PROGRESS_STREAM_MAX_IDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"单个连接最多跟踪 {settings.PROGRESS_STREAM_MAX_IDS} 个分析任务"
+        )
+    return analysis_ids
+
+def _progress_stream_response(request: Request, analysis_ids: List[str]) -> StreamingResponse:
+    """
+    以SSE推送多个分析任务的进度，全部任务结束后发送 end 事件并关闭
+    事件: progress（每次进度变化，首条为当前状态）、end
+    """
+    
+    async def event_stream():
+        subscription = progress_broker.subscribe()
+        try:
+            await subscription.follow(analysis_ids)
+            while subscription.analysis_ids:
+                events = await subscription.next_events(timeout=settings.PROGRESS_STREAM_HEARTBEAT)
+                if not events:
+                    if await request.is_disconnected():
+                        return
+                    yield ": keepalive\n\n"
+                    continue
+                for event in events:
+                    yield _sse_message("progress", event)
+            yield _sse_message("end", {"analysis_ids": analysis_ids})
+        finally:
+            await subscription.close()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # 禁止反向代理缓冲
+        }
+    )
+
+def _batch_records_response(request: Request, batch_id: str) -> StreamingResponse:
+    """以SSE推送流式批量导入的记录"""
+    
+    async def event_stream():
+        async for record in read_batch_records(batch_id):
+            if record is None:
+                if await request.is_disconnected():
+                    return
+                yield ": keepalive\n\n"
+                continue
+            yield _sse_message(record["type"], record)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # 禁止反向代理缓冲
+        }
+    )
+
+@router.get("/events", summary="订阅多个分析任务的进度（SSE）")
+async def stream_analyses_progress(
+    request: Request,
+    ids: str = Query(..., description="分析ID，逗号分隔")
+):
+    """
+    通过服务器推送事件（text/event-stream）实时接收多个分析任务的进度，替代轮询状态接口
+    """
+    return _progress_stream_response(request, _parse_analysis_ids(ids))
+
+@router.get("/events/{analysis_id}", summary="订阅分析进度（SSE）")
+async def stream_analysis_progress(request: Request, analysis_id: str):
+    """
+    通过服务器推送事件实时接收单个分析任务的进度
+    """
+    return _progress_stream_response(request, [analysis_id])
+
+@router.websocket("/ws")
+async def progress_websocket(websocket: WebSocket):
+    """
+    WebSocket进度推送，一个连接可随时增减跟踪的分析任务
+    
+    客户端消息：
+    - {"action": "subscribe", "analysis_ids": [...]} 或 {"action": "subscribe", "batch_id": "..."}
+    - {"action": "unsubscribe", "analysis_ids": [...]}
+    
+    服务端消息：{"type": "progress", ...}、{"type": "subscribed", ...}、{"type": "error", ...}、{"type": "ping"}
+    """
+    await websocket.accept()
+    subscription = progress_broker.subscribe()
+    
+    async def handle_commands():
+        try:
+            while True:
+                try:
+                    command = json.loads(await websocket.receive_text())
+                    action = command.get("action")
+                    analysis_ids = list(command.get("analysis_ids") or [])
+                except (ValueError, AttributeError, TypeError):
+                    await websocket.send_json({"type": "error", "message": "消息格式错误"})
+                    continue
+                
+                if action == "subscribe":
+                    if command.get("batch_id"):
+                        batch_info = await cache_get(
+                            CacheKeys.format_key(CacheKeys.BATCH_INFO, batch_id=command["batch_id"])
+                        )
+                        if not batch_info:
+                            await websocket.send_json({"type": "error", "message": "批量任务不存在"})
+                            continue
+                        analysis_ids.extend(batch_info["analysis_ids"])
+                    try:
+                        added = await subscription.follow(analysis_ids)
+                    except ValueError as e:
+                        await websocket.send_json({"type": "error", "message": str(e)})
+                        continue
+                    await websocket.send_json({"type": "subscribed", "analysis_ids": added})
+                elif action == "unsubscribe":
+                    await subscription.unfollow(analysis_ids)
+                else:
+                    await websocket.send_json({"type": "error", "message": f"未知操作: {action}"})
+        finally:
+            # 连接断开时唤醒发送循环
+            subscription.wake()
+    
+    commands = asyncio.create_task(handle_commands())
+    try:
+        while not commands.done():
+            events = await subscription.next_events(timeout=settings.PROGRESS_STREAM_HEARTBEAT)
+            if commands.done():
+                break
+            if not events:
+                await websocket.send_json({"type": "ping"})
+                continue
+            for event in events:
+                await websocket.send_json({"type": "progress", **event})
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        api_logger.error("WebSocket进度推送异常", error=str(e))
+    finally:
+        commands.cancel()
+        await asyncio.gather(commands, return_exceptions=True)
+        await subscription.close()
+
 @router.get("/result/{analysis_id}", summary="获取分析结果")
 async def get_analysis_result(analysis_id: str):
     """
@@ -369,9 +374,7 @@ async def get_analysis_result(analysis_id: str):
     """
     
     # 检查分析状态
-    status_data = await cache_get(
-        CacheKeys.format_key(CacheKeys.ANALYSIS_PROGRESS, analysis_id=analysis_id)
-    )
+    status_data = await get_progress(analysis_id)
     
     if not status_data:
         raise HTTPException(status_code=404, detail="分析任务不存在或已过期")
@@ -491,7 +494,6 @@ async def get_analysis_history(
 
 @router.post("/batch", summary="批量分析")
 async def batch_analyze(
-    background_tasks: BackgroundTasks,
     analysis_type: str = Form(...),
     files: List[UploadFile] = File(...)
 ):
@@ -512,37 +514,47 @@ async def batch_analyze(
         )
     
     batch_id = str(uuid.uuid4())
-    analysis_ids = []
+    analysis_ids = [str(uuid.uuid4()) for _ in files]
     
     try:
-        for file in files:
-            analysis_id = str(uuid.uuid4())
-            analysis_ids.append(analysis_id)
-            
-            # 读取文件内容
-            content = await file.read()
-            
-            # 后台执行分析
-            background_tasks.add_task(
-                process_analysis,
-                analysis_id,
-                analysis_type,
-                content, 
-                file.filename or f"batch_{analysis_id}",
-                {}
-            )
-        
-        # 缓存批量任务信息
+        # 缓存批量任务信息，并创建由worker递增的完成/失败计数
         await cache_set(
-            f"batch:{batch_id}",
+            CacheKeys.format_key(CacheKeys.BATCH_INFO, batch_id=batch_id),
             {
                 "analysis_ids": analysis_ids,
                 "analysis_type": analysis_type,
                 "total_files": len(files),
                 "created_at": datetime.now().isoformat()
             },
-            ttl=24 * 3600  # 24小时
+            ttl=BATCH_TTL  # 24小时
         )
+        await init_batch_counters(batch_id, len(files))
+        
+        for analysis_id, file in zip(analysis_ids, files):
+            # 分块写入共享的任务内容目录
+            try:
+                await spool_upload(file, SUPPORTED_ANALYSIS_TYPES[analysis_type]["max_file_size"],
+                                   path=payload_path(analysis_id))
+            except UploadTooLargeError as e:
+                raise HTTPException(status_code=413, detail=f"{file.filename}: {e}")
+            
+            # 设置分析状态并加入分析队列
+            await set_progress(
+                analysis_id,
+                {
+                    "status": "processing",
+                    "progress": 0,
+                    "message": "排队等待分析...",
+                    "started_at": datetime.now().isoformat()
+                }
+            )
+            await analysis_queue.enqueue(
+                analysis_id,
+                analysis_type,
+                file.filename or f"batch_{analysis_id}",
+                {},
+                batch_id=batch_id
+            )
         
         return {
             "success": True,
@@ -552,64 +564,177 @@ async def batch_analyze(
             "analysis_type": analysis_type
         }
         
+    except HTTPException:
+        raise
+    except QueueUnavailableError:
+        raise HTTPException(status_code=503, detail="分析队列暂不可用，请稍后重试")
     except Exception as e:
         api_logger.error(f"批量分析启动失败", error=str(e))
         raise HTTPException(status_code=500, detail=f"批量分析失败: {str(e)}")
 
+def _parse_batch_request(analysis_type: Optional[str], options: Optional[str]) -> Dict[str, Any]:
+    """检查分析类型并解析分析选项"""
+    if analysis_type not in SUPPORTED_ANALYSIS_TYPES:
+        raise HTTPException(status_code=400, detail=f"不支持的分析类型: {analysis_type}")
+    try:
+        return json.loads(options) if options else {}
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="分析选项格式错误")
+
+@router.post("/batch/stream/open", summary="创建流式批量导入会话")
+async def open_stream_batch(
+    request: Request,
+    analysis_type: str = Query(..., description="分析类型"),
+    options: Optional[str] = Query(None, description="分析选项（JSON）")
+):
+    """
+    上传前先取得批量任务ID：订阅 events_url（SSE）后再向 upload_url 上传，
+    上传过程中即可逐条收到每个文件的结果
+    """
+    analysis_options = _parse_batch_request(analysis_type, options)
+    batch_id = await open_batch_session(analysis_type, analysis_options)
+    
+    return {
+        "success": True,
+        "batch_id": batch_id,
+        "analysis_type": analysis_type,
+        "events_url": str(request.url_for("stream_batch_progress", batch_id=batch_id)),
+        "upload_url": str(request.url_for("stream_batch_analyze").include_query_params(batch_id=batch_id)),
+        "expires_in": settings.STREAM_BATCH_SESSION_TTL
+    }
+
+@router.post("/batch/stream", summary="流式批量导入")
+async def stream_batch_analyze(
+    request: Request,
+    analysis_type: Optional[str] = Query(None, description="分析类型（未指定batch_id时必填）"),
+    options: Optional[str] = Query(None, description="分析选项（JSON）"),
+    batch_id: Optional[str] = Query(None, description="/batch/stream/open 返回的批量任务ID"),
+    format: str = Query("auto", description="上传格式", pattern="^(auto|multipart|tar|zip)$")
+):
+    """
+    大批量导入：请求体为 multipart（多个文件字段）或 tar/zip 归档
+    上传内容边接收边写入磁盘并按模型批大小分组入队。
+    每个文件的结果在完成时写入批量记录流：需要在上传期间接收结果时，先调用 /batch/stream/open
+    并订阅 /batch/{batch_id}/events；本接口的响应在上传接收完毕后以 NDJSON 返回同一记录流，最后一行为汇总
+    """
+    
+    if batch_id:
+        session = await claim_batch_session(batch_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="导入会话不存在、已过期或已使用")
+        analysis_type, analysis_options = session["analysis_type"], session["options"]
+    else:
+        analysis_options = _parse_batch_request(analysis_type, options)
+    
+    upload_format = detect_format(request.headers.get("content-type", "")) if format == "auto" else format
+    if upload_format is None:
+        raise HTTPException(
+            status_code=415,
+            detail="请求体需为 multipart/form-data 或 tar/zip 归档"
+        )
+    
+    max_file_size = SUPPORTED_ANALYSIS_TYPES[analysis_type]["max_file_size"]
+    spool_dir = tempfile.mkdtemp(dir=settings.BATCH_SPOOL_DIR)
+    ingestor = BatchIngestor(analysis_type, analysis_options, batch_id=batch_id)
+    
+    # 请求体须在返回流式响应前读完：响应开始后框架会接管请求的接收通道
+    try:
+        if upload_format == "multipart":
+            items = iter_multipart(request, spool_dir, max_file_size)
+        else:
+            items = iter_archive(request, spool_dir, upload_format, max_file_size)
+        await ingestor.ingest(items)
+    except UploadTooLargeError as e:
+        await ingestor.close()
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        await ingestor.close()
+        raise HTTPException(status_code=400, detail=str(e))
+    except BaseException:
+        await ingestor.close()
+        raise
+    finally:
+        # 入队时已读取文件内容，暂存文件不再需要
+        shutil.rmtree(spool_dir, ignore_errors=True)
+    
+    async def generate():
+        async for record in ingestor.records():
+            yield json.dumps(record, ensure_ascii=False, default=str) + "\n"
+    
+    return StreamingResponse(
+        generate(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Batch-Id": ingestor.batch_id}
+    )
+
 @router.get("/batch/{batch_id}", summary="获取批量分析状态")
-async def get_batch_status(batch_id: str):
+async def get_batch_status(
+    batch_id: str,
+    include_items: bool = Query(True, description="是否返回每个分析的状态（否则只读取整体计数）")
+):
     """
     获取批量分析的整体状态
+    
+    整体进度来自worker维护的计数，读取开销与批量大小无关；
+    每个分析的状态通过一次流水线批量读取
     """
     
     # 获取批量任务信息
-    batch_info = await cache_get(f"batch:{batch_id}")
+    batch_info = await cache_get(CacheKeys.format_key(CacheKeys.BATCH_INFO, batch_id=batch_id))
     if not batch_info:
         raise HTTPException(status_code=404, detail="批量任务不存在")
     
     analysis_ids = batch_info["analysis_ids"]
+    total_files = batch_info["total_files"]
+    counters = await get_batch_counters(batch_id)
     
     # 获取每个分析的状态
     statuses = []
-    completed_count = 0
-    failed_count = 0
-    
-    for analysis_id in analysis_ids:
-        status_data = await cache_get(
-            CacheKeys.format_key(CacheKeys.ANALYSIS_PROGRESS, analysis_id=analysis_id)
-        )
-        
-        if status_data:
-            status = status_data.get("status", "unknown")
-            if status == "completed":
-                completed_count += 1
-            elif status == "failed":
-                failed_count += 1
-            
+    if include_items or counters["total"] is None:
+        for analysis_id, status_data in zip(analysis_ids, await get_progress_many(analysis_ids)):
+            status_data = status_data or {}
             statuses.append({
                 "analysis_id": analysis_id,
-                "status": status,
+                "status": status_data.get("status", "unknown"),
                 "progress": status_data.get("progress", 0)
             })
-        else:
-            statuses.append({
-                "analysis_id": analysis_id,
-                "status": "unknown",
-                "progress": 0
-            })
+    
+    if counters["total"] is not None:
+        completed_count = counters["completed"] or 0
+        failed_count = counters["failed"] or 0
+    else:
+        # 计数已过期或创建于计数功能之前，按各分析状态统计
+        completed_count = sum(1 for item in statuses if item["status"] == "completed")
+        failed_count = sum(1 for item in statuses if item["status"] == "failed")
     
     # 计算整体进度
-    total_files = batch_info["total_files"]
     overall_progress = (completed_count / total_files) * 100 if total_files > 0 else 0
+    finished = completed_count + failed_count >= total_files
     
     return {
         "success": True,
         "batch_id": batch_id,
-        "status": "completed" if completed_count == total_files else "processing",
+        "status": "completed" if finished else "processing",
         "overall_progress": round(overall_progress, 1),
         "completed_count": completed_count,
         "failed_count": failed_count,
         "total_count": total_files,
-        "analysis_statuses": statuses,
+        "analysis_statuses": statuses if include_items else None,
         "created_at": batch_info.get("created_at")
     }
+
+@router.get("/batch/{batch_id}/events", summary="订阅批量分析进度（SSE）")
+async def stream_batch_progress(request: Request, batch_id: str):
+    """
+    通过服务器推送事件实时接收批量任务中每个分析的进度
+    流式批量导入：从头推送导入记录（事件名为记录类型：batch、accepted、rejected、result、error、summary），
+    上传尚未结束时也会推送已完成文件的结果，summary 后关闭
+    """
+    if await redis_manager.exists(batch_events_key(batch_id)):
+        return _batch_records_response(request, batch_id)
+    
+    batch_info = await cache_get(CacheKeys.format_key(CacheKeys.BATCH_INFO, batch_id=batch_id))
+    if not batch_info:
+        raise HTTPException(status_code=404, detail="批量任务不存在")
+    
+    return _progress_stream_response(request, batch_info["analysis_ids"])
@@ -19,6 +19,7 @@ from app.core.config import settings
 from app.core.logger import api_logger
 from app.services.third_party_ai_simplified import get_simplified_ai_client
 from app.services.report_interpreter import report_interpreter
+from app.services.upload_spool import spool_upload, UploadTooLargeError
 
 router = APIRouter()
 
@@ -156,6 +157,8 @@ async def analyze_2d_image(
             estimated_time=estimated_time
         )
         
+    except HTTPException:
+        raise
     except json.JSONDecodeError:
         raise HTTPException(status_code=400, detail="请求参数格式错误")
     except Exception as e:
@@ -240,6 +243,8 @@ async def analyze_3d_model(
             estimated_time=estimated_time
         )
         
+    except HTTPException:
+        raise
     except json.JSONDecodeError:
         raise HTTPException(status_code=400, detail="请求参数格式错误")
     except Exception as e:
@@ -503,7 +508,7 @@ async def _call_third_party_3d_analysis(ai_client, analysis_type: str, file_path
 
 
 async def _save_uploaded_file(file: UploadFile, task_id: str) -> Path:
-    """保存上传的文件"""
+    """分块保存上传的文件，超过大小限制时中止并返回413"""
     # 确保上传目录存在
     upload_dir = Path(settings.UPLOAD_DIR)
     upload_dir.mkdir(parents=True, exist_ok=True)
@@ -514,9 +519,10 @@ async def _save_uploaded_file(file: UploadFile, task_id: str) -> Path:
     file_path = upload_dir / filename
     
     # 保存文件
-    with open(file_path, "wb") as buffer:
-        content = await file.read()
-        buffer.write(content)
+    try:
+        await spool_upload(file, settings.MAX_FILE_SIZE, path=str(file_path))
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     
     return file_path
 
@@ -8,11 +8,15 @@ from datetime import datetime
 from typing import Dict, Any, Optional
 
 from fastapi import APIRouter, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel
 
 from app.core.config import settings
 from app.core.logger import api_logger
+from app.core.metrics import render_metrics
+from app.core.redis import redis_manager
+from app.services.resilience import OPEN
+from app.services.third_party_ai_simplified import get_simplified_ai_client
 
 router = APIRouter()
 
@@ -63,6 +67,32 @@ async def health_check():
         components["ai_service"] = {"status": "unhealthy", "error": str(e)}
         overall_status = "degraded"
     
+    # 进程内近端缓存命中情况（本worker）
+    components["near_cache"] = {
+        "status": "healthy",
+        **redis_manager.near_cache.get_stats(),
+        "compute": redis_manager.get_compute_stats()
+    }
+    
+    # 第三方AI服务连接池和熔断状态（本worker）：连接池未运行时不可用，有接口熔断时降级
+    ai_stats = get_simplified_ai_client().get_stats()
+    open_breakers = [
+        endpoint for endpoint, stats in ai_stats.get("resilience", {}).items()
+        if stats["breaker"] == OPEN
+    ]
+    if not ai_stats["running"]:
+        ai_status = "unhealthy"
+        overall_status = "degraded"
+    elif open_breakers:
+        ai_status = "degraded"
+    else:
+        ai_status = "healthy"
+    components["third_party_ai"] = {
+        "status": ai_status,
+        "open_breakers": open_breakers,
+        **ai_stats
+    }
+    
     response = HealthResponse(
         status=overall_status,
         timestamp=datetime.now().isoformat(),
@@ -121,6 +151,19 @@ async def ping():
         "uptime": time.time() - START_TIME
     }
 
+@router.get("/metrics", summary="Prometheus监控指标")
+async def metrics():
+    """
+    Prometheus格式的性能指标
+    
+    包括推理批大小、队列等待时间等直方图，用于调优批处理窗口
+    """
+    if not settings.ENABLE_METRICS:
+        raise HTTPException(status_code=404, detail="监控指标未启用")
+    
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
 @router.get("/readiness", summary="就绪状态检查")  
 async def readiness_check():
     """
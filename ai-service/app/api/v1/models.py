@@ -50,13 +50,23 @@ async def get_models_status():
         api_logger.error("获取模型状态失败", error=str(e))
         raise HTTPException(status_code=500, detail=f"获取模型状态失败: {str(e)}")
 
+@router.get("/batching/stats", summary="获取动态批处理统计")
+async def get_batching_stats():
+    """
+    获取各模型动态微批处理的批大小和排队等待统计
+    """
+    return {
+        "success": True,
+        "batching": model_manager.get_batching_stats()
+    }
+
 @router.get("/{model_name}", response_model=ModelInfoResponse, summary="获取指定模型信息")
 async def get_model_info(model_name: str):
     """
     获取指定模型的详细信息
     """
     try:
-        model_info = model_manager.get_model_info(model_name)
+        model_info = await model_manager.describe_model(model_name)
         
         return ModelInfoResponse(
             success=True,
@@ -84,6 +94,41 @@ async def reload_model(model_name: str):
         api_logger.error("重新加载模型失败", model_name=model_name, error=str(e))
         raise HTTPException(status_code=500, detail=f"重新加载模型失败: {str(e)}")
 
+@router.post("/{model_name}/export", summary="导出模型并对比推理后端")
+async def export_model(model_name: str, backends: Optional[str] = None, iterations: int = 20):
+    """
+    导出TorchScript/ONNX产物，校验与eager输出的一致性，并返回各后端的推理延迟
+    
+    - **backends**: 要导出的后端，逗号分隔（默认全部：eager,torchscript,onnx）
+    - **iterations**: 每个批大小的测量次数
+    """
+    try:
+        backend_list = [b.strip() for b in backends.split(",") if b.strip()] if backends else None
+        report = await model_manager.export_model(model_name, backend_list, iterations=iterations)
+        return {"success": True, "report": report}
+        
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        api_logger.error("导出模型失败", model_name=model_name, error=str(e))
+        raise HTTPException(status_code=500, detail=f"导出模型失败: {str(e)}")
+
+@router.post("/{model_name}/optimize", summary="重新执行模型CPU优化")
+async def optimize_model(model_name: str):
+    """
+    按 MODEL_OPTIMIZATIONS 重新量化/优化指定模型（忽略磁盘缓存），
+    返回相对fp32的精度差异和吞吐提升
+    """
+    try:
+        report = await model_manager.optimize_model(model_name)
+        return {"success": True, "report": report}
+        
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        api_logger.error("模型优化失败", model_name=model_name, error=str(e))
+        raise HTTPException(status_code=500, detail=f"模型优化失败: {str(e)}")
+
 @router.delete("/{model_name}", summary="卸载模型")
 async def unload_model(model_name: str):
     """
@@ -3,15 +3,20 @@
 基于AI分析结果生成专业的医疗报告
 """
 
+import uuid
 from typing import Dict, Any, Optional
 from datetime import datetime
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
 from app.core.logger import api_logger
+from app.core.redis import redis_manager, CacheKeys
 
 router = APIRouter()
 
+# 生成的报告缓存时间（秒）
+REPORT_CACHE_TTL = 24 * 3600
+
 class ReportRequest(BaseModel):
     """报告生成请求"""
     analysis_id: str
@@ -28,46 +33,59 @@ class ReportResponse(BaseModel):
     download_url: Optional[str] = None
     generated_at: str
 
+def _build_report(report_id: str, request: ReportRequest) -> Dict[str, Any]:
+    """生成报告内容"""
+    # 这里应该实现实际的报告生成逻辑
+    # 目前返回模拟数据
+    return {
+        "report_id": report_id,
+        "analysis_id": request.analysis_id,
+        "patient_info": {
+            "age": "6岁",
+            "gender": "男"
+        },
+        "analysis_summary": {
+            "analysis_type": "口内照片分析",
+            "confidence": 0.92,
+            "main_findings": [
+                "未发现明显蛀牙",
+                "牙龈健康状况良好",
+                "建议继续保持口腔卫生"
+            ]
+        },
+        "detailed_findings": {
+            "dental_health": "整体口腔健康状况良好",
+            "recommendations": [
+                "继续保持良好的刷牙习惯",
+                "建议使用含氟牙膏",
+                "每半年进行一次口腔检查"
+            ]
+        },
+        "generated_at": datetime.now().isoformat(),
+        "template_version": "1.0"
+    }
+
 @router.post("/generate", response_model=ReportResponse, summary="生成分析报告")
 async def generate_report(request: ReportRequest):
     """
     基于分析结果生成专业的医疗报告
     """
     try:
-        # 这里应该实现实际的报告生成逻辑
-        # 目前返回模拟数据
+        # 同一分析、模板、语言和格式的报告内容相同，报告ID由此确定并缓存报告内容；
+        # 热点报告过期时只有一个请求重新生成，其余请求继续使用旧报告
+        report_id = str(uuid.uuid5(
+            uuid.NAMESPACE_URL,
+            f"{request.analysis_id}:{request.template_id}:{request.language}:{request.format}"
+        ))
         
-        import uuid
-        report_id = str(uuid.uuid4())
+        async def build() -> Dict[str, Any]:
+            return _build_report(report_id, request)
         
-        # 模拟报告内容
-        mock_report = {
-            "report_id": report_id,
-            "analysis_id": request.analysis_id,
-            "patient_info": {
-                "age": "6岁",
-                "gender": "男"
-            },
-            "analysis_summary": {
-                "analysis_type": "口内照片分析",
-                "confidence": 0.92,
-                "main_findings": [
-                    "未发现明显蛀牙",
-                    "牙龈健康状况良好",
-                    "建议继续保持口腔卫生"
-                ]
-            },
-            "detailed_findings": {
-                "dental_health": "整体口腔健康状况良好",
-                "recommendations": [
-                    "继续保持良好的刷牙习惯",
-                    "建议使用含氟牙膏",
-                    "每半年进行一次口腔检查"
-                ]
-            },
-            "generated_at": datetime.now().isoformat(),
-            "template_version": "1.0"
-        }
+        report = await redis_manager.get_or_compute(
+            CacheKeys.format_key(CacheKeys.REPORT_GENERATED, report_id=report_id),
+            build,
+            ttl=REPORT_CACHE_TTL
+        )
         
         api_logger.info(f"生成报告", 
                        analysis_id=request.analysis_id, 
@@ -78,8 +96,8 @@ async def generate_report(request: ReportRequest):
             success=True,
             report_id=report_id,
             format=request.format,
-            content=mock_report,
-            generated_at=datetime.now().isoformat()
+            content=report,
+            generated_at=report["generated_at"]
         )
         
     except Exception as e:
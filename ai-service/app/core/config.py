@@ -4,7 +4,7 @@
 """
 
 import os
-from typing import Optional, List
+from typing import Dict, Optional, List
 from pydantic import Field, field_validator
 from pydantic_settings import BaseSettings
 from pathlib import Path
@@ -46,6 +46,25 @@ class Settings(BaseSettings):
     # Redis配置
     REDIS_URL: str = Field(default="redis://localhost:6379/0", env="REDIS_URL")
     REDIS_CACHE_TTL: int = Field(default=3600, env="REDIS_CACHE_TTL")  # 1小时
+    REDIS_COMPRESSION: str = Field(default="zstd", env="REDIS_COMPRESSION")  # 缓存值压缩算法：zstd / lz4 / none，未安装时依次降级
+    REDIS_COMPRESSION_THRESHOLD: int = Field(default=4096, env="REDIS_COMPRESSION_THRESHOLD")  # 序列化后超过该大小（字节）才压缩
+    REDIS_COMPRESSION_LEVEL: int = Field(default=3, env="REDIS_COMPRESSION_LEVEL")  # zstd压缩级别
+    CACHE_STALE_TTL: int = Field(default=300, env="CACHE_STALE_TTL")  # 过期后仍可返回旧值的时间（秒），期间后台刷新
+    CACHE_XFETCH_BETA: float = Field(default=1.0, env="CACHE_XFETCH_BETA")  # 提前刷新系数，越大越早刷新，0为不提前
+    CACHE_COMPUTE_LOCK_TTL: int = Field(default=60, env="CACHE_COMPUTE_LOCK_TTL")  # 缓存计算锁有效期（秒），同时是等待计算结果的上限
+    REDIS_SCAN_COUNT: int = Field(default=500, env="REDIS_SCAN_COUNT")  # 按模式删除时每次SCAN的COUNT
+    REDIS_DELETE_CHUNK: int = Field(default=500, env="REDIS_DELETE_CHUNK")  # 每次UNLINK的最大键数
+    REDIS_DELETE_PAUSE_MS: int = Field(default=0, env="REDIS_DELETE_PAUSE_MS")  # 每批删除后的暂停时间（毫秒），限制清理对Redis的压力
+    
+    # 进程内近端缓存配置（热点键在本进程缓存，经Redis发布订阅跨worker失效）
+    NEAR_CACHE_ENABLED: bool = Field(default=True, env="NEAR_CACHE_ENABLED")
+    NEAR_CACHE_MAX_ENTRIES: int = Field(default=1024, env="NEAR_CACHE_MAX_ENTRIES")  # 最大缓存键数
+    NEAR_CACHE_MAX_BYTES: int = Field(default=64 * 1024 * 1024, env="NEAR_CACHE_MAX_BYTES")  # 缓存值总大小上限（字节）
+    NEAR_CACHE_TTL: int = Field(default=30, env="NEAR_CACHE_TTL")  # 本地最长保留时间（秒），失效消息丢失时的过期兜底
+    NEAR_CACHE_PREFIXES: str = Field(
+        default="model:info:,report:template:,analysis:result:",
+        env="NEAR_CACHE_PREFIXES"
+    )  # 允许近端缓存的键前缀，逗号分隔
     
     # API配置
     API_V1_PREFIX: str = Field(default="/api/v1", env="API_V1_PREFIX")
@@ -61,6 +80,7 @@ class Settings(BaseSettings):
     # 文件上传配置
     UPLOAD_DIR: str = Field(default=str(BASE_DIR / "uploads"), env="UPLOAD_DIR")
     MAX_FILE_SIZE: int = Field(default=50 * 1024 * 1024, env="MAX_FILE_SIZE")  # 50MB
+    UPLOAD_CHUNK_SIZE: int = Field(default=1024 * 1024, env="UPLOAD_CHUNK_SIZE")  # 上传文件分块写盘的块大小（字节）
     ALLOWED_IMAGE_EXTENSIONS: str = Field(
         default=".jpg,.jpeg,.png,.tiff,.dcm",
         env="ALLOWED_IMAGE_EXTENSIONS"
@@ -69,7 +89,11 @@ class Settings(BaseSettings):
     # AI模型配置
     MODELS_DIR: str = Field(default=str(BASE_DIR / "models"), env="MODELS_DIR")
     DEVICE: str = Field(default="cpu", env="DEVICE")  # cpu, cuda, mps
-    MODEL_CACHE_SIZE: int = Field(default=3, env="MODEL_CACHE_SIZE")
+    MODEL_CACHE_SIZE: int = Field(default=3, env="MODEL_CACHE_SIZE")  # 同时驻留内存的最大模型数
+    MODEL_IDLE_TIMEOUT: int = Field(default=3600, env="MODEL_IDLE_TIMEOUT")  # 空闲超过该时间（秒）的模型会被卸载
+    MODEL_CLEANUP_INTERVAL: int = Field(default=300, env="MODEL_CLEANUP_INTERVAL")  # 空闲模型清理周期（秒）
+    MODEL_WEIGHTS_MMAP: bool = Field(default=True, env="MODEL_WEIGHTS_MMAP")  # 以内存映射方式加载权重，多个worker共享页缓存（仅CPU）
+    PRELOAD_MODELS: bool = Field(default=False, env="PRELOAD_MODELS")  # 在gunicorn主进程fork前预加载模型权重（仅CPU，且需 ANALYSIS_INPROCESS_WORKER）
     
     # 模型版本配置
     INTRAORAL_MODEL_VERSION: str = Field(default="v1.0", env="INTRAORAL_MODEL_VERSION")
@@ -78,11 +102,71 @@ class Settings(BaseSettings):
     PANORAMIC_MODEL_VERSION: str = Field(default="v1.0", env="PANORAMIC_MODEL_VERSION")
     THREED_MODEL_VERSION: str = Field(default="v1.0", env="THREED_MODEL_VERSION")
     
+    # 推理执行器配置
+    INFERENCE_EXECUTOR: str = Field(default="thread", env="INFERENCE_EXECUTOR")  # thread, process, inline
+    INFERENCE_WORKERS: int = Field(default=1, env="INFERENCE_WORKERS")
+    INFERENCE_THREADS_PER_WORKER: int = Field(default=0, env="INFERENCE_THREADS_PER_WORKER")  # 0表示按CPU核心数平均分配
+    
+    @field_validator("INFERENCE_EXECUTOR")
+    @classmethod
+    def validate_inference_executor(cls, v):
+        if v not in ["thread", "process", "inline"]:
+            raise ValueError("INFERENCE_EXECUTOR must be one of: thread, process, inline")
+        return v
+    
+    # 推理后端配置
+    INFERENCE_BACKEND: str = Field(default="eager", env="INFERENCE_BACKEND")  # eager, torchscript, onnx
+    MODEL_BACKENDS: str = Field(default="", env="MODEL_BACKENDS")  # 按模型覆盖，如 "intraoral=onnx,facial=torchscript"
+    AUTO_EXPORT_BACKENDS: bool = Field(default=True, env="AUTO_EXPORT_BACKENDS")  # 导出产物缺失或校验失败时自动重新导出
+    BACKEND_PARITY_ATOL: float = Field(default=1e-4, env="BACKEND_PARITY_ATOL")
+    BACKEND_PARITY_RTOL: float = Field(default=1e-3, env="BACKEND_PARITY_RTOL")
+    
+    # CPU推理优化配置（按模型启用，启用量化时使用量化后的TorchScript模块，忽略 MODEL_BACKENDS）
+    MODEL_OPTIMIZATIONS: str = Field(default="", env="MODEL_OPTIMIZATIONS")  # 如 "intraoral=static_int8+channels_last+inference_mode"
+    CALIBRATION_DATA_DIR: str = Field(default=str(BASE_DIR / "calibration"), env="CALIBRATION_DATA_DIR")  # 静态量化校准图像目录
+    CALIBRATION_MAX_IMAGES: int = Field(default=64, env="CALIBRATION_MAX_IMAGES")
+    QUANTIZATION_MIN_AGREEMENT: float = Field(default=0.98, env="QUANTIZATION_MIN_AGREEMENT")  # 量化后top-1一致率低于该值时告警
+    
+    @field_validator("INFERENCE_BACKEND")
+    @classmethod
+    def validate_inference_backend(cls, v):
+        if v not in ["eager", "torchscript", "onnx"]:
+            raise ValueError("INFERENCE_BACKEND must be one of: eager, torchscript, onnx")
+        return v
+    
     # 分析配置
-    BATCH_SIZE: int = Field(default=1, env="BATCH_SIZE")
+    BATCH_SIZE: int = Field(default=8, env="BATCH_SIZE")  # 动态微批处理最大批大小，1表示关闭批处理
+    BATCH_MAX_WAIT_MS: float = Field(default=5.0, env="BATCH_MAX_WAIT_MS")  # 凑批最长等待时间（毫秒）
     MAX_CONCURRENT_ANALYSES: int = Field(default=5, env="MAX_CONCURRENT_ANALYSES")
     ANALYSIS_TIMEOUT: int = Field(default=300, env="ANALYSIS_TIMEOUT")  # 5分钟
     
+    # 分析任务队列配置（Redis Streams，API节点只入队，由 worker.py 消费）
+    ANALYSIS_QUEUE_GROUP: str = Field(default="analysis-workers", env="ANALYSIS_QUEUE_GROUP")
+    ANALYSIS_QUEUE_BLOCK_MS: int = Field(default=5000, env="ANALYSIS_QUEUE_BLOCK_MS")  # 读取队列的阻塞等待时间
+    ANALYSIS_RECLAIM_INTERVAL: int = Field(default=30, env="ANALYSIS_RECLAIM_INTERVAL")  # 检查超时未确认任务的周期（秒）
+    ANALYSIS_RECLAIM_GRACE: int = Field(default=30, env="ANALYSIS_RECLAIM_GRACE")  # 超过 ANALYSIS_TIMEOUT 该秒数仍未确认的任务被其他worker接管
+    ANALYSIS_PAYLOAD_DIR: str = Field(default=str(BASE_DIR / "uploads" / "queue"), env="ANALYSIS_PAYLOAD_DIR")  # 待分析上传内容的存放目录，API节点与worker须共享（共享卷）
+    ANALYSIS_JOB_TTL: int = Field(default=24 * 3600, env="ANALYSIS_JOB_TTL")  # 待处理上传内容的保留时间（秒），超时由worker清理
+    ANALYSIS_INPROCESS_WORKER: bool = Field(default=False, env="ANALYSIS_INPROCESS_WORKER")  # 在API进程内运行队列worker（开发环境）
+    LOAD_MODELS_ON_STARTUP: bool = Field(default=False, env="LOAD_MODELS_ON_STARTUP")  # API节点只入队，默认不加载模型
+    
+    # 分析进度推送配置（SSE / WebSocket）
+    PROGRESS_STREAM_HEARTBEAT: int = Field(default=15, env="PROGRESS_STREAM_HEARTBEAT")  # 心跳间隔（秒），防止代理断开空闲连接
+    PROGRESS_STREAM_MAX_IDS: int = Field(default=100, env="PROGRESS_STREAM_MAX_IDS")  # 单个连接最多跟踪的分析任务数
+    PROGRESS_COALESCE_MS: int = Field(default=200, env="PROGRESS_COALESCE_MS")  # 该时间内的连续中间进度合并为一次写入（毫秒）
+    
+    # 流式批量导入配置
+    BATCH_SPOOL_DIR: str = Field(default=str(BASE_DIR / "uploads" / "spool"), env="BATCH_SPOOL_DIR")  # 上传文件落盘暂存目录
+    STREAM_BATCH_MAX_FILES: int = Field(default=2000, env="STREAM_BATCH_MAX_FILES")  # 单次导入的最大文件数
+    STREAM_BATCH_MAX_ARCHIVE_SIZE: int = Field(default=2 * 1024 * 1024 * 1024, env="STREAM_BATCH_MAX_ARCHIVE_SIZE")  # tar/zip归档的最大大小（字节），2GB
+    STREAM_BATCH_MAX_INFLIGHT: int = Field(default=32, env="STREAM_BATCH_MAX_INFLIGHT")  # 已入队未完成的最大分析数，限制暂存的上传内容
+    STREAM_BATCH_SESSION_TTL: int = Field(default=600, env="STREAM_BATCH_SESSION_TTL")  # 预先创建的导入会话等待上传的时间（秒）
+    
+    # 推理结果缓存配置（按图像内容摘要缓存）
+    ENABLE_INFERENCE_CACHE: bool = Field(default=True, env="ENABLE_INFERENCE_CACHE")
+    INFERENCE_CACHE_LOCAL_SIZE: int = Field(default=256, env="INFERENCE_CACHE_LOCAL_SIZE")  # 进程内LRU条目数
+    INFERENCE_CACHE_TTL: int = Field(default=24 * 3600, env="INFERENCE_CACHE_TTL")  # Redis缓存时间（秒）
+    
     # 图像预处理配置
     IMAGE_SIZE: int = Field(default=512, env="IMAGE_SIZE")
     NORMALIZE_MEAN: str = Field(default="0.485,0.456,0.406", env="NORMALIZE_MEAN")
@@ -118,6 +202,50 @@ class Settings(BaseSettings):
     BACKEND_API_URL: str = Field(default="http://localhost:3001", env="BACKEND_API_URL")
     BACKEND_API_KEY: Optional[str] = Field(default=None, env="BACKEND_API_KEY")
     
+    # 第三方AI服务配置 (罗慕科技)
+    THIRD_PARTY_AI_BASE_URL: str = Field(
+        default="https://openapi-lab.ilmsmile.com.cn/api/v1",
+        env="THIRD_PARTY_AI_BASE_URL"
+    )
+    THIRD_PARTY_AI_KEY: str = Field(default="", env="THIRD_PARTY_AI_KEY")
+    THIRD_PARTY_AI_SECRET: str = Field(default="", env="THIRD_PARTY_AI_SECRET")
+    THIRD_PARTY_AI_TIMEOUT: int = Field(default=300, env="THIRD_PARTY_AI_TIMEOUT")  # 5分钟
+    THIRD_PARTY_AI_CONNECT_TIMEOUT: float = Field(default=10.0, env="THIRD_PARTY_AI_CONNECT_TIMEOUT")  # 建立连接超时（秒）
+    THIRD_PARTY_AI_MAX_CONNECTIONS: int = Field(default=20, env="THIRD_PARTY_AI_MAX_CONNECTIONS")  # 每个worker到第三方服务的最大连接数
+    THIRD_PARTY_AI_MAX_KEEPALIVE: int = Field(default=10, env="THIRD_PARTY_AI_MAX_KEEPALIVE")  # 保持的最大空闲连接数
+    THIRD_PARTY_AI_KEEPALIVE_EXPIRY: float = Field(default=30.0, env="THIRD_PARTY_AI_KEEPALIVE_EXPIRY")  # 空闲连接保留时间（秒）
+    THIRD_PARTY_AI_HTTP2: bool = Field(default=False, env="THIRD_PARTY_AI_HTTP2")  # HTTP/2多路复用，需安装h2
+    THIRD_PARTY_AI_TOKEN_TTL: int = Field(default=3600, env="THIRD_PARTY_AI_TOKEN_TTL")  # 认证接口未返回expires_in时的令牌有效期（秒）
+    THIRD_PARTY_AI_TOKEN_REFRESH_MARGIN: int = Field(default=300, env="THIRD_PARTY_AI_TOKEN_REFRESH_MARGIN")  # 到期前多少秒主动刷新
+    THIRD_PARTY_AI_TOKEN_LOCK_TTL: int = Field(default=30, env="THIRD_PARTY_AI_TOKEN_LOCK_TTL")  # 跨worker刷新锁有效期（秒）
+    
+    # 第三方AI服务限流（每个worker、每个接口独立计算）
+    THIRD_PARTY_AI_RATE_LIMIT: float = Field(default=5.0, env="THIRD_PARTY_AI_RATE_LIMIT")  # 每秒请求数，0表示不限速
+    THIRD_PARTY_AI_RATE_BURST: int = Field(default=10, env="THIRD_PARTY_AI_RATE_BURST")  # 令牌桶容量
+    THIRD_PARTY_AI_ENDPOINT_RATE_LIMITS: str = Field(default="", env="THIRD_PARTY_AI_ENDPOINT_RATE_LIMITS")  # 按接口覆盖，如 "3d/features/teeth=0.5,oral/classification=2"
+    THIRD_PARTY_AI_INITIAL_CONCURRENCY: int = Field(default=4, env="THIRD_PARTY_AI_INITIAL_CONCURRENCY")
+    THIRD_PARTY_AI_MIN_CONCURRENCY: int = Field(default=1, env="THIRD_PARTY_AI_MIN_CONCURRENCY")
+    THIRD_PARTY_AI_MAX_CONCURRENCY: int = Field(default=20, env="THIRD_PARTY_AI_MAX_CONCURRENCY")
+    THIRD_PARTY_AI_LATENCY_TOLERANCE: float = Field(default=2.0, env="THIRD_PARTY_AI_LATENCY_TOLERANCE")  # 延迟超过基线该倍数时收缩并发
+    
+    # 第三方AI服务重试和熔断（重试次数上限为 MAX_ANALYSIS_RETRIES）
+    THIRD_PARTY_AI_RETRY_BASE_DELAY: float = Field(default=0.5, env="THIRD_PARTY_AI_RETRY_BASE_DELAY")  # 指数退避基数（秒）
+    THIRD_PARTY_AI_RETRY_MAX_DELAY: float = Field(default=20.0, env="THIRD_PARTY_AI_RETRY_MAX_DELAY")  # 单次退避上限（秒）
+    THIRD_PARTY_AI_RETRY_BUDGET_RATIO: float = Field(default=0.2, env="THIRD_PARTY_AI_RETRY_BUDGET_RATIO")  # 重试数占请求数的最大比例
+    THIRD_PARTY_AI_RETRY_MIN_PER_SECOND: float = Field(default=0.5, env="THIRD_PARTY_AI_RETRY_MIN_PER_SECOND")  # 低流量时的保底重试速率
+    THIRD_PARTY_AI_BREAKER_FAILURE_RATE: float = Field(default=0.5, env="THIRD_PARTY_AI_BREAKER_FAILURE_RATE")  # 最近请求失败率达到该值时熔断
+    THIRD_PARTY_AI_BREAKER_WINDOW: int = Field(default=50, env="THIRD_PARTY_AI_BREAKER_WINDOW")  # 统计失败率的最近请求数
+    THIRD_PARTY_AI_BREAKER_MIN_CALLS: int = Field(default=20, env="THIRD_PARTY_AI_BREAKER_MIN_CALLS")  # 样本少于该数时不熔断
+    THIRD_PARTY_AI_BREAKER_RESET: float = Field(default=30.0, env="THIRD_PARTY_AI_BREAKER_RESET")  # 熔断持续时间（秒），之后放行探测请求
+    
+    # 第三方AI服务响应缓存（按文件摘要、接口、参数和接口版本缓存分析结果）
+    THIRD_PARTY_AI_API_VERSION: str = Field(default="v1", env="THIRD_PARTY_AI_API_VERSION")  # 第三方接口版本，升级后旧缓存失效
+    THIRD_PARTY_CACHE_ENABLED: bool = Field(default=True, env="THIRD_PARTY_CACHE_ENABLED")
+    THIRD_PARTY_CACHE_TTL: int = Field(default=7 * 24 * 3600, env="THIRD_PARTY_CACHE_TTL")  # Redis缓存时间（秒）
+    THIRD_PARTY_CACHE_DIR: str = Field(default="", env="THIRD_PARTY_CACHE_DIR")  # 本地磁盘缓存目录，为空时不启用
+    THIRD_PARTY_CACHE_DISK_TTL: int = Field(default=30 * 24 * 3600, env="THIRD_PARTY_CACHE_DISK_TTL")  # 磁盘缓存保留时间（秒）
+    THIRD_PARTY_CACHE_DISK_MAX_BYTES: int = Field(default=1024 * 1024 * 1024, env="THIRD_PARTY_CACHE_DISK_MAX_BYTES")  # 磁盘缓存总大小上限，超出时删除最久未用的条目
+    
     # MinIO配置（文件存储）
     MINIO_ENDPOINT: Optional[str] = Field(default=None, env="MINIO_ENDPOINT")
     MINIO_ACCESS_KEY: Optional[str] = Field(default=None, env="MINIO_ACCESS_KEY")
@@ -125,7 +253,7 @@ class Settings(BaseSettings):
     MINIO_BUCKET: str = Field(default="ai-analysis", env="MINIO_BUCKET")
     
     # 性能配置
-    MAX_MEMORY_USAGE: int = Field(default=4096, env="MAX_MEMORY_USAGE")  # MB
+    MAX_MEMORY_USAGE: int = Field(default=4096, env="MAX_MEMORY_USAGE")  # MB，模型缓存内存预算
     ENABLE_GPU_MONITORING: bool = Field(default=False, env="ENABLE_GPU_MONITORING")
     
     # 安全配置
@@ -136,6 +264,7 @@ class Settings(BaseSettings):
     # 开发配置
     RELOAD_MODELS: bool = Field(default=False, env="RELOAD_MODELS")
     MOCK_AI_RESULTS: bool = Field(default=False, env="MOCK_AI_RESULTS")
+    MOCK_THIRD_PARTY_API: bool = Field(default=False, env="MOCK_THIRD_PARTY_API")
     
     class Config:
         env_file = ".env"
@@ -151,6 +280,8 @@ class Settings(BaseSettings):
         """确保必要的目录存在"""
         directories = [
             self.UPLOAD_DIR,
+            self.BATCH_SPOOL_DIR,
+            self.ANALYSIS_PAYLOAD_DIR,
             self.MODELS_DIR,
             self.REPORT_TEMPLATES_DIR,
             self.REPORT_OUTPUT_DIR
@@ -202,6 +333,39 @@ class Settings(BaseSettings):
             "3d": self.THREED_MODEL_VERSION
         }
     
+    @property
+    def model_backends(self) -> dict:
+        """各模型的推理后端（未单独配置的模型使用 INFERENCE_BACKEND）"""
+        backends = {}
+        for item in self.MODEL_BACKENDS.split(","):
+            if "=" in item:
+                model_name, backend = item.split("=", 1)
+                backends[model_name.strip()] = backend.strip()
+        return backends
+    
+    def backend_for(self, model_name: str) -> str:
+        """获取指定模型的推理后端"""
+        return self.model_backends.get(model_name, self.INFERENCE_BACKEND)
+    
+    @property
+    def third_party_rate_limits(self) -> Dict[str, float]:
+        """各第三方接口的速率限制（未单独配置的接口使用 THIRD_PARTY_AI_RATE_LIMIT）"""
+        limits = {}
+        for item in self.THIRD_PARTY_AI_ENDPOINT_RATE_LIMITS.split(","):
+            if "=" in item:
+                endpoint, rate = item.split("=", 1)
+                limits[endpoint.strip().strip("/")] = float(rate)
+        return limits
+    
+    def optimization_for(self, model_name: str) -> str:
+        """获取指定模型的优化配置（未配置时为空字符串）"""
+        for item in self.MODEL_OPTIMIZATIONS.split(","):
+            if "=" in item:
+                name, profile = item.split("=", 1)
+                if name.strip() == model_name:
+                    return profile.strip()
+        return ""
+    
     @property
     def cors_origins_list(self) -> List[str]:
         """CORS源列表"""
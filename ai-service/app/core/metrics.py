@@ -0,0 +1,212 @@
+"""
+监控指标模块
+基于prometheus_client定义服务内部性能指标，通过 /health/metrics 暴露
+"""
+
+import os
+import sys
+from typing import Dict, Tuple
+
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    CONTENT_TYPE_LATEST,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+
+
+# ========== 模型推理指标 ==========
+
+INFERENCE_BATCH_SIZE = Histogram(
+    "ai_inference_batch_size",
+    "动态微批处理实际批大小",
+    ["model_name"],
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+
+INFERENCE_QUEUE_WAIT = Histogram(
+    "ai_inference_queue_wait_seconds",
+    "推理请求在批处理队列中的等待时间",
+    ["model_name"],
+    buckets=(0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+INFERENCE_BATCH_LATENCY = Histogram(
+    "ai_inference_batch_seconds",
+    "单个批次（预处理+前向+后处理）耗时",
+    ["model_name"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+
+INFERENCE_QUEUE_DEPTH = Gauge(
+    "ai_inference_queue_depth",
+    "批处理队列中等待的请求数",
+    ["model_name"],
+    multiprocess_mode="livesum",
+)
+
+INFERENCE_REQUESTS = Counter(
+    "ai_inference_requests_total",
+    "推理请求总数",
+    ["model_name", "status"],
+)
+
+
+# ========== 缓存指标 ==========
+
+NEAR_CACHE_REQUESTS = Counter(
+    "ai_near_cache_requests_total",
+    "进程内近端缓存查询次数",
+    ["result"],
+)
+
+NEAR_CACHE_EVICTIONS = Counter(
+    "ai_near_cache_evictions_total",
+    "进程内近端缓存移除的条目数",
+    ["reason"],
+)
+
+
+# ========== 第三方AI服务指标 ==========
+
+THIRD_PARTY_REQUESTS = Counter(
+    "ai_third_party_requests_total",
+    "第三方AI服务请求次数",
+    ["endpoint", "status"],
+)
+
+THIRD_PARTY_LATENCY = Histogram(
+    "ai_third_party_request_seconds",
+    "第三方AI服务请求耗时（含上传）",
+    ["endpoint"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0),
+)
+
+THIRD_PARTY_CONNECTIONS = Counter(
+    "ai_third_party_connections_total",
+    "第三方AI服务请求使用的连接：new为新建连接，reused为复用连接池中的连接",
+    ["result", "http_version"],
+)
+
+THIRD_PARTY_QUEUE_WAIT = Histogram(
+    "ai_third_party_queue_wait_seconds",
+    "第三方AI服务请求在限流器中的排队时间（并发槽位+速率令牌）",
+    ["endpoint"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+
+THIRD_PARTY_CONCURRENCY_LIMIT = Gauge(
+    "ai_third_party_concurrency_limit",
+    "第三方AI服务接口当前的自适应并发上限",
+    ["endpoint"],
+    multiprocess_mode="livesum",
+)
+
+THIRD_PARTY_INFLIGHT = Gauge(
+    "ai_third_party_inflight",
+    "第三方AI服务接口在途请求数",
+    ["endpoint"],
+    multiprocess_mode="livesum",
+)
+
+THIRD_PARTY_OVERLOAD = Counter(
+    "ai_third_party_overload_total",
+    "第三方AI服务过载信号次数（429/503/超时）",
+    ["endpoint", "reason"],
+)
+
+THIRD_PARTY_RETRIES = Counter(
+    "ai_third_party_retries_total",
+    "第三方AI服务请求重试次数",
+    ["endpoint", "reason"],
+)
+
+THIRD_PARTY_REJECTED = Counter(
+    "ai_third_party_rejected_total",
+    "未发送或未重试的第三方AI服务请求：circuit_open为熔断，retry_budget为重试预算耗尽",
+    ["endpoint", "reason"],
+)
+
+THIRD_PARTY_BREAKER_STATE = Gauge(
+    "ai_third_party_breaker_state",
+    "第三方AI服务接口熔断器状态：0关闭，1半开，2打开",
+    ["endpoint"],
+    multiprocess_mode="max",
+)
+
+THIRD_PARTY_CACHE_REQUESTS = Counter(
+    "ai_third_party_cache_requests_total",
+    "第三方AI服务响应缓存查询次数：disk/redis为对应层命中，miss为调用第三方服务",
+    ["endpoint", "result"],
+)
+
+
+def process_memory() -> Dict[str, float]:
+    """
+    当前进程内存占用（MB）
+    rss包含与其他进程共享的页面；pss按共享进程数均摊，更能反映多worker部署的实际占用
+    """
+    memory: Dict[str, float] = {}
+    try:
+        # Linux: smaps_rollup 提供汇总的 Rss/Pss/Shared/Private
+        with open("/proc/self/smaps_rollup", "r") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0] in _SMAPS_FIELDS:
+                    memory[_SMAPS_FIELDS[parts[0]]] = round(int(parts[1]) / 1024, 2)
+    except OSError:
+        import resource
+        # 其他平台只能取得峰值RSS（macOS单位为字节，Linux为KB）
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        memory["max_rss_mb"] = round(max_rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 2)
+    return memory
+
+
+_SMAPS_FIELDS = {
+    "Rss:": "rss_mb",
+    "Pss:": "pss_mb",
+    "Shared_Clean:": "shared_clean_mb",
+    "Private_Clean:": "private_clean_mb",
+    "Private_Dirty:": "private_dirty_mb",
+}
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """
+    生成Prometheus文本格式的指标数据
+    gunicorn多进程部署时设置 PROMETHEUS_MULTIPROC_DIR 以聚合所有worker的指标
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+# 导出
+__all__ = [
+    "INFERENCE_BATCH_SIZE",
+    "INFERENCE_QUEUE_WAIT",
+    "INFERENCE_BATCH_LATENCY",
+    "INFERENCE_QUEUE_DEPTH",
+    "INFERENCE_REQUESTS",
+    "NEAR_CACHE_REQUESTS",
+    "NEAR_CACHE_EVICTIONS",
+    "THIRD_PARTY_REQUESTS",
+    "THIRD_PARTY_LATENCY",
+    "THIRD_PARTY_CONNECTIONS",
+    "THIRD_PARTY_QUEUE_WAIT",
+    "THIRD_PARTY_CONCURRENCY_LIMIT",
+    "THIRD_PARTY_INFLIGHT",
+    "THIRD_PARTY_OVERLOAD",
+    "THIRD_PARTY_RETRIES",
+    "THIRD_PARTY_REJECTED",
+    "THIRD_PARTY_BREAKER_STATE",
+    "THIRD_PARTY_CACHE_REQUESTS",
+    "process_memory",
+    "render_metrics",
+]
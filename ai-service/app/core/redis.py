@@ -4,14 +4,23 @@ Redis连接和缓存管理模块
 """
 
 import json
-import pickle
-from typing import Any, Optional, Union, Dict, List
+import time
+import uuid
+import asyncio
+import math
+import random
+import fnmatch
+import inspect
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional, Tuple, Union, Dict, List
 from redis.asyncio import Redis, ConnectionPool
 from redis.asyncio.connection import Connection
-from redis.exceptions import RedisError, ConnectionError, TimeoutError
+from redis.exceptions import RedisError, ConnectionError, TimeoutError, ResponseError
 
 from app.core.config import settings
 from app.core.logger import cache_logger
+from app.core.metrics import NEAR_CACHE_REQUESTS, NEAR_CACHE_EVICTIONS
+from app.core.serialization import dumps, dumps_field, loads
 
 # 全局Redis实例
 redis_client: Optional[Redis] = None
@@ -44,6 +53,9 @@ async def init_redis():
         # 测试连接
         await redis_client.ping()
         
+        # 订阅近端缓存失效通知
+        await redis_manager.near_cache.start()
+        
         cache_logger.success(
             "Redis连接初始化成功",
             redis_url=settings.REDIS_URL.split('@')[-1] if '@' in settings.REDIS_URL else settings.REDIS_URL
@@ -62,6 +74,8 @@ async def close_redis():
     """关闭Redis连接"""
     global redis_client, redis_pool
     
+    await redis_manager.near_cache.stop()
+    
     if redis_client:
         try:
             await redis_client.close()
@@ -83,12 +97,205 @@ def get_redis() -> Redis:
     return redis_client
 
 
+class NearCache:
+    """
+    进程内近端缓存
+    - 只缓存 NEAR_CACHE_PREFIXES 前缀的热点键，按LRU淘汰，受条目数和总字节数限制
+    - 保存Redis中的原始字节，命中时反序列化，调用方修改返回值不影响缓存
+    - 写入/删除时通过 NEAR_CACHE_INVALIDATION 频道通知其他worker移除本地副本；
+      订阅未建立或断开期间不提供本地命中，NEAR_CACHE_TTL 作为失效消息丢失时的兜底
+    """
+    
+    def __init__(self):
+        self.enabled = settings.NEAR_CACHE_ENABLED and settings.NEAR_CACHE_MAX_ENTRIES > 0
+        self.max_entries = settings.NEAR_CACHE_MAX_ENTRIES
+        self.max_bytes = settings.NEAR_CACHE_MAX_BYTES
+        self.ttl = settings.NEAR_CACHE_TTL
+        self.prefixes = tuple(p.strip() for p in settings.NEAR_CACHE_PREFIXES.split(",") if p.strip())
+        self.channel = CacheKeys.NEAR_CACHE_INVALIDATION
+        self.origin = uuid.uuid4().hex
+        
+        # key -> (过期时间, 原始字节)
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._bytes = 0
+        # 每次失效递增；读取Redis期间发生过失效时不写入本地，避免缓存旧值
+        self._epoch = 0
+        self._coherent = False
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+        
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+    
+    def cacheable(self, key: str) -> bool:
+        return self.enabled and key.startswith(self.prefixes)
+    
+    @property
+    def epoch(self) -> int:
+        """读取Redis前记录，写入本地时校验"""
+        return self._epoch
+    
+    def get(self, key: str) -> Optional[bytes]:
+        """本地命中时返回原始字节"""
+        entry = self._entries.get(key) if self._coherent else None
+        if entry is not None and entry[0] <= time.monotonic():
+            self._discard(key)
+            self.expirations += 1
+            NEAR_CACHE_EVICTIONS.labels(reason="expired").inc()
+            entry = None
+        if entry is None:
+            self.misses += 1
+            NEAR_CACHE_REQUESTS.labels(result="miss").inc()
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        NEAR_CACHE_REQUESTS.labels(result="hit").inc()
+        return entry[1]
+    
+    def put(self, key: str, raw: bytes, epoch: int, ttl: Optional[int] = None):
+        """写入本地副本；epoch 之后发生过失效或单个值过大时跳过"""
+        if not self._coherent or epoch != self._epoch or len(raw) > self.max_bytes // 8:
+            return
+        self._discard(key)
+        expires_at = time.monotonic() + min(ttl or self.ttl, self.ttl)
+        self._entries[key] = (expires_at, raw)
+        self._bytes += len(raw)
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            evicted, (_, evicted_raw) = self._entries.popitem(last=False)
+            self._bytes -= len(evicted_raw)
+            self.evictions += 1
+            NEAR_CACHE_EVICTIONS.labels(reason="capacity").inc()
+    
+    def _discard(self, key: str) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        self._bytes -= len(entry[1])
+        return True
+    
+    def invalidate(self, keys: List[str] = (), pattern: Optional[str] = None):
+        """移除本地副本"""
+        self._epoch += 1
+        if pattern is not None:
+            keys = [key for key in self._entries if fnmatch.fnmatchcase(key, pattern)]
+        removed = sum(1 for key in keys if self._discard(key))
+        if removed:
+            self.invalidations += removed
+            NEAR_CACHE_EVICTIONS.labels(reason="invalidated").inc(removed)
+    
+    def clear(self):
+        self._epoch += 1
+        self._entries.clear()
+        self._bytes = 0
+    
+    def invalidation_message(self, keys: List[str] = (), pattern: Optional[str] = None) -> Optional[str]:
+        """需要通知其他worker时返回失效消息；本地副本由写入完成后的 invalidate() 移除"""
+        if not self.enabled:
+            return None
+        if pattern is None:
+            keys = [key for key in keys if self.cacheable(key)]
+            if not keys:
+                return None
+        return json.dumps({"origin": self.origin, "keys": list(keys), "pattern": pattern}, ensure_ascii=False)
+    
+    async def start(self):
+        """订阅失效频道（Redis初始化后调用）"""
+        if not self.enabled or self._listener is not None:
+            return
+        self._listener = asyncio.create_task(self._listen())
+    
+    async def _subscribe(self):
+        self._pubsub = get_redis().pubsub()
+        await self._pubsub.subscribe(self.channel)
+        # 订阅建立前的写入可能未收到通知，清空后再提供本地命中
+        self.clear()
+        self._coherent = True
+    
+    async def _listen(self):
+        """接收失效消息；连接异常时停止本地命中并重建订阅"""
+        while True:
+            try:
+                if self._pubsub is None:
+                    await self._subscribe()
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                cache_logger.warning("近端缓存失效订阅异常，正在重连", error=str(e))
+                self._coherent = False
+                self.clear()
+                await self._reset_pubsub()
+                await asyncio.sleep(1.0)
+                continue
+            
+            if message is not None:
+                self._apply(message["data"])
+    
+    def _apply(self, data: Any):
+        try:
+            event = json.loads(data)
+        except (TypeError, ValueError):
+            return
+        if event.get("origin") == self.origin:
+            return
+        self.invalidate(event.get("keys") or [], event.get("pattern"))
+    
+    async def _reset_pubsub(self):
+        pubsub, self._pubsub = self._pubsub, None
+        if pubsub is not None:
+            try:
+                await pubsub.reset()
+            except Exception:
+                pass
+    
+    async def stop(self):
+        """停止订阅并清空本地缓存（关闭Redis前调用）"""
+        self._coherent = False
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+        await self._reset_pubsub()
+        self.clear()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """命中、淘汰统计"""
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "coherent": self._coherent,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
 class RedisManager:
     """Redis管理器类"""
     
     def __init__(self):
-        self.client = redis_client
         self.default_ttl = settings.REDIS_CACHE_TTL
+        self.near_cache = NearCache()
+        
+        # get_or_compute 的进程内单飞和后台刷新任务
+        self._computing: Dict[str, asyncio.Future] = {}
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        self._compute_stats = {
+            "hits": 0, "misses": 0, "stale_served": 0, "early_refreshes": 0, "computes": 0, "waits": 0
+        }
+    
+    @property
+    def client(self) -> Redis:
+        """当前Redis客户端（init_redis之后才可用）"""
+        return get_redis()
     
     async def health_check(self) -> dict:
         """Redis健康检查"""
@@ -117,26 +324,25 @@ class RedisManager:
     async def set(self, key: str, value: Any, ttl: Optional[int] = None) -> bool:
         """设置缓存值"""
         try:
-            # 序列化值
-            if isinstance(value, (dict, list)):
-                serialized_value = json.dumps(value, ensure_ascii=False).encode('utf-8')
-            elif isinstance(value, str):
-                serialized_value = value.encode('utf-8')
-            elif isinstance(value, bytes):
-                serialized_value = value
-            else:
-                # 使用pickle序列化复杂对象
-                serialized_value = pickle.dumps(value)
+            raw = dumps(value)
+            ttl = ttl or self.default_ttl
             
-            # 设置缓存
-            result = await self.client.set(
-                key, 
-                serialized_value, 
-                ex=ttl or self.default_ttl
-            )
+            # 近端缓存的键：写入同时通知其他worker移除本地副本
+            message = self.near_cache.invalidation_message([key])
+            if message is None:
+                result = await self.client.set(key, raw, ex=ttl)
+            else:
+                async with self.client.pipeline(transaction=False) as pipe:
+                    pipe.set(key, raw, ex=ttl)
+                    pipe.publish(self.near_cache.channel, message)
+                    result = (await pipe.execute())[0]
+                # 写入期间读到旧值的并发读取不再写入本地
+                self.near_cache.invalidate([key])
+                if result:
+                    self.near_cache.put(key, raw, self.near_cache.epoch, ttl)
             
             if result:
-                cache_logger.debug(f"缓存设置成功", key=key, ttl=ttl or self.default_ttl)
+                cache_logger.debug(f"缓存设置成功", key=key, ttl=ttl)
             
             return bool(result)
             
@@ -147,21 +353,35 @@ class RedisManager:
     async def get(self, key: str) -> Optional[Any]:
         """获取缓存值"""
         try:
-            value = await self.client.get(key)
-            if value is None:
-                return None
+            return loads(await self._get_raw(key))
             
-            # 尝试JSON反序列化
-            try:
-                return json.loads(value.decode('utf-8'))
-            except (json.JSONDecodeError, UnicodeDecodeError):
-                # 尝试pickle反序列化
-                try:
-                    return pickle.loads(value)
-                except:
-                    # 返回原始字节
-                    return value.decode('utf-8') if isinstance(value, bytes) else value
-                    
+        except Exception as e:
+            cache_logger.error("获取缓存失败", key=key, error=str(e))
+            return None
+    
+    async def _get_raw(self, key: str) -> Optional[bytes]:
+        """读取原始值，近端缓存命中时不访问Redis"""
+        if not self.near_cache.cacheable(key):
+            return await self.client.get(key)
+        raw = self.near_cache.get(key)
+        if raw is None:
+            epoch = self.near_cache.epoch
+            raw = await self.client.get(key)
+            if raw is not None:
+                self.near_cache.put(key, raw, epoch)
+        return raw
+    
+    async def _publish_invalidation(self, keys: List[str] = (), pattern: Optional[str] = None):
+        """修改完成后移除本地副本并通知其他worker"""
+        message = self.near_cache.invalidation_message(keys, pattern)
+        if message is not None:
+            self.near_cache.invalidate(keys, pattern)
+            await self.client.publish(self.near_cache.channel, message)
+    
+    async def get_bytes(self, key: str) -> Optional[bytes]:
+        """获取原始字节（不做反序列化，用于图像等二进制内容）"""
+        try:
+            return await self.client.get(key)
         except Exception as e:
             cache_logger.error("获取缓存失败", key=key, error=str(e))
             return None
@@ -170,6 +390,7 @@ class RedisManager:
         """删除缓存"""
         try:
             result = await self.client.delete(key)
+            await self._publish_invalidation([key])
             if result:
                 cache_logger.debug("缓存删除成功", key=key)
             return bool(result)
@@ -177,6 +398,18 @@ class RedisManager:
             cache_logger.error("删除缓存失败", key=key, error=str(e))
             return False
     
+    async def delete_many(self, keys: List[str]) -> int:
+        """批量删除缓存，返回删除的键数"""
+        if not keys:
+            return 0
+        try:
+            deleted = await self.client.delete(*keys)
+            await self._publish_invalidation(keys)
+            return deleted
+        except Exception as e:
+            cache_logger.error("批量删除缓存失败", count=len(keys), error=str(e))
+            return 0
+    
     async def exists(self, key: str) -> bool:
         """检查缓存是否存在"""
         try:
@@ -190,6 +423,7 @@ class RedisManager:
         """设置缓存过期时间"""
         try:
             result = await self.client.expire(key, ttl)
+            await self._publish_invalidation([key])
             return bool(result)
         except Exception as e:
             cache_logger.error("设置缓存过期时间失败", key=key, ttl=ttl, error=str(e))
@@ -205,56 +439,88 @@ class RedisManager:
     
     # 批量操作
     async def mget(self, keys: List[str]) -> List[Optional[Any]]:
-        """批量获取缓存"""
+        """批量获取缓存，近端缓存命中的键不再访问Redis"""
         try:
-            values = await self.client.mget(keys)
-            results = []
-            
-            for value in values:
-                if value is None:
-                    results.append(None)
-                    continue
-                
-                try:
-                    results.append(json.loads(value.decode('utf-8')))
-                except (json.JSONDecodeError, UnicodeDecodeError):
-                    try:
-                        results.append(pickle.loads(value))
-                    except:
-                        results.append(value.decode('utf-8') if isinstance(value, bytes) else value)
+            values: List[Optional[bytes]] = [
+                self.near_cache.get(key) if self.near_cache.cacheable(key) else None for key in keys
+            ]
+            missing = [i for i, value in enumerate(values) if value is None]
+            if missing:
+                epoch = self.near_cache.epoch
+                fetched = await self.client.mget([keys[i] for i in missing])
+                for i, raw in zip(missing, fetched):
+                    values[i] = raw
+                    if raw is not None and self.near_cache.cacheable(keys[i]):
+                        self.near_cache.put(keys[i], raw, epoch)
             
-            return results
+            return [loads(value) for value in values]
             
         except Exception as e:
             cache_logger.error("批量获取缓存失败", keys=keys, error=str(e))
             return [None] * len(keys)
     
-    async def delete_pattern(self, pattern: str) -> int:
-        """删除匹配模式的所有键"""
+    async def delete_pattern(self, pattern: str, count: Optional[int] = None,
+                             chunk_size: Optional[int] = None, pause_ms: Optional[int] = None,
+                             on_progress: Optional[Callable[[Dict[str, Any]], Any]] = None) -> int:
+        """
+        删除匹配模式的所有键，返回删除的键数
+        逐步SCAN并分批UNLINK，不阻塞Redis；on_progress 在每批删除后以进度字典调用（可以是协程函数）
+        """
+        deleted = 0
         try:
-            keys = await self.client.keys(pattern)
-            if keys:
-                deleted = await self.client.delete(*keys)
-                cache_logger.debug(f"批量删除缓存", pattern=pattern, count=deleted)
-                return deleted
-            return 0
+            async for progress in self.scan_delete(pattern, count, chunk_size, pause_ms):
+                deleted = progress["deleted"]
+                if on_progress is not None:
+                    outcome = on_progress(progress)
+                    if inspect.isawaitable(outcome):
+                        await outcome
+            cache_logger.debug(f"批量删除缓存", pattern=pattern, count=deleted)
+            return deleted
         except Exception as e:
-            cache_logger.error("批量删除缓存失败", pattern=pattern, error=str(e))
-            return 0
+            cache_logger.error("批量删除缓存失败", pattern=pattern, deleted=deleted, error=str(e))
+            return deleted
+    
+    async def scan_delete(self, pattern: str, count: Optional[int] = None,
+                          chunk_size: Optional[int] = None,
+                          pause_ms: Optional[int] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        增量删除匹配模式的键，每删除一批产出一次进度
+        {"pattern", "scanned", "deleted", "chunks", "done"}
+        SCAN期间新写入或删除的键可能被遗漏或重复返回，UNLINK对已删除的键无影响
+        """
+        count = count or settings.REDIS_SCAN_COUNT
+        chunk_size = max(1, chunk_size or settings.REDIS_DELETE_CHUNK)
+        pause = (settings.REDIS_DELETE_PAUSE_MS if pause_ms is None else pause_ms) / 1000
+        progress = {"pattern": pattern, "scanned": 0, "deleted": 0, "chunks": 0, "done": False}
+        
+        chunk: List[bytes] = []
+        async for key in self.client.scan_iter(match=pattern, count=count):
+            progress["scanned"] += 1
+            chunk.append(key)
+            if len(chunk) >= chunk_size:
+                await self._unlink_chunk(chunk, progress)
+                chunk = []
+                yield dict(progress)
+                if pause > 0:
+                    await asyncio.sleep(pause)
+        
+        if chunk:
+            await self._unlink_chunk(chunk, progress)
+        progress["done"] = True
+        yield dict(progress)
+    
+    async def _unlink_chunk(self, keys: List[bytes], progress: Dict[str, Any]):
+        """UNLINK在后台线程释放内存，大值也不会阻塞Redis"""
+        progress["deleted"] += await self.client.unlink(*keys)
+        progress["chunks"] += 1
+        await self._publish_invalidation([_decode(key) for key in keys])
     
     # Hash操作
     async def hset(self, name: str, mapping: Dict[str, Any], ttl: Optional[int] = None) -> bool:
         """设置Hash缓存"""
         try:
-            # 序列化Hash值
-            serialized_mapping = {}
-            for key, value in mapping.items():
-                if isinstance(value, (dict, list)):
-                    serialized_mapping[key] = json.dumps(value, ensure_ascii=False)
-                elif isinstance(value, str):
-                    serialized_mapping[key] = value
-                else:
-                    serialized_mapping[key] = str(value)
+            # 序列化Hash值：数字保存为文本（可HINCRBY），其余使用信封格式
+            serialized_mapping = {key: dumps_field(value) for key, value in mapping.items()}
             
             result = await self.client.hset(name, mapping=serialized_mapping)
             
@@ -271,36 +537,496 @@ class RedisManager:
     async def hget(self, name: str, key: str) -> Optional[Any]:
         """获取Hash缓存字段"""
         try:
-            value = await self.client.hget(name, key)
-            if value is None:
-                return None
+            return loads(await self.client.hget(name, key))
             
-            try:
-                return json.loads(value)
-            except json.JSONDecodeError:
-                return value
-                
         except Exception as e:
             cache_logger.error("获取Hash缓存失败", name=name, key=key, error=str(e))
             return None
     
+    async def hincrby(self, name: str, key: str, amount: int = 1) -> Optional[int]:
+        """Hash字段计数加减"""
+        try:
+            return await self.client.hincrby(name, key, amount)
+        except Exception as e:
+            cache_logger.error("Hash计数失败", name=name, key=key, error=str(e))
+            return None
+    
     async def hgetall(self, name: str) -> Dict[str, Any]:
         """获取Hash缓存所有字段"""
         try:
-            values = await self.client.hgetall(name)
-            result = {}
-            
-            for key, value in values.items():
-                try:
-                    result[key.decode('utf-8')] = json.loads(value.decode('utf-8'))
-                except (json.JSONDecodeError, UnicodeDecodeError):
-                    result[key.decode('utf-8')] = value.decode('utf-8')
-            
-            return result
+            return _deserialize_fields(await self.client.hgetall(name))
             
         except Exception as e:
             cache_logger.error("获取Hash缓存所有字段失败", name=name, error=str(e))
             return {}
+    
+    # 防缓存击穿的读取或计算
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]],
+                             ttl: Optional[int] = None, stale_ttl: Optional[int] = None,
+                             beta: Optional[float] = None, lock_ttl: Optional[int] = None) -> Any:
+        """
+        读取缓存，未命中时计算并写入，避免热点键过期时大量请求同时重算
+        - 同一键的计算在进程内和跨worker只执行一次，其余调用方等待其结果
+        - 过期后 stale_ttl 内仍返回旧值，由一个调用方在后台刷新
+        - XFetch：过期前按概率提前后台刷新，计算越慢、越接近过期，提前刷新的概率越高
+        compute 返回None时不写入缓存
+        """
+        ttl = ttl or self.default_ttl
+        stale_ttl = settings.CACHE_STALE_TTL if stale_ttl is None else stale_ttl
+        beta = settings.CACHE_XFETCH_BETA if beta is None else beta
+        lock_ttl = lock_ttl or settings.CACHE_COMPUTE_LOCK_TTL
+        
+        entry = await self.get(key)
+        if entry is not None:
+            if not _is_computed(entry):
+                # 非本接口写入的值（升级前写入或直接set），由Redis过期时间管理
+                self._compute_stats["hits"] += 1
+                return entry
+            
+            remaining = entry["expires_at"] - time.time()
+            if remaining > 0:
+                if entry["delta"] * beta * -math.log(1.0 - random.random()) < remaining:
+                    self._compute_stats["hits"] += 1
+                    return entry["value"]
+                self._compute_stats["early_refreshes"] += 1
+                self._refresh_in_background(key, compute, ttl, stale_ttl, lock_ttl)
+                return entry["value"]
+            if remaining > -stale_ttl:
+                self._compute_stats["stale_served"] += 1
+                self._refresh_in_background(key, compute, ttl, stale_ttl, lock_ttl)
+                return entry["value"]
+        
+        self._compute_stats["misses"] += 1
+        return await self._compute_once(key, compute, ttl, stale_ttl, lock_ttl)
+    
+    async def put_computed(self, key: str, value: Any, ttl: Optional[int] = None,
+                           stale_ttl: Optional[int] = None, delta: float = 0.0) -> bool:
+        """主动写入 get_or_compute 格式的缓存值"""
+        ttl = ttl or self.default_ttl
+        stale_ttl = settings.CACHE_STALE_TTL if stale_ttl is None else stale_ttl
+        entry = {_COMPUTED_MARKER: 1, "value": value, "expires_at": time.time() + ttl, "delta": delta}
+        return await self.set(key, entry, ttl=ttl + stale_ttl)
+    
+    async def _compute_and_store(self, key: str, compute: Callable[[], Awaitable[Any]],
+                                 ttl: int, stale_ttl: int) -> Any:
+        start = time.monotonic()
+        value = await compute()
+        self._compute_stats["computes"] += 1
+        if value is not None:
+            await self.put_computed(key, value, ttl, stale_ttl, delta=time.monotonic() - start)
+        return value
+    
+    async def _compute_once(self, key: str, compute: Callable[[], Awaitable[Any]],
+                            ttl: int, stale_ttl: int, lock_ttl: int) -> Any:
+        """进程内共享同一个Future，跨worker由分布式锁选出计算者"""
+        while True:
+            future = self._computing.get(key)
+            if future is None:
+                break
+            try:
+                return await asyncio.shield(future)
+            except _ComputeCancelled:
+                continue
+        
+        future = asyncio.get_running_loop().create_future()
+        self._computing[key] = future
+        try:
+            value = await self._compute_distributed(key, compute, ttl, stale_ttl, lock_ttl)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.set_exception(_ComputeCancelled())
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._computing.pop(key, None)
+            # 没有等待者时避免 "exception was never retrieved" 警告
+            if future.done() and not future.cancelled():
+                future.exception()
+    
+    async def _compute_distributed(self, key: str, compute: Callable[[], Awaitable[Any]],
+                                   ttl: int, stale_ttl: int, lock_ttl: int) -> Any:
+        lock_key = CacheKeys.format_key(CacheKeys.CACHE_COMPUTE_LOCK, key=key)
+        token = uuid.uuid4().hex
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + lock_ttl
+        
+        while loop.time() < deadline:
+            if await self.acquire_lock(lock_key, token, lock_ttl):
+                try:
+                    # 等待锁期间其他worker可能已写入
+                    entry = await self.get(key)
+                    if _is_computed(entry) and entry["expires_at"] > time.time():
+                        return entry["value"]
+                    return await self._compute_and_store(key, compute, ttl, stale_ttl)
+                finally:
+                    await self.release_lock(lock_key, token)
+            
+            # 其他worker正在计算，等待结果写入或锁释放
+            self._compute_stats["waits"] += 1
+            delay = 0.05
+            while loop.time() < deadline:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 0.5)
+                entry = await self.get(key)
+                if _is_computed(entry) and entry["expires_at"] > time.time():
+                    return entry["value"]
+                if not await self.exists(lock_key):
+                    break
+        
+        # 等待超时（计算者卡住或计算结果为None），自行计算
+        cache_logger.warning("等待缓存计算超时，自行计算", key=key)
+        return await self._compute_and_store(key, compute, ttl, stale_ttl)
+    
+    def _refresh_in_background(self, key: str, compute: Callable[[], Awaitable[Any]],
+                               ttl: int, stale_ttl: int, lock_ttl: int):
+        """后台刷新缓存，本进程或其他worker已在刷新时跳过"""
+        if key in self._refreshing or key in self._computing:
+            return
+        task = asyncio.create_task(self._refresh(key, compute, ttl, stale_ttl, lock_ttl))
+        self._refreshing[key] = task
+        task.add_done_callback(lambda _: self._refreshing.pop(key, None))
+    
+    async def _refresh(self, key: str, compute: Callable[[], Awaitable[Any]],
+                       ttl: int, stale_ttl: int, lock_ttl: int):
+        lock_key = CacheKeys.format_key(CacheKeys.CACHE_COMPUTE_LOCK, key=key)
+        token = uuid.uuid4().hex
+        if not await self.acquire_lock(lock_key, token, lock_ttl):
+            return
+        try:
+            await self._compute_and_store(key, compute, ttl, stale_ttl)
+        except Exception as e:
+            # 刷新失败时继续返回旧值，过期后由下一次请求重试
+            cache_logger.warning("后台刷新缓存失败", key=key, error=str(e))
+        finally:
+            await self.release_lock(lock_key, token)
+    
+    def get_compute_stats(self) -> Dict[str, int]:
+        """get_or_compute 命中、旧值返回、提前刷新统计"""
+        return {**self._compute_stats, "refreshing": len(self._refreshing)}
+    
+    # 分布式锁和消息通知
+    async def acquire_lock(self, name: str, token: str, ttl: int) -> bool:
+        """
+        尝试获取分布式锁（SET NX EX）
+        Redis不可用时视为获得锁，调用方退化为仅进程内协调
+        """
+        try:
+            result = await self.client.set(name, token, nx=True, ex=ttl)
+            return bool(result)
+        except Exception as e:
+            cache_logger.error("获取分布式锁失败，按已获得处理", name=name, error=str(e))
+            return True
+    
+    async def release_lock(self, name: str, token: str) -> bool:
+        """释放分布式锁，仅当锁仍由当前token持有时才删除"""
+        try:
+            result = await self.client.eval(_RELEASE_LOCK_SCRIPT, 1, name, token)
+            return bool(result)
+        except Exception as e:
+            cache_logger.error("释放分布式锁失败", name=name, error=str(e))
+            return False
+    
+    async def publish(self, channel: str, message: Any) -> int:
+        """发布消息，返回收到消息的订阅者数量"""
+        try:
+            if isinstance(message, (dict, list)):
+                message = json.dumps(message, ensure_ascii=False)
+            return await self.client.publish(channel, message)
+        except Exception as e:
+            cache_logger.error("发布消息失败", channel=channel, error=str(e))
+            return 0
+    
+    def pubsub(self):
+        """创建发布订阅对象"""
+        return self.client.pubsub()
+    
+    # Stream操作（任务队列）
+    async def ensure_stream_group(self, stream: str, group: str) -> bool:
+        """创建消费者组（流不存在时一并创建），已存在时直接返回"""
+        try:
+            await self.client.xgroup_create(stream, group, id="0", mkstream=True)
+            cache_logger.info("创建消费者组", stream=stream, group=group)
+            return True
+        except ResponseError as e:
+            if "BUSYGROUP" in str(e):
+                return True
+            cache_logger.error("创建消费者组失败", stream=stream, group=group, error=str(e))
+            return False
+        except Exception as e:
+            cache_logger.error("创建消费者组失败", stream=stream, group=group, error=str(e))
+            return False
+    
+    async def xreadgroup(self, group: str, consumer: str, streams: Dict[str, str],
+                         count: int, block_ms: int) -> List[tuple]:
+        """
+        以消费者组方式读取消息，返回 [(stream, message_id, fields)]
+        超时或出错时返回空列表
+        """
+        try:
+            response = await self.client.xreadgroup(group, consumer, streams, count=count, block=block_ms)
+        except Exception as e:
+            cache_logger.error("读取队列消息失败", group=group, error=str(e))
+            return []
+        
+        messages = []
+        for stream, entries in response or []:
+            for message_id, fields in entries:
+                messages.append((_decode(stream), _decode(message_id), _decode_fields(fields)))
+        return messages
+    
+    async def xadd(self, stream: str, fields: Dict[str, str], ttl: Optional[int] = None) -> Optional[str]:
+        """追加一条消息并（可选）刷新流的过期时间，返回消息ID，出错时返回None"""
+        try:
+            async with self.client.pipeline(transaction=True) as pipe:
+                pipe.xadd(stream, fields)
+                if ttl:
+                    pipe.expire(stream, ttl)
+                results = await pipe.execute()
+            return _decode(results[0])
+        except Exception as e:
+            cache_logger.error("追加流消息失败", stream=stream, error=str(e))
+            return None
+    
+    async def xread(self, stream: str, last_id: str, count: int, block_ms: int) -> Optional[List[tuple]]:
+        """
+        读取 last_id 之后的消息，返回 [(message_id, fields)]
+        超时返回空列表，出错时返回None
+        """
+        try:
+            response = await self.client.xread({stream: last_id}, count=count, block=block_ms)
+        except Exception as e:
+            cache_logger.error("读取流消息失败", stream=stream, error=str(e))
+            return None
+        
+        return [
+            (_decode(message_id), _decode_fields(fields))
+            for _, entries in response or []
+            for message_id, fields in entries
+        ]
+    
+    async def xack_delete(self, stream: str, group: str, message_id: str) -> bool:
+        """确认并删除已处理的消息，流的长度即为积压量"""
+        try:
+            async with self.client.pipeline(transaction=True) as pipe:
+                pipe.xack(stream, group, message_id)
+                pipe.xdel(stream, message_id)
+                acked, _ = await pipe.execute()
+            return bool(acked)
+        except Exception as e:
+            cache_logger.error("确认队列消息失败", stream=stream, message_id=message_id, error=str(e))
+            return False
+    
+    async def xpending_idle(self, stream: str, group: str, min_idle_ms: int,
+                            count: int) -> List[Dict[str, Any]]:
+        """获取空闲时间超过阈值的待确认消息（含投递次数）"""
+        try:
+            entries = await self.client.xpending_range(
+                stream, group, min="-", max="+", count=count, idle=min_idle_ms
+            )
+            return [
+                {
+                    "message_id": _decode(entry["message_id"]),
+                    "consumer": _decode(entry["consumer"]),
+                    "idle_ms": entry["time_since_delivered"],
+                    "times_delivered": entry["times_delivered"],
+                }
+                for entry in entries
+            ]
+        except Exception as e:
+            cache_logger.error("获取待确认消息失败", stream=stream, group=group, error=str(e))
+            return []
+    
+    async def xclaim(self, stream: str, group: str, consumer: str, min_idle_ms: int,
+                     message_ids: List[str]) -> List[tuple]:
+        """将空闲消息转移给当前消费者，返回 [(message_id, fields)]"""
+        if not message_ids:
+            return []
+        try:
+            entries = await self.client.xclaim(stream, group, consumer, min_idle_ms, message_ids)
+            return [
+                (_decode(message_id), _decode_fields(fields))
+                for message_id, fields in entries
+                if fields is not None
+            ]
+        except Exception as e:
+            cache_logger.error("认领队列消息失败", stream=stream, group=group, error=str(e))
+            return []
+    
+    async def touch_pending(self, stream: str, group: str, consumer: str, message_ids: List[str]) -> int:
+        """重置当前消费者处理中消息的空闲时间，避免被其他worker按超时接管；返回仍在待确认列表中的消息数"""
+        if not message_ids:
+            return 0
+        try:
+            claimed = await self.client.xclaim(stream, group, consumer, 0, message_ids, justid=True)
+            return len(claimed)
+        except Exception as e:
+            cache_logger.error("刷新队列消息空闲时间失败", stream=stream, group=group, error=str(e))
+            return 0
+    
+    async def stream_stats(self, stream: str, group: str) -> Dict[str, Any]:
+        """队列积压和待确认消息数"""
+        try:
+            length = await self.client.xlen(stream)
+            pending = await self.client.xpending(stream, group)
+            return {"length": length, "pending": pending.get("pending", 0)}
+        except Exception as e:
+            cache_logger.error("获取队列状态失败", stream=stream, error=str(e))
+            return {"length": None, "pending": None}
+
+    
+    # 进度跟踪（Hash存储，只写变化的字段）
+    async def update_progress(self, key: str, fields: Dict[str, Any], ttl: int,
+                              channel: Optional[str] = None, event: Optional[Dict[str, Any]] = None,
+                              replace: bool = False,
+                              counter: Optional[Tuple[str, str, str]] = None) -> bool:
+        """
+        写入进度Hash中的字段并刷新过期时间，可同时发布通知，一次往返完成
+        replace=True 时在同一事务中先清空原有字段
+        counter 为 (计数Hash键, 成员ID, 结果)，在同一事务中按成员幂等计数
+        """
+        try:
+            async with self.client.pipeline(transaction=replace or counter is not None) as pipe:
+                if replace:
+                    pipe.delete(key)
+                if fields:
+                    pipe.hset(key, mapping=_serialize_fields(fields))
+                pipe.expire(key, ttl)
+                if counter is not None:
+                    pipe.eval(_RECORD_OUTCOME_SCRIPT, 1, *counter)
+                if channel is not None:
+                    pipe.publish(channel, json.dumps(event, ensure_ascii=False))
+                await pipe.execute()
+            return True
+        except Exception as e:
+            cache_logger.error("写入进度失败", key=key, error=str(e))
+            return False
+    
+    async def complete_progress(self, key: str, fields: Dict[str, Any], ttl: int,
+                                result_key: str, result: Any, result_ttl: int,
+                                channel: Optional[str] = None,
+                                event: Optional[Dict[str, Any]] = None,
+                                counter: Optional[Tuple[str, str, str]] = None) -> bool:
+        """在一个MULTI事务中写入最终结果和最终进度，读到完成状态时结果一定已存在"""
+        try:
+            invalidation = self.near_cache.invalidation_message([result_key])
+            async with self.client.pipeline(transaction=True) as pipe:
+                pipe.set(result_key, dumps(result), ex=result_ttl)
+                if invalidation is not None:
+                    pipe.publish(self.near_cache.channel, invalidation)
+                if fields:
+                    pipe.hset(key, mapping=_serialize_fields(fields))
+                pipe.expire(key, ttl)
+                if counter is not None:
+                    pipe.eval(_RECORD_OUTCOME_SCRIPT, 1, *counter)
+                if channel is not None:
+                    pipe.publish(channel, json.dumps(event, ensure_ascii=False))
+                await pipe.execute()
+            if invalidation is not None:
+                self.near_cache.invalidate([result_key])
+            return True
+        except Exception as e:
+            cache_logger.error("写入最终结果失败", key=key, result_key=result_key, error=str(e))
+            return False
+    
+    async def get_progress(self, key: str) -> Optional[Dict[str, Any]]:
+        """读取进度Hash，兼容以字符串保存的旧版进度"""
+        return (await self.get_progress_many([key]))[0]
+    
+    async def get_progress_many(self, keys: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """一次往返批量读取多个进度Hash"""
+        if not keys:
+            return []
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.hgetall(key)
+                values = await pipe.execute(raise_on_error=False)
+        except Exception as e:
+            cache_logger.error("批量读取进度失败", count=len(keys), error=str(e))
+            return [None] * len(keys)
+        
+        results = []
+        for key, value in zip(keys, values):
+            if isinstance(value, ResponseError):
+                # WRONGTYPE: 升级前以JSON字符串写入的进度
+                results.append(await self.get(key))
+            elif isinstance(value, Exception) or not value:
+                results.append(None)
+            else:
+                results.append(_deserialize_fields(value))
+        return results
+    
+    async def get_counters(self, key: str, fields: List[str]) -> Dict[str, Optional[int]]:
+        """读取计数Hash中的指定字段，不存在的字段为None"""
+        try:
+            values = await self.client.hmget(key, fields)
+            return {field: int(value) if value is not None else None for field, value in zip(fields, values)}
+        except Exception as e:
+            cache_logger.error("读取计数失败", key=key, error=str(e))
+            return {field: None for field in fields}
+
+
+def _decode(value: Union[bytes, str]) -> str:
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+def _decode_fields(fields: Dict[Any, Any]) -> Dict[str, str]:
+    return {_decode(key): _decode(value) for key, value in fields.items()}
+
+
+
+def _serialize_fields(fields: Dict[str, Any]) -> Dict[str, Union[bytes, str]]:
+    """进度字段逐个序列化，读取时保持原类型（数字、None等）"""
+    return {key: dumps_field(value) for key, value in fields.items()}
+
+
+def _deserialize_fields(values: Dict[Any, Any]) -> Dict[str, Any]:
+    return {_decode(key): loads(value) for key, value in values.items()}
+
+
+# get_or_compute 写入的缓存值标记：{"__computed__": 1, "value", "expires_at", "delta"}
+_COMPUTED_MARKER = "__computed__"
+
+
+class _ComputeCancelled(Exception):
+    """进程内计算者被取消，等待者需要重新竞争"""
+
+
+def _is_computed(entry: Any) -> bool:
+    return isinstance(entry, dict) and entry.get(_COMPUTED_MARKER) == 1
+
+
+# 仅删除自己持有的锁，避免误删超时后被其他worker重新获取的锁
+_RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+else
+    return 0
+end
+"""
+
+
+# 按成员记录最终结果并计数：同一成员重复记录不重复计数，结果变化时从原计数转移；
+# 计数Hash不存在（未初始化或已过期）时不创建
+_RECORD_OUTCOME_SCRIPT = """
+if redis.call("exists", KEYS[1]) == 0 then
+    return 0
+end
+local field = "outcome:" .. ARGV[1]
+local previous = redis.call("hget", KEYS[1], field)
+if previous == ARGV[2] then
+    return 0
+end
+if previous then
+    redis.call("hincrby", KEYS[1], previous, -1)
+end
+redis.call("hset", KEYS[1], field, ARGV[2])
+redis.call("hincrby", KEYS[1], ARGV[2], 1)
+return 1
+"""
 
 
 class CacheKeys:
@@ -309,12 +1035,29 @@ class CacheKeys:
     # AI分析结果缓存
     ANALYSIS_RESULT = "analysis:result:{analysis_id}"
     ANALYSIS_PROGRESS = "analysis:progress:{analysis_id}"
+    ANALYSIS_PROGRESS_CHANNEL = "analysis:progress:events:{analysis_id}"
     ANALYSIS_QUEUE = "analysis:queue:{analysis_type}"
+    ANALYSIS_INFLIGHT_LOCK = "analysis:inflight:lock:{flight_key}"
+    ANALYSIS_INFLIGHT_RESULT = "analysis:inflight:result:{flight_key}"
+    ANALYSIS_INFLIGHT_CHANNEL = "analysis:inflight:done:{flight_key}"
+    
+    # get_or_compute 计算锁
+    CACHE_COMPUTE_LOCK = "cache:compute:lock:{key}"
+    
+    # 批量分析
+    BATCH_INFO = "batch:{batch_id}"
+    BATCH_COUNTERS = "batch:counters:{batch_id}"
+    BATCH_EVENTS = "batch:events:{batch_id}"
+    BATCH_SESSION = "batch:session:{batch_id}"
     
     # 模型缓存
     MODEL_INFO = "model:info:{model_name}"
     MODEL_VERSION = "model:version:{model_name}"
     MODEL_METRICS = "model:metrics:{model_name}"
+    INFERENCE_RESULT = "model:result:{model_name}:{model_version}:{config_hash}:{content_hash}"
+    
+    # 第三方AI服务响应缓存
+    THIRD_PARTY_RESULT = "third_party:result:{api_version}:{endpoint}:{params_hash}:{content_hash}"
     
     # 图像处理缓存
     IMAGE_METADATA = "image:metadata:{image_id}"
@@ -329,6 +1072,9 @@ class CacheKeys:
     USER_SESSION = "session:user:{user_id}"
     AUTH_TOKEN = "auth:token:{token_hash}"
     
+    # 进程内近端缓存失效通知
+    NEAR_CACHE_INVALIDATION = "cache:near:invalidate"
+    
     # 系统状态缓存
     SYSTEM_HEALTH = "system:health"
     SYSTEM_METRICS = "system:metrics"
@@ -0,0 +1,210 @@
+"""
+Redis缓存值序列化
+带版本的二进制信封：1字节头 + 负载
+- 头字节取值 0xF8–0xFF（第1版信封），这些字节不会出现在UTF-8文本、JSON或pickle数据的开头，
+  因此可以与升级前写入的值区分
+- 头字节低2位为负载类型（原始字节 / 字符串 / JSON / msgpack），第3位表示负载已压缩
+- JSON使用orjson，包含字节等JSON无法表示的值时使用msgpack
+- 序列化后超过 REDIS_COMPRESSION_THRESHOLD 的值使用zstd或lz4压缩，解压时按帧头识别算法
+- 升级前写入的值按 JSON -> 字符串 -> 原始字节 依次解析，不再反序列化pickle
+"""
+
+import json
+from typing import Any, Callable, Optional, Tuple, Union
+
+from app.core.config import settings
+
+try:
+    import orjson
+except ImportError:  # 可选依赖
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # 可选依赖
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:  # 可选依赖
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:  # 可选依赖
+    lz4_frame = None
+
+
+# 第1版信封头字节：0b11111 + 压缩位 + 2位负载类型
+ENVELOPE_V1 = 0xF8
+COMPRESSED = 0x04
+KIND_MASK = 0x03
+
+KIND_BYTES = 0
+KIND_STR = 1
+KIND_JSON = 2
+KIND_MSGPACK = 3
+
+# 压缩帧头（小端）
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+LZ4_MAGIC = b"\x04\x22\x4d\x18"
+
+
+class SerializationError(ValueError):
+    """缓存值无法序列化或解析"""
+
+
+# JSON编解码
+if orjson is not None:
+    _JSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def _json_dumps(value: Any) -> bytes:
+        return orjson.dumps(value, option=_JSON_OPTIONS)
+
+    _json_loads = orjson.loads
+    _JSON_DECODE_ERRORS: Tuple[type, ...] = (orjson.JSONDecodeError,)
+else:
+    def _json_dumps(value: Any) -> bytes:
+        return json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+    def _json_loads(data: Union[bytes, memoryview]) -> Any:
+        return json.loads(bytes(data))
+
+    _JSON_DECODE_ERRORS = (json.JSONDecodeError, UnicodeDecodeError)
+
+
+# 压缩算法
+_compressor: Optional[Tuple[str, Callable[[bytes], bytes]]] = None
+_zstd_decompressor = None
+
+
+def _resolve_compressor() -> Optional[Tuple[str, Callable[[bytes], bytes]]]:
+    """按配置选择压缩算法，依赖未安装时依次降级"""
+    preferred = settings.REDIS_COMPRESSION.lower()
+    if preferred == "none":
+        return None
+    candidates = ["zstd", "lz4"] if preferred == "zstd" else ["lz4", "zstd"]
+    for name in candidates:
+        if name == "zstd" and zstandard is not None:
+            return name, zstandard.ZstdCompressor(level=settings.REDIS_COMPRESSION_LEVEL).compress
+        if name == "lz4" and lz4_frame is not None:
+            return name, lz4_frame.compress
+    return None
+
+
+def compression_codec() -> Optional[str]:
+    """当前使用的压缩算法名称，未启用时为None"""
+    global _compressor
+    if _compressor is None:
+        _compressor = _resolve_compressor() or ("none", None)
+    return _compressor[0] if _compressor[1] is not None else None
+
+
+def _compress(payload: bytes) -> Optional[bytes]:
+    """压缩负载，算法不可用或压缩无收益时返回None"""
+    if compression_codec() is None:
+        return None
+    compressed = _compressor[1](payload)
+    return compressed if len(compressed) < len(payload) else None
+
+
+def _decompress(payload: Union[bytes, memoryview]) -> bytes:
+    global _zstd_decompressor
+    magic = bytes(payload[:4])
+    if magic == ZSTD_MAGIC:
+        if zstandard is None:
+            raise SerializationError("缓存值使用zstd压缩，但未安装zstandard")
+        if _zstd_decompressor is None:
+            _zstd_decompressor = zstandard.ZstdDecompressor()
+        return _zstd_decompressor.decompress(payload)
+    if magic == LZ4_MAGIC:
+        if lz4_frame is None:
+            raise SerializationError("缓存值使用lz4压缩，但未安装lz4")
+        return lz4_frame.decompress(payload)
+    raise SerializationError("未知的压缩格式")
+
+
+def dumps(value: Any) -> bytes:
+    """序列化为信封格式"""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        kind, payload = KIND_BYTES, bytes(value)
+    elif isinstance(value, str):
+        kind, payload = KIND_STR, value.encode("utf-8")
+    else:
+        try:
+            kind, payload = KIND_JSON, _json_dumps(value)
+        except TypeError as e:
+            # 包含字节等JSON无法表示的值
+            if msgpack is None:
+                raise SerializationError(f"无法序列化缓存值: {e}") from e
+            try:
+                kind, payload = KIND_MSGPACK, msgpack.packb(value, use_bin_type=True)
+            except TypeError as e:
+                raise SerializationError(f"无法序列化缓存值: {e}") from e
+
+    header = ENVELOPE_V1 | kind
+    if len(payload) > settings.REDIS_COMPRESSION_THRESHOLD:
+        compressed = _compress(payload)
+        if compressed is not None:
+            return bytes((header | COMPRESSED,)) + compressed
+    return bytes((header,)) + payload
+
+
+def dumps_field(value: Any) -> Union[bytes, str]:
+    """Hash字段序列化：整数和浮点数保存为文本，保持HINCRBY等原生命令可用"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    return dumps(value)
+
+
+def is_envelope(raw: Union[bytes, memoryview]) -> bool:
+    return len(raw) > 0 and raw[0] >= ENVELOPE_V1
+
+
+def loads(raw: Optional[Union[bytes, str]]) -> Any:
+    """解析缓存值：信封格式直接按类型解析，其余按升级前的格式解析"""
+    if raw is None:
+        return None
+    if isinstance(raw, str):
+        raw = raw.encode("utf-8")
+    if not is_envelope(raw):
+        return _loads_legacy(raw)
+
+    header = raw[0]
+    payload = memoryview(raw)[1:]
+    if header & COMPRESSED:
+        payload = _decompress(payload)
+
+    kind = header & KIND_MASK
+    if kind == KIND_JSON:
+        return _json_loads(payload)
+    if kind == KIND_STR:
+        return str(payload, "utf-8")
+    if kind == KIND_MSGPACK:
+        if msgpack is None:
+            raise SerializationError("缓存值使用msgpack编码，但未安装msgpack")
+        return msgpack.unpackb(payload, raw=False)
+    return bytes(payload)
+
+
+def _loads_legacy(raw: bytes) -> Any:
+    """升级前写入的值：dict/list为JSON，字符串为UTF-8文本，其余为原始字节"""
+    try:
+        return _json_loads(raw)
+    except _JSON_DECODE_ERRORS:
+        pass
+    try:
+        return raw.decode("utf-8")
+    except UnicodeDecodeError:
+        return raw
+
+
+# 导出
+__all__ = [
+    "SerializationError",
+    "compression_codec",
+    "dumps",
+    "dumps_field",
+    "is_envelope",
+    "loads",
+]
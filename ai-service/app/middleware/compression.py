@@ -0,0 +1,38 @@
+"""
+响应压缩中间件
+在 GZipMiddleware 基础上跳过流式响应（SSE事件流、NDJSON结果流）：
+gzip会缓冲小块数据，导致事件和逐条结果无法及时送达客户端
+"""
+
+import re
+from typing import Iterable
+
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+
+# 客户端声明接收这些类型时不压缩
+STREAMING_MEDIA_TYPES = ("text/event-stream", "application/x-ndjson")
+
+
+class StreamingGZipMiddleware(GZipMiddleware):
+    """不压缩流式响应的GZip中间件"""
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 500, compresslevel: int = 9,
+                 exclude_paths: Iterable[str] = ()) -> None:
+        super().__init__(app, minimum_size=minimum_size, compresslevel=compresslevel)
+        # 流式接口的路径（正则），客户端未声明Accept时也不压缩
+        self.exclude_paths = [re.compile(pattern) for pattern in exclude_paths]
+
+    def _is_streaming(self, scope: Scope) -> bool:
+        accept = Headers(scope=scope).get("accept", "")
+        if any(media_type in accept for media_type in STREAMING_MEDIA_TYPES):
+            return True
+        return any(pattern.search(scope["path"]) for pattern in self.exclude_paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and self._is_streaming(scope):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
@@ -0,0 +1,317 @@
+"""
+第三方AI服务按接口限流
+- 令牌桶：限制每秒请求数，对应供应商的速率限制；429/503带 Retry-After 时暂停发放令牌
+- AIMD自适应并发：接口正常且并发已用满时线性增加并发上限，
+  收到429/503或超时时成倍收缩，延迟明显高于基线时小幅收缩
+- 先取得并发槽位再取令牌，取得令牌后立即发送请求
+- 排队等待时间、当前并发上限和在途请求数通过Prometheus指标暴露
+均为每个worker独立计算
+"""
+
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+import httpx
+
+from app.core.config import settings
+from app.core.logger import api_logger
+from app.core.metrics import (
+    THIRD_PARTY_QUEUE_WAIT,
+    THIRD_PARTY_CONCURRENCY_LIMIT,
+    THIRD_PARTY_INFLIGHT,
+    THIRD_PARTY_OVERLOAD,
+)
+
+
+# 表示上游过载的状态码
+OVERLOAD_STATUS = (429, 503)
+
+# 过载时并发上限的收缩比例；延迟超过基线时的收缩比例
+OVERLOAD_BACKOFF = 0.5
+LATENCY_BACKOFF = 0.9
+
+# 延迟基线的平滑系数
+LATENCY_ALPHA = 0.05
+
+
+def parse_retry_after(response: httpx.Response) -> Optional[float]:
+    """Retry-After头（秒数形式），缺失或无法解析时返回None"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        return None
+
+
+class TokenBucket:
+    """令牌桶：rate为每秒补充的令牌数，burst为桶容量；rate<=0表示不限速"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """取一个令牌，桶空或暂停时按先来先到等待"""
+        if self.rate <= 0 and self._paused_until <= time.monotonic():
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                if self.rate <= 0:
+                    return
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """上游要求稍后重试：暂停发放令牌并清空积累的令牌"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+        self._updated = self._paused_until
+
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD自适应并发上限"""
+
+    def __init__(self, initial: int, minimum: int, maximum: int, latency_tolerance: float):
+        self.minimum = max(minimum, 1)
+        self.maximum = max(maximum, self.minimum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.latency_tolerance = latency_tolerance
+
+        self.inflight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+        # 成功请求延迟的长期均值，作为判断延迟升高的基线
+        self.baseline_latency: Optional[float] = None
+        self._last_decrease = float("-inf")
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self):
+        """取得并发槽位"""
+        if self.inflight < int(self.limit) and not self._waiters:
+            self.inflight += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 槽位已转交但调用方被取消，归还槽位
+                self._release_slot()
+            elif future in self._waiters:
+                self._waiters.remove(future)
+            raise
+
+    def _release_slot(self):
+        self.inflight -= 1
+        self._wake()
+
+    def _wake(self):
+        """按上限把空出的槽位依次转交给等待者"""
+        while self._waiters and self.inflight < int(self.limit):
+            future = self._waiters.popleft()
+            if not future.done():
+                self.inflight += 1
+                future.set_result(None)
+
+    def release(self, latency: float, overloaded: bool = False, ignore: bool = False) -> Optional[str]:
+        """
+        释放槽位并根据本次请求结果调整上限
+        返回调整方向（"increase" / "decrease"），未调整时返回None
+        """
+        saturated = self.inflight >= int(self.limit) or bool(self._waiters)
+        change = None
+
+        if overloaded:
+            change = self._decrease(OVERLOAD_BACKOFF, latency)
+        elif not ignore:
+            baseline = self.baseline_latency
+            if baseline is not None and latency > baseline * self.latency_tolerance:
+                change = self._decrease(LATENCY_BACKOFF, latency)
+            else:
+                if saturated and self.limit < self.maximum:
+                    # 每轮（约limit个请求）增加1
+                    self.limit = min(self.maximum, self.limit + 1 / self.limit)
+                    change = "increase"
+            self.baseline_latency = latency if baseline is None else (
+                baseline + LATENCY_ALPHA * (latency - baseline)
+            )
+
+        self._release_slot()
+        return change
+
+    def _decrease(self, factor: float, latency: float) -> Optional[str]:
+        """成倍收缩；同一批在途请求（约一个延迟周期内）只收缩一次"""
+        now = time.monotonic()
+        window = self.baseline_latency or latency
+        if now - self._last_decrease < window:
+            return None
+        self._last_decrease = now
+        self.limit = max(self.minimum, self.limit * factor)
+        return "decrease"
+
+
+class EndpointLimiter:
+    """单个接口的限流器：令牌桶 + 自适应并发"""
+
+    def __init__(self, endpoint: str, rate: float):
+        self.endpoint = endpoint
+        self.bucket = TokenBucket(rate, settings.THIRD_PARTY_AI_RATE_BURST)
+        self.concurrency = AdaptiveConcurrencyLimiter(
+            initial=settings.THIRD_PARTY_AI_INITIAL_CONCURRENCY,
+            minimum=settings.THIRD_PARTY_AI_MIN_CONCURRENCY,
+            maximum=settings.THIRD_PARTY_AI_MAX_CONCURRENCY,
+            latency_tolerance=settings.THIRD_PARTY_AI_LATENCY_TOLERANCE
+        )
+        self._stats = {"requests": 0, "overloaded": 0, "increases": 0, "decreases": 0, "queue_wait_total": 0.0}
+        THIRD_PARTY_CONCURRENCY_LIMIT.labels(endpoint=endpoint).set(int(self.concurrency.limit))
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator["_Slot"]:
+        """排队取得并发槽位和令牌，退出时按请求结果调整并发上限"""
+        queued = time.perf_counter()
+        await self.concurrency.acquire()
+        try:
+            await self.bucket.acquire()
+        except BaseException:
+            self.concurrency.release(0.0, ignore=True)
+            raise
+
+        wait = time.perf_counter() - queued
+        self._stats["requests"] += 1
+        self._stats["queue_wait_total"] += wait
+        THIRD_PARTY_QUEUE_WAIT.labels(endpoint=self.endpoint).observe(wait)
+        THIRD_PARTY_INFLIGHT.labels(endpoint=self.endpoint).inc()
+
+        slot = _Slot()
+        started = time.perf_counter()
+        try:
+            yield slot
+        except (httpx.TimeoutException, asyncio.TimeoutError):
+            slot.overload("timeout")
+            raise
+        except BaseException:
+            # 连接错误、本地文件错误、取消等不反映上游负载，不参与调整
+            if slot.reason is None:
+                slot.ignore = True
+            raise
+        finally:
+            THIRD_PARTY_INFLIGHT.labels(endpoint=self.endpoint).dec()
+            self._finish(slot, time.perf_counter() - started)
+
+    def _finish(self, slot: "_Slot", latency: float):
+        if slot.reason is not None:
+            self._stats["overloaded"] += 1
+            THIRD_PARTY_OVERLOAD.labels(endpoint=self.endpoint, reason=slot.reason).inc()
+            if slot.retry_after:
+                self.bucket.pause(slot.retry_after)
+
+        change = self.concurrency.release(latency, overloaded=slot.reason is not None, ignore=slot.ignore)
+        if change is None:
+            return
+        self._stats[f"{change}s"] += 1
+        THIRD_PARTY_CONCURRENCY_LIMIT.labels(endpoint=self.endpoint).set(int(self.concurrency.limit))
+        if change == "decrease":
+            api_logger.warning(
+                "第三方接口并发上限收缩",
+                endpoint=self.endpoint,
+                limit=round(self.concurrency.limit, 2),
+                reason=slot.reason or "latency",
+                latency=round(latency, 3)
+            )
+
+    def get_stats(self) -> Dict[str, Any]:
+        requests = self._stats["requests"]
+        return {
+            "limit": round(self.concurrency.limit, 2),
+            "inflight": self.concurrency.inflight,
+            "waiting": self.concurrency.waiting,
+            "rate": self.bucket.rate,
+            "baseline_latency": round(self.concurrency.baseline_latency, 3)
+            if self.concurrency.baseline_latency is not None else None,
+            "requests": requests,
+            "overloaded": self._stats["overloaded"],
+            "increases": self._stats["increases"],
+            "decreases": self._stats["decreases"],
+            "avg_queue_wait": round(self._stats["queue_wait_total"] / requests, 4) if requests else 0.0,
+        }
+
+
+class _Slot:
+    """一次请求的结果记录"""
+
+    __slots__ = ("reason", "retry_after", "ignore")
+
+    def __init__(self):
+        self.reason: Optional[str] = None
+        self.retry_after: Optional[float] = None
+        self.ignore = False
+
+    def overload(self, reason: str, retry_after: Optional[float] = None):
+        self.reason = reason
+        self.retry_after = retry_after
+
+    def observe(self, response: httpx.Response):
+        """根据响应状态记录结果：429/503视为过载，其余响应计入延迟"""
+        if response.status_code in OVERLOAD_STATUS:
+            self.overload(str(response.status_code), parse_retry_after(response))
+
+
+class ThirdPartyLimiter:
+    """按接口划分的限流器集合，两个第三方客户端共用"""
+
+    def __init__(self):
+        self._limiters: Dict[str, EndpointLimiter] = {}
+
+    def get(self, endpoint: str) -> EndpointLimiter:
+        limiter = self._limiters.get(endpoint)
+        if limiter is None:
+            rate = settings.third_party_rate_limits.get(endpoint, settings.THIRD_PARTY_AI_RATE_LIMIT)
+            limiter = EndpointLimiter(endpoint, rate)
+            self._limiters[endpoint] = limiter
+        return limiter
+
+    def slot(self, endpoint: str):
+        return self.get(endpoint).slot()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {endpoint: limiter.get_stats() for endpoint, limiter in self._limiters.items()}
+
+
+# 全局限流器实例
+third_party_limiter = ThirdPartyLimiter()
+
+
+# 导出
+__all__ = [
+    "TokenBucket",
+    "AdaptiveConcurrencyLimiter",
+    "EndpointLimiter",
+    "ThirdPartyLimiter",
+    "third_party_limiter",
+    "parse_retry_after",
+]
@@ -0,0 +1,186 @@
+"""
+分析任务处理
+执行单个分析任务并写入进度和结果，供队列worker调用
+"""
+
+import hashlib
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+from app.core.logger import analysis_logger
+from app.core.redis import CacheKeys
+from app.services.analysis_progress import set_progress, ProgressTracker
+from app.services.model_manager import model_manager
+
+# 支持的分析类型
+SUPPORTED_ANALYSIS_TYPES = {
+    "intraoral": {
+        "name": "口内照片分析",
+        "description": "分析口内照片，识别牙齿问题和口腔健康状况",
+        "model": "intraoral",
+        "max_file_size": 10 * 1024 * 1024,  # 10MB
+        "supported_formats": ["jpg", "jpeg", "png"]
+    },
+    "facial": {
+        "name": "面相照片分析", 
+        "description": "分析面部照片，检测颌面部发育异常",
+        "model": "facial",
+        "max_file_size": 10 * 1024 * 1024,  # 10MB
+        "supported_formats": ["jpg", "jpeg", "png"]
+    },
+    "cephalometric": {
+        "name": "头侧X光分析",
+        "description": "分析头颅侧位X光片，评估颅颌面结构",
+        "model": "cephalometric",
+        "max_file_size": 20 * 1024 * 1024,  # 20MB
+        "supported_formats": ["jpg", "jpeg", "png", "dcm"]
+    },
+    "panoramic": {
+        "name": "全景X光分析",
+        "description": "分析口腔全景片，全面评估牙齿和颌骨状况",
+        "model": "panoramic", 
+        "max_file_size": 20 * 1024 * 1024,  # 20MB
+        "supported_formats": ["jpg", "jpeg", "png", "dcm"]
+    },
+    "3d": {
+        "name": "3D模型分析",
+        "description": "分析三维模型，精确测量和评估",
+        "model": "3d",
+        "max_file_size": 50 * 1024 * 1024,  # 50MB
+        "supported_formats": ["stl", "obj", "ply"]
+    }
+}
+
+
+async def process_analysis(
+    analysis_id: str,
+    analysis_type: str,
+    image_content: bytes,
+    filename: str,
+    options: Dict[str, Any],
+    batch_id: Optional[str] = None,
+    content_hash: Optional[str] = None
+):
+    """
+    执行分析任务（由队列worker调用）
+    content_hash: 上传时已计算的内容sha256
+    """
+    start_time = datetime.now()
+    
+    # 中间进度合并写入，只写变化的字段
+    tracker = ProgressTracker(analysis_id, batch_id=batch_id)
+    
+    try:
+        # 更新进度: 开始处理
+        tracker.update({
+            "status": "processing",
+            "progress": 10,
+            "message": "正在加载图像...",
+            "started_at": start_time.isoformat()
+        })
+        
+        # 更新进度: 图像预处理
+        tracker.update({
+            "progress": 30,
+            "message": "正在进行AI分析..."
+        })
+        
+        # 执行AI分析：相同图像命中推理结果缓存时跳过解码和推理，
+        # 并发的相同请求（含其他worker）由推理结果缓存合并为同一次计算
+        model_name = SUPPORTED_ANALYSIS_TYPES[analysis_type]["model"]
+        content_hash = content_hash or hashlib.sha256(image_content).hexdigest()
+        results, image_size = await model_manager.inference_from_bytes(
+            model_name, image_content, content_hash=content_hash
+        )
+        
+        # 更新进度: 处理结果
+        tracker.update({
+            "progress": 80,
+            "message": "正在生成报告..."
+        })
+        
+        # 计算处理时间
+        processing_time = (datetime.now() - start_time).total_seconds()
+        
+        # 添加分析元数据
+        final_results = {
+            **results,
+            "analysis_metadata": {
+                "analysis_id": analysis_id,
+                "filename": filename,
+                "file_size": len(image_content),
+                "image_size": image_size,
+                "processing_time": processing_time,
+                "options": options,
+                "completed_at": datetime.now().isoformat()
+            }
+        }
+        
+        # 保存最终结果并更新最终状态（同一事务）
+        await tracker.complete(
+            {
+                "status": "completed",
+                "progress": 100,
+                "message": "分析完成",
+                "completed_at": datetime.now().isoformat(),
+                "processing_time": processing_time
+            },
+            result_key=CacheKeys.format_key(CacheKeys.ANALYSIS_RESULT, analysis_id=analysis_id),
+            result=final_results,
+            result_ttl=7 * 24 * 3600  # 保存7天
+        )
+        
+        # 记录分析完成
+        analysis_logger.analysis_complete(
+            analysis_id=analysis_id,
+            analysis_type=analysis_type,
+            duration=processing_time,
+            confidence=results.get("confidence", 0.0),
+            results={"summary": "analysis_completed"}
+        )
+        
+    except Exception as e:
+        # 记录错误
+        error_message = str(e)
+        processing_time = (datetime.now() - start_time).total_seconds()
+        
+        analysis_logger.analysis_error(
+            analysis_id=analysis_id,
+            analysis_type=analysis_type,
+            error=error_message,
+            duration=processing_time
+        )
+        
+        # 保存错误状态
+        await mark_analysis_failed(analysis_id, error_message, started_at=start_time, tracker=tracker)
+    
+    finally:
+        # 超时取消时丢弃未写出的中间进度，避免覆盖随后写入的失败状态
+        tracker.close()
+
+
+async def mark_analysis_failed(analysis_id: str, error_message: str,
+                               started_at: Optional[datetime] = None,
+                               tracker: Optional[ProgressTracker] = None,
+                               batch_id: Optional[str] = None):
+    """写入分析失败状态"""
+    status_data = {
+        "status": "failed",
+        "progress": 0,
+        "message": f"分析失败: {error_message}",
+        "error": error_message,
+        "started_at": started_at.isoformat() if started_at else None,
+        "failed_at": datetime.now().isoformat()
+    }
+    if tracker is not None:
+        await tracker.fail(status_data)
+    else:
+        await set_progress(analysis_id, status_data, batch_id=batch_id)
+
+
+# 导出
+__all__ = [
+    "SUPPORTED_ANALYSIS_TYPES",
+    "process_analysis",
+    "mark_analysis_failed",
+]
@@ -0,0 +1,415 @@
+"""
+分析进度写入与推送
+- 进度以Hash保存，只写入变化的字段；连续的中间进度合并写入，最终状态与结果在同一事务中写入
+- 每次写入同时发布到该分析任务的频道
+- 批量任务中的分析结束时在同一事务中更新批量计数，查询批量整体进度只需一次读取
+- 每个web进程只保持一个订阅连接，按需订阅/退订频道，再分发给各个SSE/WebSocket连接
+- 一个客户端连接可以同时跟踪多个分析任务；发送不及时时每个任务只保留最新进度
+"""
+
+import json
+import asyncio
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.core.logger import api_logger
+from app.core.redis import redis_manager, CacheKeys
+
+
+# 进度状态保留时间（秒）
+PROGRESS_TTL = 3600
+
+# 批量任务信息和计数保留时间（秒）
+BATCH_TTL = 24 * 3600
+
+# 到达后不再有后续进度的状态
+TERMINAL_STATUSES = {"completed", "failed", "not_found"}
+
+# 计入批量任务计数的最终状态
+BATCH_OUTCOMES = ("completed", "failed")
+
+
+def progress_key(analysis_id: str) -> str:
+    """分析进度的存储键"""
+    return CacheKeys.format_key(CacheKeys.ANALYSIS_PROGRESS, analysis_id=analysis_id)
+
+
+def progress_channel(analysis_id: str) -> str:
+    """分析进度的发布频道"""
+    return CacheKeys.format_key(CacheKeys.ANALYSIS_PROGRESS_CHANNEL, analysis_id=analysis_id)
+
+
+def batch_counters_key(batch_id: str) -> str:
+    """批量任务计数Hash的存储键"""
+    return CacheKeys.format_key(CacheKeys.BATCH_COUNTERS, batch_id=batch_id)
+
+
+def _batch_counter(analysis_id: str, batch_id: Optional[str],
+                   status_data: Dict[str, Any]) -> Optional[Tuple[str, str, str]]:
+    """分析任务到达最终状态时对应的批量计数操作"""
+    status = status_data.get("status")
+    if not batch_id or status not in BATCH_OUTCOMES:
+        return None
+    return (batch_counters_key(batch_id), analysis_id, status)
+
+
+def progress_event(analysis_id: str, status_data: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """推送给客户端的进度事件"""
+    if not status_data:
+        return {"analysis_id": analysis_id, "status": "not_found", "message": "分析任务不存在或已过期"}
+    return {"analysis_id": analysis_id, **status_data}
+
+
+async def get_progress(analysis_id: str) -> Optional[Dict[str, Any]]:
+    """读取分析进度"""
+    return await redis_manager.get_progress(progress_key(analysis_id))
+
+
+async def get_progress_many(analysis_ids: List[str]) -> List[Optional[Dict[str, Any]]]:
+    """批量读取分析进度"""
+    return await redis_manager.get_progress_many([progress_key(i) for i in analysis_ids])
+
+
+async def set_progress(analysis_id: str, status_data: Dict[str, Any],
+                       batch_id: Optional[str] = None) -> bool:
+    """整体替换分析进度并通知订阅者；属于批量任务时同时更新批量计数"""
+    return await redis_manager.update_progress(
+        progress_key(analysis_id),
+        status_data,
+        PROGRESS_TTL,
+        channel=progress_channel(analysis_id),
+        event=progress_event(analysis_id, status_data),
+        replace=True,
+        counter=_batch_counter(analysis_id, batch_id, status_data)
+    )
+
+
+async def init_batch_counters(batch_id: str, total: int) -> bool:
+    """创建批量任务计数，worker在分析结束时递增 completed / failed"""
+    return await redis_manager.hset(
+        batch_counters_key(batch_id),
+        {"total": total, "completed": 0, "failed": 0},
+        ttl=BATCH_TTL
+    )
+
+
+async def get_batch_counters(batch_id: str) -> Dict[str, Optional[int]]:
+    """读取批量任务计数，与批量大小无关的一次读取"""
+    return await redis_manager.get_counters(batch_counters_key(batch_id), ["total", "completed", "failed"])
+
+
+class ProgressTracker:
+    """
+    单个分析任务的进度写入器
+    - 只写入与上次写入相比变化的字段
+    - PROGRESS_COALESCE_MS 内的连续中间进度合并为一次写入，完成前未写出的进度并入最终事务
+    """
+
+    def __init__(self, analysis_id: str, batch_id: Optional[str] = None):
+        self.analysis_id = analysis_id
+        self.batch_id = batch_id
+        self.interval = settings.PROGRESS_COALESCE_MS / 1000
+
+        self._state: Dict[str, Any] = {}
+        self._written: Dict[str, Any] = {}
+        self._timer: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+        self.writes = 0
+
+    def _changes(self) -> Dict[str, Any]:
+        return {
+            key: value for key, value in self._state.items()
+            if key not in self._written or self._written[key] != value
+        }
+
+    def update(self, fields: Dict[str, Any]):
+        """更新中间进度，延迟合并写入"""
+        self._state.update(fields)
+        if self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.interval)
+        self._timer = None
+        await self._write()
+
+    async def _write(self) -> bool:
+        async with self._lock:
+            changes = self._changes()
+            if not changes:
+                return True
+            written = await redis_manager.update_progress(
+                progress_key(self.analysis_id),
+                changes,
+                PROGRESS_TTL,
+                channel=progress_channel(self.analysis_id),
+                event=progress_event(self.analysis_id, self._state),
+                counter=_batch_counter(self.analysis_id, self.batch_id, changes)
+            )
+            if written:
+                self._written.update(changes)
+                self.writes += 1
+            return written
+
+    def close(self):
+        """丢弃尚未写出的中间进度（任务取消或结束时调用）"""
+        if self._timer is not None and not self._timer.done():
+            self._timer.cancel()
+        self._timer = None
+
+    async def complete(self, fields: Dict[str, Any], result_key: str, result: Any, result_ttl: int) -> bool:
+        """在同一事务中写入最终结果和最终状态"""
+        self.close()
+        self._state.update(fields)
+        async with self._lock:
+            changes = self._changes()
+            written = await redis_manager.complete_progress(
+                progress_key(self.analysis_id),
+                changes,
+                PROGRESS_TTL,
+                result_key,
+                result,
+                result_ttl,
+                channel=progress_channel(self.analysis_id),
+                event=progress_event(self.analysis_id, self._state),
+                counter=_batch_counter(self.analysis_id, self.batch_id, self._state)
+            )
+            if written:
+                self._written.update(changes)
+                self.writes += 1
+            return written
+
+    async def fail(self, fields: Dict[str, Any]) -> bool:
+        """立即写入失败状态"""
+        self.close()
+        self._state.update(fields)
+        return await self._write()
+
+
+class ProgressSubscription:
+    """单个客户端连接的进度订阅"""
+
+    def __init__(self, broker: "ProgressBroker"):
+        self._broker = broker
+        self.analysis_ids: Set[str] = set()
+
+        # 待发送事件，按分析任务合并
+        self._pending: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._ready = asyncio.Event()
+        self.closed = False
+
+    async def follow(self, analysis_ids: Iterable[str]) -> List[str]:
+        """开始跟踪分析任务并推送其当前状态，返回新增的ID"""
+        new_ids = [i for i in dict.fromkeys(analysis_ids) if i and i not in self.analysis_ids]
+        if len(self.analysis_ids) + len(new_ids) > settings.PROGRESS_STREAM_MAX_IDS:
+            raise ValueError(f"单个连接最多跟踪 {settings.PROGRESS_STREAM_MAX_IDS} 个分析任务")
+        if not new_ids:
+            return []
+
+        self.analysis_ids.update(new_ids)
+        await self._broker._add(self, new_ids)
+
+        # 先订阅再读取当前状态，避免错过两者之间发布的进度
+        snapshots = await get_progress_many(new_ids)
+        for analysis_id, status_data in zip(new_ids, snapshots):
+            self.push(progress_event(analysis_id, status_data))
+        return new_ids
+
+    async def unfollow(self, analysis_ids: Iterable[str]):
+        """停止跟踪分析任务"""
+        removed = [i for i in analysis_ids if i in self.analysis_ids]
+        if not removed:
+            return
+        self.analysis_ids.difference_update(removed)
+        for analysis_id in removed:
+            self._pending.pop(analysis_id, None)
+        await self._broker._remove(self, removed)
+
+    def push(self, event: Dict[str, Any]):
+        """加入待发送事件；同一任务未发送的旧进度被新进度覆盖"""
+        analysis_id = event.get("analysis_id")
+        if analysis_id not in self.analysis_ids:
+            return
+        self._pending.pop(analysis_id, None)
+        self._pending[analysis_id] = event
+        self._ready.set()
+
+    def wake(self):
+        """唤醒正在等待事件的调用方（连接断开时使用）"""
+        self._ready.set()
+
+    async def next_events(self, timeout: float) -> List[Dict[str, Any]]:
+        """
+        等待并取出待发送事件，超时返回空列表
+        已结束（完成/失败/不存在）的任务随之停止跟踪
+        """
+        if not self._pending:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+
+        events = list(self._pending.values())
+        self._pending.clear()
+
+        finished = [e["analysis_id"] for e in events if e.get("status") in TERMINAL_STATUSES]
+        if finished:
+            await self.unfollow(finished)
+        return events
+
+    async def close(self):
+        """停止跟踪全部任务"""
+        if self.closed:
+            return
+        self.closed = True
+        await self.unfollow(list(self.analysis_ids))
+
+
+class ProgressBroker:
+    """进程级进度订阅分发器"""
+
+    def __init__(self):
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+        self._subscribers: Dict[str, Set[ProgressSubscription]] = {}
+
+        self.delivered = 0
+        self.reconnects = 0
+
+    def subscribe(self) -> ProgressSubscription:
+        """为客户端连接创建订阅，使用完毕后需调用 close()"""
+        return ProgressSubscription(self)
+
+    async def _add(self, subscription: ProgressSubscription, analysis_ids: List[str]):
+        channels = []
+        for analysis_id in analysis_ids:
+            subscribers = self._subscribers.setdefault(analysis_id, set())
+            if not subscribers:
+                channels.append(progress_channel(analysis_id))
+            subscribers.add(subscription)
+
+        if channels:
+            if self._pubsub is None:
+                self._pubsub = redis_manager.pubsub()
+            await self._pubsub.subscribe(*channels)
+            if self._listener is None or self._listener.done():
+                self._listener = asyncio.create_task(self._listen())
+
+    async def _remove(self, subscription: ProgressSubscription, analysis_ids: List[str]):
+        channels = []
+        for analysis_id in analysis_ids:
+            subscribers = self._subscribers.get(analysis_id)
+            if subscribers is None:
+                continue
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[analysis_id]
+                channels.append(progress_channel(analysis_id))
+
+        if channels and self._pubsub is not None:
+            try:
+                await self._pubsub.unsubscribe(*channels)
+            except Exception as e:
+                api_logger.debug("退订进度频道失败", error=str(e))
+
+    async def _listen(self):
+        """接收进度消息并分发；连接异常时重建订阅并补发当前状态"""
+        while True:
+            try:
+                if not self._pubsub.subscribed:
+                    await asyncio.sleep(1.0)
+                    continue
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                api_logger.warning("进度订阅连接异常，正在重连", error=str(e))
+                await asyncio.sleep(1.0)
+                await self._reconnect()
+                continue
+
+            if message is not None:
+                self._dispatch(message["data"])
+
+    def _dispatch(self, data: Any):
+        try:
+            event = json.loads(data)
+        except (TypeError, ValueError):
+            return
+        for subscription in list(self._subscribers.get(event.get("analysis_id"), ())):
+            subscription.push(event)
+            self.delivered += 1
+
+    async def _reconnect(self):
+        old_pubsub, self._pubsub = self._pubsub, redis_manager.pubsub()
+        self.reconnects += 1
+        try:
+            await old_pubsub.reset()
+        except Exception:
+            pass
+
+        analysis_ids = list(self._subscribers)
+        if not analysis_ids:
+            return
+        try:
+            await self._pubsub.subscribe(*[progress_channel(i) for i in analysis_ids])
+            # 断线期间发布的进度已丢失，补发当前状态
+            snapshots = await get_progress_many(analysis_ids)
+            for analysis_id, status_data in zip(analysis_ids, snapshots):
+                event = progress_event(analysis_id, status_data)
+                for subscription in list(self._subscribers.get(analysis_id, ())):
+                    subscription.push(event)
+        except Exception as e:
+            api_logger.error("重建进度订阅失败", error=str(e))
+
+    async def close(self):
+        """关闭订阅连接（服务关闭时调用）"""
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+        if self._pubsub is not None:
+            try:
+                await self._pubsub.reset()
+            except Exception as e:
+                api_logger.debug("关闭进度订阅连接失败", error=str(e))
+            self._pubsub = None
+        for subscriptions in self._subscribers.values():
+            for subscription in subscriptions:
+                subscription.wake()
+        self._subscribers.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """订阅统计"""
+        connections = set()
+        for subscriptions in self._subscribers.values():
+            connections.update(subscriptions)
+        return {
+            "channels": len(self._subscribers),
+            "connections": len(connections),
+            "delivered": self.delivered,
+            "reconnects": self.reconnects,
+        }
+
+
+# 全局进度分发器实例
+progress_broker = ProgressBroker()
+
+# 导出
+__all__ = [
+    "BATCH_TTL",
+    "TERMINAL_STATUSES",
+    "get_progress",
+    "get_progress_many",
+    "set_progress",
+    "init_batch_counters",
+    "get_batch_counters",
+    "ProgressTracker",
+    "progress_event",
+    "ProgressSubscription",
+    "ProgressBroker",
+    "progress_broker",
+]
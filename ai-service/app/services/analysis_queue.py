@@ -0,0 +1,469 @@
+"""
+分析任务队列
+基于Redis Streams的持久化任务队列：
+- API节点将上传内容存放到 ANALYSIS_PAYLOAD_DIR（API节点与worker共享的目录），
+  向 ANALYSIS_QUEUE 追加只包含分析ID的任务，不在web进程内执行分析；上传内容不经过Redis
+- worker以消费者组方式拉取任务，同时执行的分析数受 MAX_CONCURRENT_ANALYSES 限制，完成后确认并删除
+- 一条消息可以包含一组分析（流式批量导入按模型批大小打包），组内每项分析各占一个并发槽位，
+  取得槽位后才读取上传内容；拉取量按空闲的分析名额计算，而不是消息数；
+  同时执行的分析由推理批处理合并为一次前向计算；处理中的消息定期刷新空闲时间
+- worker崩溃或卡死时，超过 ANALYSIS_TIMEOUT 未确认的任务由其他worker接管；
+  投递次数超过 MAX_ANALYSIS_RETRIES 的任务标记为失败
+- 超过 ANALYSIS_JOB_TTL 仍未处理的上传内容由worker定期清理
+"""
+
+import os
+import json
+import time
+import shutil
+import socket
+import asyncio
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
+
+import aiofiles
+
+from app.core.config import settings
+from app.core.logger import analysis_logger
+from app.core.redis import redis_manager, CacheKeys
+from app.services.analysis_processor import (
+    SUPPORTED_ANALYSIS_TYPES, process_analysis, mark_analysis_failed
+)
+from app.services.analysis_progress import get_progress_many, BATCH_OUTCOMES
+
+
+# 两次清理过期上传内容的最小间隔（秒）
+PAYLOAD_PRUNE_INTERVAL = 600
+
+
+class QueueUnavailableError(RuntimeError):
+    """任务无法写入队列"""
+
+
+def stream_key(analysis_type: str) -> str:
+    """分析类型对应的任务流"""
+    return CacheKeys.format_key(CacheKeys.ANALYSIS_QUEUE, analysis_type=analysis_type)
+
+
+def payload_path(analysis_id: str) -> str:
+    """任务上传内容的存放路径（上传时可直接落盘到该路径）"""
+    return os.path.join(settings.ANALYSIS_PAYLOAD_DIR, analysis_id)
+
+
+async def store_payload(analysis_id: str, content: Union[bytes, memoryview, None] = None,
+                        source_path: Optional[str] = None) -> str:
+    """
+    存放任务上传内容：source_path 为已落盘的文件时直接移入（同一文件系统内只是重命名），
+    否则写入 content；先写临时文件再替换，worker不会读到不完整的内容
+    """
+    path = payload_path(analysis_id)
+    if source_path is not None:
+        await asyncio.get_running_loop().run_in_executor(None, shutil.move, source_path, path)
+        return path
+
+    partial_path = f"{path}.part"
+    try:
+        async with aiofiles.open(partial_path, "wb") as f:
+            await f.write(content)
+        os.replace(partial_path, path)
+    except BaseException:
+        try:
+            os.remove(partial_path)
+        except FileNotFoundError:
+            pass
+        raise
+    return path
+
+
+async def read_payload(analysis_id: str) -> Optional[bytes]:
+    """读取任务上传内容，已过期清理或不存在时返回None"""
+    try:
+        async with aiofiles.open(payload_path(analysis_id), "rb") as f:
+            return await f.read()
+    except FileNotFoundError:
+        return None
+
+
+def discard_payloads(analysis_ids: List[str]):
+    """删除任务上传内容"""
+    for analysis_id in analysis_ids:
+        try:
+            os.remove(payload_path(analysis_id))
+        except FileNotFoundError:
+            pass
+
+
+def prune_payloads(max_age: int) -> int:
+    """删除超过 max_age 秒仍未处理的上传内容（生产者异常退出等遗留），返回删除的文件数"""
+    cutoff = time.time() - max_age
+    removed = 0
+    with os.scandir(settings.ANALYSIS_PAYLOAD_DIR) as entries:
+        for entry in entries:
+            try:
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+            except FileNotFoundError:
+                continue
+    return removed
+
+
+def job_items(fields: Dict[str, str]) -> List[Dict[str, str]]:
+    """消息包含的分析任务 [{"analysis_id", "filename", "content_hash"?}]"""
+    if "items" in fields:
+        return json.loads(fields["items"])
+    item = {"analysis_id": fields.get("analysis_id", ""), "filename": fields.get("filename", "")}
+    if fields.get("content_hash"):
+        item["content_hash"] = fields["content_hash"]
+    return [item]
+
+
+class AnalysisQueue:
+    """分析任务队列（生产者）"""
+
+    def __init__(self, group: Optional[str] = None):
+        self.group = group or settings.ANALYSIS_QUEUE_GROUP
+        self._groups_ready: Set[str] = set()
+
+    async def _ensure_group(self, stream: str):
+        if stream not in self._groups_ready and await redis_manager.ensure_stream_group(stream, self.group):
+            self._groups_ready.add(stream)
+
+    async def enqueue(self, analysis_id: str, analysis_type: str, filename: str, options: Dict[str, Any],
+                      batch_id: Optional[str] = None, content_hash: Optional[str] = None) -> str:
+        """
+        追加任务，返回消息ID；上传内容须已存放在 payload_path(analysis_id)
+        content_hash 为上传时已计算的sha256，worker不再重复计算
+        """
+        fields = {
+            "analysis_id": analysis_id,
+            "filename": filename,
+        }
+        if content_hash:
+            fields["content_hash"] = content_hash
+        return await self._enqueue(analysis_type, fields, [analysis_id], options, batch_id)
+
+    async def enqueue_group(self, analysis_type: str, items: List[Tuple[str, str]],
+                            options: Dict[str, Any], batch_id: Optional[str] = None) -> str:
+        """
+        将一组分析 [(analysis_id, filename)] 作为一条消息入队，上传内容须已存放
+        worker并发执行组内分析（每项占用一个并发槽位），组大小通常等于模型批大小
+        """
+        fields = {
+            "items": json.dumps(
+                [{"analysis_id": analysis_id, "filename": filename} for analysis_id, filename in items],
+                ensure_ascii=False
+            ),
+        }
+        return await self._enqueue(analysis_type, fields, [analysis_id for analysis_id, _ in items],
+                                   options, batch_id)
+
+    async def _enqueue(self, analysis_type: str, fields: Dict[str, str], analysis_ids: List[str],
+                       options: Dict[str, Any], batch_id: Optional[str]) -> str:
+        stream = stream_key(analysis_type)
+        await self._ensure_group(stream)
+
+        fields = {
+            **fields,
+            "analysis_type": analysis_type,
+            "options": json.dumps(options, ensure_ascii=False),
+            "enqueued_at": datetime.now().isoformat(),
+        }
+        if batch_id:
+            fields["batch_id"] = batch_id
+
+        try:
+            message_id = await redis_manager.client.xadd(stream, fields)
+        except Exception as e:
+            # 未入队的上传内容不会再被读取
+            discard_payloads(analysis_ids)
+            analysis_logger.error("分析任务入队失败", analysis_ids=analysis_ids, error=str(e))
+            raise QueueUnavailableError(str(e)) from e
+
+        message_id = message_id.decode("utf-8") if isinstance(message_id, bytes) else message_id
+        analysis_logger.debug("分析任务已入队", analysis_ids=analysis_ids, stream=stream, message_id=message_id)
+        return message_id
+
+    async def get_stats(self) -> Dict[str, Any]:
+        """各分析类型的积压量和待确认数"""
+        stats = {}
+        for analysis_type in SUPPORTED_ANALYSIS_TYPES:
+            stream = stream_key(analysis_type)
+            await self._ensure_group(stream)
+            stats[analysis_type] = await redis_manager.stream_stats(stream, self.group)
+        return stats
+
+
+class AnalysisWorker:
+    """分析任务消费者"""
+
+    def __init__(self, analysis_types: Optional[List[str]] = None, concurrency: Optional[int] = None,
+                 consumer_name: Optional[str] = None, group: Optional[str] = None):
+        self.analysis_types = analysis_types or list(SUPPORTED_ANALYSIS_TYPES)
+        self.streams = [stream_key(analysis_type) for analysis_type in self.analysis_types]
+        self.concurrency = max(1, concurrency or settings.MAX_CONCURRENT_ANALYSES)
+        self.consumer_name = consumer_name or f"{socket.gethostname()}-{os.getpid()}"
+        self.group = group or settings.ANALYSIS_QUEUE_GROUP
+
+        # 超过分析超时仍未确认的任务视为worker已失效
+        self.reclaim_idle_ms = (settings.ANALYSIS_TIMEOUT + settings.ANALYSIS_RECLAIM_GRACE) * 1000
+
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._tasks: Set[asyncio.Task] = set()
+        # 已拉取、尚未结束的分析数（分组消息按组内分析数计），不超过并发数时才继续拉取
+        self._pending_items = 0
+        self._item_done = asyncio.Event()
+        # 处理中的消息：message_id -> stream
+        self._active: Dict[str, str] = {}
+        self._stopping = asyncio.Event()
+        self._last_prune = 0.0
+
+        self.processed = 0
+        self.failed = 0
+        self.reclaimed = 0
+
+    async def run(self):
+        """拉取并处理任务，直到调用 stop()"""
+        for stream in self.streams:
+            await redis_manager.ensure_stream_group(stream, self.group)
+
+        analysis_logger.info(
+            "分析队列worker已启动",
+            consumer=self.consumer_name,
+            streams=self.streams,
+            concurrency=self.concurrency
+        )
+
+        reclaim_task = asyncio.create_task(self._reclaim_loop())
+        try:
+            while not self._stopping.is_set():
+                # 分析名额已满时等待任意分析结束，不再拉取新任务
+                free = self.concurrency - self._pending_items
+                if free <= 0:
+                    self._item_done.clear()
+                    await self._item_done.wait()
+                    continue
+
+                messages = await redis_manager.xreadgroup(
+                    self.group,
+                    self.consumer_name,
+                    {stream: ">" for stream in self.streams},
+                    count=self._read_count(free),
+                    block_ms=settings.ANALYSIS_QUEUE_BLOCK_MS
+                )
+                for stream, message_id, fields in messages:
+                    self._spawn(stream, message_id, fields)
+        finally:
+            reclaim_task.cancel()
+            await asyncio.gather(reclaim_task, return_exceptions=True)
+            await self._drain()
+
+    def stop(self):
+        """停止拉取新任务；执行中的任务完成后 run() 返回"""
+        self._stopping.set()
+
+    async def _drain(self):
+        """等待执行中的任务完成，超时未完成的任务保持未确认，由其他worker接管"""
+        if not self._tasks:
+            return
+        analysis_logger.info("等待执行中的分析任务完成", count=len(self._tasks))
+        _, pending = await asyncio.wait(self._tasks, timeout=settings.ANALYSIS_TIMEOUT)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    @staticmethod
+    def _read_count(free: int) -> int:
+        """按空闲分析名额计算拉取的消息数：分组消息最多包含 BATCH_SIZE 项分析"""
+        return max(1, free // max(1, settings.BATCH_SIZE))
+
+    def _release_items(self, count: int):
+        if count:
+            self._pending_items -= count
+            self._item_done.set()
+
+    def _spawn(self, stream: str, message_id: str, fields: Dict[str, str], redelivered: bool = False):
+        self._pending_items += len(job_items(fields))
+        task = asyncio.create_task(self._handle(stream, message_id, fields, redelivered))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _handle(self, stream: str, message_id: str, fields: Dict[str, str], redelivered: bool = False):
+        """执行消息中的任务；成功或确定失败后确认，worker关闭导致的取消不确认"""
+        items = job_items(fields)
+        analysis_ids = [item["analysis_id"] for item in items]
+        self._active[message_id] = stream
+        # 尚未交给 _run_item 释放的分析名额
+        unreleased = len(items)
+        try:
+            pending = await self._unfinished(items) if redelivered else items
+            self._release_items(len(items) - len(pending))
+            unreleased = 0
+            # 并发按分析数计算：分组消息中的各项分别占用槽位，取得槽位后再读取内容
+            # 等待组内全部分析结束后再决定是否确认：提前返回会停止刷新空闲时间，
+            # 仍在执行的分析可能被其他worker接管后重复执行
+            results = await asyncio.gather(
+                *[self._run_item(fields, item) for item in pending], return_exceptions=True
+            )
+            errors = [result for result in results if isinstance(result, BaseException)]
+            if errors:
+                # 保持未确认，重新投递时只执行未结束的分析
+                analysis_logger.error("分析任务部分执行异常", analysis_ids=analysis_ids, message_id=message_id,
+                                      failed=len(errors), error=str(errors[0]))
+                return
+
+            await redis_manager.xack_delete(stream, self.group, message_id)
+            discard_payloads(analysis_ids)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Redis异常等：保持未确认，超时后重新投递
+            analysis_logger.error("分析任务处理异常", analysis_ids=analysis_ids,
+                                  message_id=message_id, error=str(e))
+        finally:
+            self._release_items(unreleased)
+            self._active.pop(message_id, None)
+
+    async def _unfinished(self, items: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """重新投递的消息中尚未结束的分析（上次投递中已完成的不再重复执行）"""
+        statuses = await get_progress_many([item["analysis_id"] for item in items])
+        return [
+            item for item, status_data in zip(items, statuses)
+            if not status_data or status_data.get("status") not in BATCH_OUTCOMES
+        ]
+
+    async def _run_item(self, fields: Dict[str, str], item: Dict[str, str]):
+        analysis_id = item["analysis_id"]
+        batch_id = fields.get("batch_id")
+
+        try:
+            async with self._semaphore:
+                content = await read_payload(analysis_id)
+                if content is None:
+                    await mark_analysis_failed(analysis_id, "上传内容已过期或不存在", batch_id=batch_id)
+                    self.failed += 1
+                    return
+
+                await asyncio.wait_for(
+                    process_analysis(
+                        analysis_id,
+                        fields["analysis_type"],
+                        content,
+                        item.get("filename", ""),
+                        json.loads(fields.get("options") or "{}"),
+                        batch_id=batch_id,
+                        content_hash=item.get("content_hash")
+                    ),
+                    timeout=settings.ANALYSIS_TIMEOUT
+                )
+            self.processed += 1
+        except asyncio.TimeoutError:
+            await mark_analysis_failed(analysis_id, f"分析超时（{settings.ANALYSIS_TIMEOUT}秒）",
+                                       batch_id=batch_id)
+            self.failed += 1
+        finally:
+            self._release_items(1)
+
+    async def _reclaim_loop(self):
+        """定期接管其他（已失效）worker名下超时未确认的任务"""
+        while True:
+            await asyncio.sleep(settings.ANALYSIS_RECLAIM_INTERVAL)
+            try:
+                await self._keepalive()
+                for stream in self.streams:
+                    await self._reclaim(stream)
+                await self._prune_payloads()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                analysis_logger.error("接管超时任务失败", error=str(e))
+
+    async def _keepalive(self):
+        """
+        刷新处理中消息的空闲时间：分组消息中的各项按并发槽位排队执行，
+        整条消息的处理时间可能超过 ANALYSIS_TIMEOUT，不应被其他worker当作失效任务接管
+        """
+        by_stream: Dict[str, List[str]] = {}
+        for message_id, stream in list(self._active.items()):
+            by_stream.setdefault(stream, []).append(message_id)
+        for stream, message_ids in by_stream.items():
+            await redis_manager.touch_pending(stream, self.group, self.consumer_name, message_ids)
+
+    async def _prune_payloads(self):
+        """定期清理超过 ANALYSIS_JOB_TTL 仍未处理的上传内容"""
+        if time.monotonic() - self._last_prune < PAYLOAD_PRUNE_INTERVAL:
+            return
+        self._last_prune = time.monotonic()
+        removed = await asyncio.get_running_loop().run_in_executor(
+            None, prune_payloads, settings.ANALYSIS_JOB_TTL
+        )
+        if removed:
+            analysis_logger.info("已清理过期的待分析上传内容", removed=removed)
+
+    async def _reclaim(self, stream: str):
+        free = self.concurrency - self._pending_items
+        if free <= 0:
+            return
+
+        entries = await redis_manager.xpending_idle(
+            stream, self.group, self.reclaim_idle_ms, count=self._read_count(free)
+        )
+        entries = [entry for entry in entries if entry["message_id"] not in self._active]
+        if not entries:
+            return
+
+        claimed = await redis_manager.xclaim(
+            stream, self.group, self.consumer_name, self.reclaim_idle_ms,
+            [entry["message_id"] for entry in entries]
+        )
+        deliveries = {entry["message_id"]: entry["times_delivered"] for entry in entries}
+
+        for message_id, fields in claimed:
+            items = job_items(fields)
+            analysis_ids = [item["analysis_id"] for item in items]
+            if deliveries.get(message_id, 0) > settings.MAX_ANALYSIS_RETRIES:
+                # 多次投递仍未完成，不再重试
+                analysis_logger.warning("分析任务超过最大重试次数", analysis_ids=analysis_ids,
+                                        message_id=message_id, deliveries=deliveries.get(message_id))
+                unfinished = await self._unfinished(items)
+                for item in unfinished:
+                    await mark_analysis_failed(item["analysis_id"], "分析任务多次执行超时，已放弃",
+                                               batch_id=fields.get("batch_id"))
+                await redis_manager.xack_delete(stream, self.group, message_id)
+                discard_payloads(analysis_ids)
+                self.failed += len(unfinished)
+                continue
+
+            analysis_logger.info("接管超时未确认的分析任务", analysis_ids=analysis_ids,
+                                 message_id=message_id, deliveries=deliveries.get(message_id))
+            self.reclaimed += 1
+            self._spawn(stream, message_id, fields, redelivered=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """worker运行统计"""
+        return {
+            "consumer": self.consumer_name,
+            "concurrency": self.concurrency,
+            "running": len(self._tasks),
+            "pending_items": self._pending_items,
+            "processed": self.processed,
+            "failed": self.failed,
+            "reclaimed": self.reclaimed,
+        }
+
+
+# 全局分析队列实例
+analysis_queue = AnalysisQueue()
+
+# 导出
+__all__ = [
+    "AnalysisQueue",
+    "AnalysisWorker",
+    "QueueUnavailableError",
+    "job_items",
+    "payload_path",
+    "store_payload",
+    "read_payload",
+    "discard_payloads",
+    "analysis_queue",
+]
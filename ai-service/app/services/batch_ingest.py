@@ -0,0 +1,578 @@
+"""
+流式批量导入
+学校筛查等场景一次上传数百张照片：
+- 接收 multipart 流或 tar/zip 归档，上传内容边接收边写入磁盘，不整体读入内存
+- 文件按模型批大小打包为一条队列消息，worker同时执行组内分析，由推理批处理合并为一次前向计算
+- 已入队未完成的分析数受 STREAM_BATCH_MAX_INFLIGHT 限制，超出时暂停读取上传内容（反压至上传连接）
+- 每个文件的接收、拒绝和结果在发生时写入Redis记录流（与上传请求无关）：
+  先通过 open_batch_session 取得批量任务ID并订阅 /batch/{batch_id}/events，上传期间即可收到先完成的结果；
+  上传响应在接收完毕后以 NDJSON 从头返回同一记录流
+"""
+
+import os
+import json
+import uuid
+import asyncio
+import tarfile
+import zipfile
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+import aiofiles
+from multipart.multipart import MultipartParser, parse_options_header
+from starlette.requests import Request
+
+from app.core.config import settings
+from app.core.logger import analysis_logger
+from app.core.redis import redis_manager, cache_get, cache_set, CacheKeys
+from app.services.analysis_processor import SUPPORTED_ANALYSIS_TYPES
+from app.services.analysis_queue import (
+    analysis_queue, store_payload, discard_payloads, QueueUnavailableError
+)
+from app.services.upload_spool import UploadTooLargeError
+from app.services.analysis_progress import (
+    BATCH_TTL, TERMINAL_STATUSES, set_progress, init_batch_counters, batch_counters_key, progress_broker
+)
+
+
+# 归档格式 -> 对应的 Content-Type
+ARCHIVE_CONTENT_TYPES = {
+    "tar": ("application/x-tar", "application/gzip", "application/x-gzip", "application/x-gtar"),
+    "zip": ("application/zip", "application/x-zip-compressed"),
+}
+
+
+@dataclass
+class IngestItem:
+    """待导入的单个文件"""
+    filename: str
+    path: Optional[str] = None  # multipart文件：落盘路径
+    content: Optional[bytes] = None  # 归档成员：内容
+    error: Optional[str] = None
+
+    def discard(self):
+        """删除落盘文件"""
+        if self.path:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+def detect_format(content_type: str) -> Optional[str]:
+    """根据 Content-Type 判断上传格式：multipart / tar / zip"""
+    media_type = content_type.split(";")[0].strip().lower()
+    if media_type == "multipart/form-data":
+        return "multipart"
+    for archive_format, media_types in ARCHIVE_CONTENT_TYPES.items():
+        if media_type in media_types:
+            return archive_format
+    return None
+
+
+def _is_skipped_name(name: str) -> bool:
+    """归档中的目录元数据、隐藏文件"""
+    base = os.path.basename(name)
+    return not base or base.startswith(".") or "__MACOSX" in name
+
+
+async def iter_multipart(request: Request, spool_dir: str, max_file_size: int) -> AsyncIterator[IngestItem]:
+    """边接收边解析multipart请求体，每个文件部分写完磁盘后立即产出"""
+    _, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if not boundary:
+        raise ValueError("multipart请求缺少boundary")
+
+    # 解析器回调是同步的，先记录事件，每块数据解析后再异步写盘
+    events: List[Tuple[str, Any]] = []
+    headers: Dict[bytes, bytes] = {}
+    header_field = bytearray()
+    header_value = bytearray()
+
+    def on_header_field(data: bytes, start: int, end: int):
+        header_field.extend(data[start:end])
+
+    def on_header_value(data: bytes, start: int, end: int):
+        header_value.extend(data[start:end])
+
+    def on_header_end():
+        headers[bytes(header_field).lower()] = bytes(header_value)
+        header_field.clear()
+        header_value.clear()
+
+    def on_headers_finished():
+        events.append(("begin", dict(headers)))
+        headers.clear()
+
+    def on_part_data(data: bytes, start: int, end: int):
+        events.append(("data", bytes(data[start:end])))
+
+    def on_part_end():
+        events.append(("end", None))
+
+    parser = MultipartParser(boundary, {
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    item: Optional[IngestItem] = None
+    spool_file = None
+    size = 0
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            for kind, value in events:
+                if kind == "begin":
+                    _, options = parse_options_header(value.get(b"content-disposition", b""))
+                    filename = options.get(b"filename")
+                    if filename is None:
+                        # 非文件字段
+                        item = None
+                        continue
+                    item = IngestItem(
+                        filename=os.path.basename(filename.decode("utf-8", "replace")),
+                        path=os.path.join(spool_dir, uuid.uuid4().hex)
+                    )
+                    spool_file = await aiofiles.open(item.path, "wb")
+                    size = 0
+                elif kind == "data" and item is not None and item.error is None:
+                    size += len(value)
+                    if size > max_file_size:
+                        item.error = f"文件大小超过限制 ({max_file_size / 1024 / 1024}MB)"
+                        continue
+                    await spool_file.write(value)
+                elif kind == "end" and item is not None:
+                    await spool_file.close()
+                    spool_file = None
+                    if item.error:
+                        item.discard()
+                    produced, item = item, None
+                    yield produced
+            events.clear()
+        parser.finalize()
+    finally:
+        if spool_file is not None:
+            await spool_file.close()
+            item.discard()
+
+
+class _ArchiveReader:
+    """在线程池中顺序读取归档成员，归档只打开一次"""
+
+    def __init__(self, path: str, archive_format: str):
+        self.path = path
+        self.archive_format = archive_format
+        self._archive = None
+
+    def open(self) -> List[Tuple[str, int]]:
+        """打开归档，返回 [(成员名, 大小)]"""
+        if self.archive_format == "zip":
+            self._archive = zipfile.ZipFile(self.path)
+            return [
+                (info.filename, info.file_size) for info in self._archive.infolist()
+                if not info.is_dir() and not _is_skipped_name(info.filename)
+            ]
+        self._archive = tarfile.open(self.path, mode="r:*")
+        return [
+            (member.name, member.size) for member in self._archive.getmembers()
+            if member.isfile() and not _is_skipped_name(member.name)
+        ]
+
+    def read(self, name: str) -> bytes:
+        if self.archive_format == "zip":
+            return self._archive.read(name)
+        extracted = self._archive.extractfile(name)
+        return extracted.read()
+
+    def close(self):
+        if self._archive is not None:
+            self._archive.close()
+
+
+async def iter_archive(request: Request, spool_dir: str, archive_format: str,
+                       max_file_size: int) -> AsyncIterator[IngestItem]:
+    """
+    归档先完整写入磁盘（zip的目录位于文件末尾），再逐个读取成员
+    超过 STREAM_BATCH_MAX_ARCHIVE_SIZE 时中止接收并抛出 UploadTooLargeError
+    """
+    max_size = settings.STREAM_BATCH_MAX_ARCHIVE_SIZE
+    # 请求已声明的大小超限时无需接收
+    declared_size = request.headers.get("content-length", "")
+    if declared_size.isdigit() and int(declared_size) > max_size:
+        raise UploadTooLargeError(max_size)
+
+    path = os.path.join(spool_dir, f"archive-{uuid.uuid4().hex}")
+    loop = asyncio.get_running_loop()
+    reader = _ArchiveReader(path, archive_format)
+    try:
+        # 接收中途断开或超限时也删除已写入的部分
+        size = 0
+        async with aiofiles.open(path, "wb") as f:
+            async for chunk in request.stream():
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadTooLargeError(max_size)
+                await f.write(chunk)
+
+        try:
+            members = await loop.run_in_executor(None, reader.open)
+        except (tarfile.TarError, zipfile.BadZipFile) as e:
+            raise ValueError(f"无法读取{archive_format}归档: {e}") from e
+
+        for name, size in members:
+            filename = os.path.basename(name)
+            if size > max_file_size:
+                yield IngestItem(filename, error=f"文件大小超过限制 ({max_file_size / 1024 / 1024}MB)")
+                continue
+            content = await loop.run_in_executor(None, reader.read, name)
+            yield IngestItem(filename, content=content)
+    finally:
+        reader.close()
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def batch_events_key(batch_id: str) -> str:
+    """流式导入记录流的存储键"""
+    return CacheKeys.format_key(CacheKeys.BATCH_EVENTS, batch_id=batch_id)
+
+
+def _session_key(batch_id: str) -> str:
+    return CacheKeys.format_key(CacheKeys.BATCH_SESSION, batch_id=batch_id)
+
+
+async def emit_batch_record(batch_id: str, record: Dict[str, Any]) -> Optional[str]:
+    """追加一条导入记录，记录流与批量任务信息同时过期"""
+    return await redis_manager.xadd(
+        batch_events_key(batch_id),
+        {"data": json.dumps(record, ensure_ascii=False, default=str)},
+        ttl=BATCH_TTL
+    )
+
+
+async def read_batch_records(batch_id: str, last_id: str = "0") -> AsyncIterator[Optional[Dict[str, Any]]]:
+    """
+    从头读取导入记录直到汇总记录
+    等待超过心跳间隔时产出None，调用方据此发送心跳或检查连接；Redis读取失败时结束
+    """
+    key = batch_events_key(batch_id)
+    while True:
+        entries = await redis_manager.xread(key, last_id, count=100,
+                                            block_ms=settings.PROGRESS_STREAM_HEARTBEAT * 1000)
+        if entries is None:
+            return
+        if not entries:
+            yield None
+            continue
+        for message_id, fields in entries:
+            last_id = message_id
+            record = json.loads(fields["data"])
+            yield record
+            if record.get("type") == "summary":
+                return
+
+
+async def open_batch_session(analysis_type: str, options: Dict[str, Any]) -> str:
+    """
+    预先创建导入会话，返回批量任务ID
+    客户端先订阅 /batch/{batch_id}/events，再上传文件，上传期间即可收到每个文件的结果
+    """
+    batch_id = str(uuid.uuid4())
+    await cache_set(
+        _session_key(batch_id),
+        {"analysis_type": analysis_type, "options": options, "created_at": datetime.now().isoformat()},
+        ttl=settings.STREAM_BATCH_SESSION_TTL
+    )
+    await emit_batch_record(batch_id, _batch_record(batch_id, analysis_type))
+    return batch_id
+
+
+async def claim_batch_session(batch_id: str) -> Optional[Dict[str, Any]]:
+    """取得导入会话（只能使用一次），不存在、已过期或已被使用时返回None"""
+    session = await cache_get(_session_key(batch_id))
+    if not session or not await redis_manager.delete(_session_key(batch_id)):
+        return None
+    return session
+
+
+def _batch_record(batch_id: str, analysis_type: str) -> Dict[str, Any]:
+    return {
+        "type": "batch",
+        "batch_id": batch_id,
+        "analysis_type": analysis_type,
+        "group_size": max(1, settings.BATCH_SIZE)
+    }
+
+
+class BatchIngestor:
+    """
+    流式批量导入
+    ingest() 在请求处理期间接收上传并分组入队；每个文件的接收、拒绝和分析结果在发生时写入记录流，
+    由 /batch/{batch_id}/events（SSE）或上传响应（records()）读取
+    """
+
+    # 进行中的结果收集任务（上传响应结束后继续运行，直到全部分析结束）
+    _collectors: Set[asyncio.Task] = set()
+
+    def __init__(self, analysis_type: str, options: Optional[Dict[str, Any]] = None,
+                 batch_id: Optional[str] = None):
+        self.analysis_type = analysis_type
+        self.config = SUPPORTED_ANALYSIS_TYPES[analysis_type]
+        self.options = options or {}
+        # 由 open_batch_session 预先创建时，batch记录已写入
+        self._announced = batch_id is not None
+        self.batch_id = batch_id or str(uuid.uuid4())
+
+        self.group_size = max(1, settings.BATCH_SIZE)
+        # 在途分析需要在进度订阅中跟踪，不超过单个订阅的上限
+        self.max_inflight = max(
+            self.group_size,
+            min(settings.STREAM_BATCH_MAX_INFLIGHT, settings.PROGRESS_STREAM_MAX_IDS)
+        )
+
+        self._subscription = progress_broker.subscribe()
+        self._slots = asyncio.Semaphore(self.max_inflight)
+        self._collector: Optional[asyncio.Task] = None
+        self._producing = True
+
+        # 在途分析：analysis_id -> (序号, 文件名)，结果写出后移除
+        self._items: Dict[str, Tuple[int, str]] = {}
+        # 已入队的分析ID（批量任务信息）
+        self._analysis_ids: List[str] = []
+
+        self.received = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.reported = 0
+        self.completed = 0
+        self.failed = 0
+
+    def _check(self, item: IngestItem) -> Optional[str]:
+        """文件格式检查"""
+        extension = item.filename.lower().rsplit(".", 1)[-1] if "." in item.filename else ""
+        if extension not in self.config["supported_formats"]:
+            return f"不支持的文件格式: {extension}"
+        return None
+
+    async def _emit(self, record: Dict[str, Any]):
+        await emit_batch_record(self.batch_id, record)
+
+    async def ingest(self, items: AsyncIterator[IngestItem]):
+        """接收全部文件并分组入队；在途分析达到上限时等待完成"""
+        await init_batch_counters(self.batch_id, 0)
+        if not self._announced:
+            await self._emit(_batch_record(self.batch_id, self.analysis_type))
+        self._collector = asyncio.create_task(self._collect())
+        self._collectors.add(self._collector)
+        self._collector.add_done_callback(self._collectors.discard)
+
+        group: List[Tuple[str, str]] = []
+        try:
+            async for item in items:
+                if self.received >= settings.STREAM_BATCH_MAX_FILES:
+                    item.discard()
+                    await self._emit({
+                        "type": "error",
+                        "error": f"超过单次导入文件数上限（{settings.STREAM_BATCH_MAX_FILES}），其余文件未处理"
+                    })
+                    break
+
+                index = self.received
+                self.received += 1
+
+                error = item.error or self._check(item)
+                if error:
+                    item.discard()
+                    self.rejected += 1
+                    await self._emit({"type": "rejected", "index": index, "filename": item.filename, "error": error})
+                    continue
+
+                await self._slots.acquire()
+                analysis_id = str(uuid.uuid4())
+                try:
+                    # 落盘文件移入共享的任务内容目录，归档成员直接写入
+                    await store_payload(analysis_id, content=item.content, source_path=item.path)
+                except BaseException:
+                    item.discard()
+                    self._slots.release()
+                    raise
+
+                self._items[analysis_id] = (index, item.filename)
+                group.append((analysis_id, item.filename))
+                if len(group) >= self.group_size:
+                    submitting, group = group, []
+                    await self._submit(submitting)
+
+            if group:
+                submitting, group = group, []
+                await self._submit(submitting)
+        except QueueUnavailableError:
+            await self._emit({"type": "error", "error": "分析队列暂不可用，其余文件未处理"})
+        except ValueError as e:
+            if not self.received:
+                raise
+            await self._emit({"type": "error", "error": f"上传内容解析失败: {e}，其余文件未处理"})
+        finally:
+            # 中途出错时未入队的文件不会被处理
+            discard_payloads([analysis_id for analysis_id, _ in group])
+            for analysis_id, _ in group:
+                self._items.pop(analysis_id, None)
+                self._slots.release()
+            await items.aclose()
+            self._producing = False
+            self._subscription.wake()
+
+        await self._register_batch()
+
+    async def _submit(self, group: List[Tuple[str, str]]):
+        """写入排队状态、开始跟踪进度后入队一组分析（上传内容已存放）"""
+        analysis_ids = [analysis_id for analysis_id, _ in group]
+        for analysis_id in analysis_ids:
+            await set_progress(
+                analysis_id,
+                {
+                    "status": "processing",
+                    "progress": 0,
+                    "message": "排队等待分析...",
+                    "started_at": datetime.now().isoformat()
+                }
+            )
+        await self._subscription.follow(analysis_ids)
+
+        try:
+            await analysis_queue.enqueue_group(self.analysis_type, group, self.options, batch_id=self.batch_id)
+        except QueueUnavailableError as e:
+            # 未入队的分析不计入 accepted，直接写出失败结果
+            await self._subscription.unfollow(analysis_ids)
+            for analysis_id in analysis_ids:
+                await set_progress(analysis_id, {"status": "failed", "progress": 0,
+                                                 "message": "分析队列暂不可用", "error": str(e)})
+                index, filename = self._items.pop(analysis_id)
+                self.failed += 1
+                await self._emit({"type": "result", "index": index, "filename": filename,
+                                  "analysis_id": analysis_id, "status": "failed", "error": "分析队列暂不可用"})
+                self._slots.release()
+            raise
+
+        await redis_manager.hincrby(batch_counters_key(self.batch_id), "total", len(group))
+        self.accepted += len(group)
+        self._analysis_ids.extend(analysis_ids)
+        for analysis_id in analysis_ids:
+            index, filename = self._items[analysis_id]
+            await self._emit({"type": "accepted", "index": index, "filename": filename, "analysis_id": analysis_id})
+
+    async def _collect(self):
+        """接收进度事件，写出已结束分析的结果并释放在途名额；全部结束后写出汇总"""
+        try:
+            while self._producing or self.reported < self.accepted:
+                events = await self._subscription.next_events(timeout=settings.PROGRESS_STREAM_HEARTBEAT)
+                finished = [
+                    event for event in events
+                    if event.get("status") in TERMINAL_STATUSES and event["analysis_id"] in self._items
+                ]
+                if finished:
+                    await self._report(finished)
+
+            await self._emit({
+                "type": "summary",
+                "batch_id": self.batch_id,
+                "received": self.received,
+                "accepted": self.accepted,
+                "rejected": self.rejected,
+                "completed": self.completed,
+                "failed": self.failed
+            })
+        finally:
+            await self._subscription.close()
+
+    async def _report(self, finished: List[Dict[str, Any]]):
+        """读取已完成分析的结果（一次MGET）并逐条写出"""
+        completed_ids = [event["analysis_id"] for event in finished if event["status"] == "completed"]
+        results = dict(zip(completed_ids, await redis_manager.mget([
+            CacheKeys.format_key(CacheKeys.ANALYSIS_RESULT, analysis_id=analysis_id)
+            for analysis_id in completed_ids
+        ]))) if completed_ids else {}
+
+        for event in finished:
+            analysis_id = event["analysis_id"]
+            index, filename = self._items.pop(analysis_id)
+            record = {"type": "result", "index": index, "filename": filename, "analysis_id": analysis_id}
+            if event["status"] == "completed":
+                self.completed += 1
+                record.update(status="completed", results=results.get(analysis_id))
+            else:
+                self.failed += 1
+                record.update(status="failed", error=event.get("error") or event.get("message"))
+            self.reported += 1
+            self._slots.release()
+            await self._emit(record)
+
+    async def _register_batch(self):
+        """保存批量任务信息，之后可通过批量状态接口查询"""
+        await cache_set(
+            CacheKeys.format_key(CacheKeys.BATCH_INFO, batch_id=self.batch_id),
+            {
+                "analysis_ids": self._analysis_ids,
+                "analysis_type": self.analysis_type,
+                "total_files": self.accepted,
+                "created_at": datetime.now().isoformat()
+            },
+            ttl=BATCH_TTL
+        )
+        analysis_logger.info("流式批量导入完成", batch_id=self.batch_id, received=self.received,
+                             accepted=self.accepted, rejected=self.rejected)
+
+    async def records(self) -> AsyncIterator[Dict[str, Any]]:
+        """
+        从头读取本次导入的记录直到汇总（上传响应使用）
+        记录流不可用时，等待本进程的结果收集结束后返回本地汇总
+        """
+        async for record in read_batch_records(self.batch_id):
+            if record is not None:
+                yield record
+                if record.get("type") == "summary":
+                    return
+            elif self._collector is not None and self._collector.done():
+                break
+
+        if self._collector is not None:
+            await asyncio.wait({self._collector})
+        yield {
+            "type": "summary",
+            "batch_id": self.batch_id,
+            "received": self.received,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "failed": self.failed,
+            "error": "导入记录读取失败，逐条结果请查询批量状态接口"
+        }
+
+    async def close(self):
+        """上传失败时停止跟踪进度；已入队的分析继续由worker执行"""
+        if self._collector is not None:
+            self._collector.cancel()
+            await asyncio.gather(self._collector, return_exceptions=True)
+            self._collector = None
+        await self._subscription.close()
+
+
+# 导出
+__all__ = [
+    "IngestItem",
+    "BatchIngestor",
+    "open_batch_session",
+    "claim_batch_session",
+    "read_batch_records",
+    "batch_events_key",
+    "detect_format",
+    "iter_multipart",
+    "iter_archive",
+]
@@ -0,0 +1,232 @@
+"""
+推理后端
+为模型的前向传播提供可插拔的执行后端：
+- eager: 原生PyTorch nn.Module
+- torchscript: 追踪（trace）并冻结（freeze）后的TorchScript模块
+- onnx: ONNX Runtime，启用全部图优化
+导出产物与 .pth 权重文件放在同一目录（settings.MODELS_DIR）
+"""
+
+import os
+import time
+import statistics
+from typing import Any, Dict, List, Optional
+
+import torch
+import torch.nn as nn
+
+from app.core.config import settings
+from app.core.logger import model_logger
+
+
+BACKEND_NAMES = ("eager", "torchscript", "onnx")
+
+# 各后端导出产物的文件后缀
+ARTIFACT_SUFFIXES = {
+    "torchscript": ".ts.pt",
+    "onnx": ".onnx",
+}
+
+
+class InferenceBackend:
+    """推理后端基类"""
+
+    name = "base"
+
+    def run(self, input_tensor: torch.Tensor) -> torch.Tensor:
+        """执行前向传播（子类需要实现）"""
+        raise NotImplementedError
+
+
+class EagerBackend(InferenceBackend):
+    """原生PyTorch后端"""
+
+    name = "eager"
+
+    def __init__(self, module: nn.Module):
+        self.module = module
+
+    def run(self, input_tensor: torch.Tensor) -> torch.Tensor:
+        with torch.no_grad():
+            return self.module(input_tensor)
+
+
+class TorchScriptBackend(InferenceBackend):
+    """TorchScript后端（trace + freeze）"""
+
+    name = "torchscript"
+
+    def __init__(self, artifact_path: str, device: torch.device):
+        self.artifact_path = artifact_path
+        self.module = torch.jit.load(artifact_path, map_location=device)
+        self.module.eval()
+
+    def run(self, input_tensor: torch.Tensor) -> torch.Tensor:
+        with torch.no_grad():
+            return self.module(input_tensor)
+
+
+class OnnxRuntimeBackend(InferenceBackend):
+    """ONNX Runtime后端"""
+
+    name = "onnx"
+
+    def __init__(self, artifact_path: str, num_threads: int = 0):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise RuntimeError("未安装onnxruntime，无法使用onnx推理后端") from e
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads > 0:
+            options.intra_op_num_threads = num_threads
+
+        self.artifact_path = artifact_path
+        self.session = ort.InferenceSession(
+            artifact_path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def run(self, input_tensor: torch.Tensor) -> torch.Tensor:
+        outputs = self.session.run(None, {self.input_name: input_tensor.cpu().numpy()})
+        return torch.from_numpy(outputs[0])
+
+
+def artifact_path_for(model_path: str, backend_name: str) -> str:
+    """根据 .pth 权重路径得到指定后端的导出产物路径"""
+    base, _ = os.path.splitext(model_path)
+    return base + ARTIFACT_SUFFIXES[backend_name]
+
+
+def example_input(config: Dict[str, Any], batch_size: int = 1) -> torch.Tensor:
+    """按模型输入尺寸构造示例输入"""
+    input_size = config.get("input_size", 512)
+    return torch.randn(batch_size, 3, input_size, input_size)
+
+
+def export_torchscript(module: nn.Module, example: torch.Tensor, path: str) -> str:
+    """追踪并冻结模型，保存为TorchScript"""
+    with torch.no_grad():
+        traced = torch.jit.trace(module.eval(), example)
+        frozen = torch.jit.freeze(traced)
+    torch.jit.save(frozen, path)
+    return path
+
+
+def export_onnx(module: nn.Module, example: torch.Tensor, path: str) -> str:
+    """导出ONNX模型，批大小维度为动态维度"""
+    with torch.no_grad():
+        torch.onnx.export(
+            module.eval(),
+            example,
+            path,
+            input_names=["input"],
+            output_names=["output"],
+            dynamic_axes={"input": {0: "batch"}, "output": {0: "batch"}},
+            opset_version=17,
+            do_constant_folding=True,
+        )
+    return path
+
+
+def export_backend(backend_name: str, module: nn.Module, config: Dict[str, Any], model_path: str) -> str:
+    """导出指定后端的产物，返回产物路径"""
+    path = artifact_path_for(model_path, backend_name)
+    example = example_input(config).to(next(module.parameters()).device)
+
+    # 先写临时文件再原子替换，避免多个worker同时导出时读到不完整的产物
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        if backend_name == "torchscript":
+            export_torchscript(module, example, tmp_path)
+        elif backend_name == "onnx":
+            export_onnx(module, example, tmp_path)
+        else:
+            raise ValueError(f"后端 {backend_name} 不需要导出")
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    model_logger.info("推理后端导出完成", backend=backend_name, path=path)
+    return path
+
+
+def load_backend(backend_name: str, module: nn.Module, model_path: str,
+                 device: torch.device) -> InferenceBackend:
+    """加载指定后端；非eager后端要求导出产物已存在"""
+    if backend_name == "eager":
+        return EagerBackend(module)
+
+    path = artifact_path_for(model_path, backend_name)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"推理后端产物不存在: {path}")
+
+    if backend_name == "torchscript":
+        return TorchScriptBackend(path, device)
+    if backend_name == "onnx":
+        return OnnxRuntimeBackend(path, num_threads=settings.INFERENCE_THREADS_PER_WORKER)
+    raise ValueError(f"不支持的推理后端: {backend_name}")
+
+
+def check_parity(reference: InferenceBackend, candidate: InferenceBackend,
+                 inputs: torch.Tensor, atol: Optional[float] = None,
+                 rtol: Optional[float] = None) -> Dict[str, Any]:
+    """比较候选后端与eager后端的输出是否一致"""
+    atol = settings.BACKEND_PARITY_ATOL if atol is None else atol
+    rtol = settings.BACKEND_PARITY_RTOL if rtol is None else rtol
+
+    expected = reference.run(inputs).float()
+    actual = candidate.run(inputs).float()
+
+    if expected.shape != actual.shape:
+        return {
+            "passed": False,
+            "reason": f"输出形状不一致: {tuple(expected.shape)} vs {tuple(actual.shape)}",
+        }
+
+    max_abs_diff = (expected - actual).abs().max().item()
+    return {
+        "passed": bool(torch.allclose(expected, actual, atol=atol, rtol=rtol)),
+        "max_abs_diff": max_abs_diff,
+        "atol": atol,
+        "rtol": rtol,
+    }
+
+
+def benchmark_backend(backend: InferenceBackend, inputs: torch.Tensor,
+                      iterations: int = 20, warmup: int = 3) -> Dict[str, float]:
+    """测量后端前向传播延迟"""
+    for _ in range(warmup):
+        backend.run(inputs)
+
+    latencies: List[float] = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        backend.run(inputs)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    latencies.sort()
+    return {
+        "batch_size": inputs.shape[0],
+        "mean_ms": round(statistics.mean(latencies), 3),
+        "p50_ms": round(latencies[len(latencies) // 2], 3),
+        "p99_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 3),
+    }
+
+
+# 导出
+__all__ = [
+    "BACKEND_NAMES",
+    "InferenceBackend",
+    "EagerBackend",
+    "TorchScriptBackend",
+    "OnnxRuntimeBackend",
+    "artifact_path_for",
+    "example_input",
+    "export_backend",
+    "load_backend",
+    "check_parity",
+    "benchmark_backend",
+]
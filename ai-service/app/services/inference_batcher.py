@@ -0,0 +1,228 @@
+"""
+动态微批处理引擎
+将同一模型的并发推理请求合并为一个批次，执行一次堆叠前向传播后再拆分结果
+"""
+
+import time
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from app.core.logger import model_logger
+from app.core.metrics import (
+    INFERENCE_BATCH_SIZE,
+    INFERENCE_QUEUE_WAIT,
+    INFERENCE_BATCH_LATENCY,
+    INFERENCE_QUEUE_DEPTH,
+    INFERENCE_REQUESTS,
+)
+
+
+# 批处理执行函数：接收一批输入，按顺序返回每个输入对应的结果
+BatchRunner = Callable[[List[Any]], Awaitable[List[Dict[str, Any]]]]
+
+
+@dataclass
+class _PendingRequest:
+    """队列中等待处理的单个推理请求"""
+    payload: Any
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+class InferenceBatcher:
+    """单模型动态微批处理队列"""
+
+    def __init__(self, model_name: str, runner: BatchRunner,
+                 max_batch_size: int, max_wait_ms: float,
+                 max_concurrent_batches: int = 1):
+        self.model_name = model_name
+        self.runner = runner
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        # 同时在执行器中运行的批次数，通常与推理worker数一致
+        self.max_concurrent_batches = max(1, max_concurrent_batches)
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._inflight: Set[asyncio.Task] = set()
+
+        # 简单统计，便于通过API直接查看
+        self.batch_count = 0
+        self.request_count = 0
+        self.max_observed_batch = 0
+        self.total_queue_wait = 0.0
+
+    def _ensure_worker(self):
+        """在当前事件循环中惰性启动后台批处理协程"""
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_concurrent_batches)
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, payload: Any) -> Dict[str, Any]:
+        """提交单个推理请求，等待所属批次完成后返回该请求的结果"""
+        self._ensure_worker()
+
+        future = asyncio.get_running_loop().create_future()
+        INFERENCE_QUEUE_DEPTH.labels(model_name=self.model_name).inc()
+        await self._queue.put(_PendingRequest(payload=payload, future=future))
+
+        try:
+            result = await future
+        except Exception:
+            INFERENCE_REQUESTS.labels(model_name=self.model_name, status="error").inc()
+            raise
+        INFERENCE_REQUESTS.labels(model_name=self.model_name, status="success").inc()
+        return result
+
+    async def _collect_batch(self) -> List[_PendingRequest]:
+        """
+        收集一个批次：达到最大批大小或等待窗口到期即返回
+        不使用 wait_for(queue.get())：超时与取出请求同时发生时该请求会丢失；
+        等待中被取消时已取出的请求放回队列，由 close 统一取消
+        """
+        loop = asyncio.get_running_loop()
+
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        getter: Optional[asyncio.Task] = None
+
+        try:
+            while len(batch) < self.max_batch_size:
+                # 先取走已就绪的请求，避免无谓等待
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+
+                getter = loop.create_task(self._queue.get())
+                done, _ = await asyncio.wait({getter}, timeout=timeout)
+                if not done:
+                    # 尚未取到请求，取消后请求仍留在队列中
+                    getter.cancel()
+                    getter = None
+                    break
+                batch.append(getter.result())
+                getter = None
+        except asyncio.CancelledError:
+            if getter is not None:
+                if getter.done() and not getter.cancelled():
+                    batch.append(getter.result())
+                else:
+                    getter.cancel()
+            for request in batch:
+                self._queue.put_nowait(request)
+            raise
+
+        return batch
+
+    async def _run(self):
+        """后台批处理循环：先占用执行槽位再凑批，保证排队期间批次可以继续变大"""
+        loop = asyncio.get_running_loop()
+
+        while True:
+            await self._slots.acquire()
+            try:
+                batch = await self._collect_batch()
+            except BaseException:
+                self._slots.release()
+                raise
+
+            INFERENCE_QUEUE_DEPTH.labels(model_name=self.model_name).dec(len(batch))
+            # 调用方已取消的请求不再参与推理
+            batch = [request for request in batch if not request.future.cancelled()]
+            if not batch:
+                self._slots.release()
+                continue
+
+            task = loop.create_task(self._execute(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _execute(self, batch: List[_PendingRequest]):
+        """执行单个批次并将结果分发给各个等待者"""
+        started_at = time.perf_counter()
+        for request in batch:
+            wait = started_at - request.enqueued_at
+            INFERENCE_QUEUE_WAIT.labels(model_name=self.model_name).observe(wait)
+            self.total_queue_wait += wait
+
+        INFERENCE_BATCH_SIZE.labels(model_name=self.model_name).observe(len(batch))
+        self.batch_count += 1
+        self.request_count += len(batch)
+        self.max_observed_batch = max(self.max_observed_batch, len(batch))
+
+        try:
+            results = await self.runner([request.payload for request in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(
+                    f"批处理结果数量不匹配: 期望 {len(batch)}, 实际 {len(results)}"
+                )
+            for request, result in zip(batch, results):
+                if not request.future.done():
+                    request.future.set_result(result)
+        except asyncio.CancelledError:
+            for request in batch:
+                if not request.future.done():
+                    request.future.cancel()
+            raise
+        except Exception as e:
+            model_logger.error("批处理推理失败", model_name=self.model_name,
+                               batch_size=len(batch), error=str(e))
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+        finally:
+            self._slots.release()
+            INFERENCE_BATCH_LATENCY.labels(model_name=self.model_name).observe(
+                time.perf_counter() - started_at
+            )
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取批处理统计信息"""
+        return {
+            "model_name": self.model_name,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batch_count": self.batch_count,
+            "request_count": self.request_count,
+            "avg_batch_size": round(self.request_count / self.batch_count, 2) if self.batch_count else 0,
+            "max_observed_batch": self.max_observed_batch,
+            "avg_queue_wait_ms": round(self.total_queue_wait / self.request_count * 1000, 3)
+            if self.request_count else 0,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "inflight_batches": len(self._inflight),
+        }
+
+    async def close(self):
+        """停止后台批处理协程，未完成的请求将被取消"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+        for task in list(self._inflight):
+            task.cancel()
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+        self._inflight.clear()
+
+        if self._queue is not None:
+            while not self._queue.empty():
+                request = self._queue.get_nowait()
+                INFERENCE_QUEUE_DEPTH.labels(model_name=self.model_name).dec()
+                if not request.future.done():
+                    request.future.cancel()
+            self._queue = None
+
+
+# 导出
+__all__ = ["InferenceBatcher", "BatchRunner"]
@@ -0,0 +1,131 @@
+"""
+推理执行器
+将PyTorch预处理、前向传播和后处理移出asyncio事件循环，避免阻塞API请求
+支持三种模式：
+- thread: 线程池；torch线程数是进程级设置，启动时按核心数/工作线程数设置一次
+- process: 进程池，每个子进程只加载一次模型并设置自己的torch线程数，完全绕开GIL；主进程不加载模型
+- inline: 直接在事件循环中执行（仅用于调试和基准对比）
+"""
+
+import os
+import asyncio
+import multiprocessing
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import torch
+from PIL import Image
+
+from app.core.config import settings
+from app.core.logger import model_logger
+
+
+EXECUTOR_MODES = ("thread", "process", "inline")
+
+# 子进程内的模型管理器（每个进程只加载一次模型）
+_process_model_manager = None
+
+
+def _init_worker_process(num_threads: int):
+    """推理子进程初始化：限制本进程的torch线程数，避免多个子进程争抢CPU核心"""
+    torch.set_num_threads(num_threads)
+
+
+def _process_run_batch(model_name: str, images: List[Image.Image]) -> List[Dict[str, Any]]:
+    """在子进程中执行一批推理，模型在首次使用时加载并常驻该进程"""
+    global _process_model_manager
+
+    if _process_model_manager is None:
+        from app.services.model_manager import ModelManager
+        _process_model_manager = ModelManager(executor=InferenceExecutor(mode="inline"))
+
+    if model_name not in _process_model_manager.loaded_models:
+        _process_model_manager.load_model_sync(model_name)
+
+    return _process_model_manager._run_batch(model_name, images)
+
+
+class InferenceExecutor:
+    """推理执行器"""
+
+    def __init__(self, mode: Optional[str] = None, workers: Optional[int] = None,
+                 threads_per_worker: Optional[int] = None):
+        self.mode = mode or settings.INFERENCE_EXECUTOR
+        if self.mode not in EXECUTOR_MODES:
+            raise ValueError(f"不支持的推理执行器模式: {self.mode}，可选: {', '.join(EXECUTOR_MODES)}")
+
+        self.workers = max(1, workers or settings.INFERENCE_WORKERS)
+
+        # 未指定时按worker数平均划分CPU核心
+        threads = threads_per_worker or settings.INFERENCE_THREADS_PER_WORKER
+        self.threads_per_worker = threads if threads > 0 else max(1, (os.cpu_count() or 1) // self.workers)
+
+        self._pool: Optional[Executor] = None
+
+    def _ensure_pool(self) -> Optional[Executor]:
+        """惰性创建线程池/进程池"""
+        if self.mode == "inline" or self._pool is not None:
+            return self._pool
+
+        if self.mode == "thread":
+            # torch.set_num_threads 作用于整个进程，不能按线程分别设置，在此设置一次
+            torch.set_num_threads(self.threads_per_worker)
+            self._pool = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix="inference"
+            )
+        else:
+            # 使用spawn避免fork继承torch/OpenMP线程状态导致死锁
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker_process,
+                initargs=(self.threads_per_worker,)
+            )
+
+        model_logger.info(
+            "推理执行器已启动",
+            mode=self.mode,
+            workers=self.workers,
+            threads_per_worker=self.threads_per_worker
+        )
+        return self._pool
+
+    async def run_batch(self, model_name: str, images: List[Image.Image],
+                        local_runner: Optional[Callable[[str, List[Image.Image]], List[Dict[str, Any]]]] = None
+                        ) -> List[Dict[str, Any]]:
+        """
+        执行一批推理
+        thread/inline模式调用本进程的 local_runner，process模式只传模型名称，在子进程中加载模型并执行
+        """
+        pool = self._ensure_pool()
+        if self.mode != "process" and local_runner is None:
+            raise ValueError(f"{self.mode}模式需要提供 local_runner")
+
+        if self.mode == "inline":
+            return local_runner(model_name, images)
+
+        loop = asyncio.get_running_loop()
+        if self.mode == "thread":
+            return await loop.run_in_executor(pool, local_runner, model_name, images)
+        return await loop.run_in_executor(pool, _process_run_batch, model_name, images)
+
+    def get_info(self) -> Dict[str, Any]:
+        """获取执行器配置信息"""
+        return {
+            "mode": self.mode,
+            "workers": self.workers,
+            "threads_per_worker": self.threads_per_worker,
+            "started": self._pool is not None
+        }
+
+    def shutdown(self, wait: bool = True):
+        """关闭线程池/进程池"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait, cancel_futures=True)
+            self._pool = None
+            model_logger.info("推理执行器已关闭", mode=self.mode)
+
+
+# 导出
+__all__ = ["InferenceExecutor", "EXECUTOR_MODES"]
@@ -4,23 +4,36 @@ AI模型管理器
 """
 
 import os
+import gc
+import json
 import time
 import asyncio
 import hashlib
+from collections import OrderedDict
 from datetime import datetime
-from typing import Dict, Any, Optional, List, Tuple
+from typing import Dict, Any, Optional, List, Tuple, Union
 from pathlib import Path
 from contextlib import asynccontextmanager
 
 import torch
 import torch.nn as nn
-from torchvision import transforms
 import numpy as np
 from PIL import Image
 
 from app.core.config import settings
 from app.core.logger import model_logger
-from app.core.redis import cache_set, cache_get, CacheKeys
+from app.core.metrics import process_memory
+from app.core.redis import cache_get, redis_manager, CacheKeys
+from app.services.inference_batcher import InferenceBatcher
+from app.services.inference_executor import InferenceExecutor
+from app.services.inference_backends import (
+    BACKEND_NAMES, InferenceBackend, EagerBackend, artifact_path_for, example_input,
+    export_backend, load_backend, check_parity, benchmark_backend
+)
+from app.services.model_optimizer import OptimizationProfile, optimize_model
+from app.services.result_cache import InferenceResultCache
+from app.services.image_decoder import decode_image, DECODER_VERSION
+from app.services.preprocessing import Preprocessor, preprocessor_for
 
 
 class ModelInfo:
@@ -35,9 +48,13 @@ class ModelInfo:
         self.loaded_at: Optional[datetime] = None
         self.last_used: Optional[datetime] = None
         self.inference_count = 0
+        self.active_requests = 0  # 排队中和执行中的推理请求数，大于0时不会被淘汰
         self.memory_usage = 0  # MB
         self.model_instance: Optional[nn.Module] = None
-        self.preprocessor: Optional[transforms.Compose] = None
+        self.preprocessor: Optional[Preprocessor] = None
+        self.backend: Optional[InferenceBackend] = None  # 前向传播后端，后处理仍使用 model_instance
+        self.optimization: Optional[Dict[str, Any]] = None  # CPU优化报告（量化精度差异、吞吐提升）
+        self.weights_loading: Optional[str] = None  # 权重加载方式: mmap, safetensors, copy, random
         
     def to_dict(self) -> Dict[str, Any]:
         """转换为字典格式"""
@@ -51,6 +68,10 @@ class ModelInfo:
             "last_used": self.last_used.isoformat() if self.last_used else None,
             "inference_count": self.inference_count,
             "memory_usage": self.memory_usage,
+            "active_requests": self.active_requests,
+            "backend": self.backend.name if self.backend else None,
+            "optimization": self.optimization,
+            "weights_loading": self.weights_loading,
             "is_loaded": self.model_instance is not None
         }
 
@@ -66,19 +87,9 @@ class BaseModel(nn.Module):
         """前向传播（子类需要实现）"""
         raise NotImplementedError
         
-    def preprocess(self, image: Image.Image) -> torch.Tensor:
+    def preprocess(self, image: Union[Image.Image, np.ndarray]) -> torch.Tensor:
         """图像预处理"""
-        # 默认预处理流程
-        transform = transforms.Compose([
-            transforms.Resize((self.config.get('input_size', 512), 
-                             self.config.get('input_size', 512))),
-            transforms.ToTensor(),
-            transforms.Normalize(
-                mean=self.config.get('normalize_mean', [0.485, 0.456, 0.406]),
-                std=self.config.get('normalize_std', [0.229, 0.224, 0.225])
-            )
-        ])
-        return transform(image).unsqueeze(0)
+        return preprocessor_for(self.config)(image).unsqueeze(0)
     
     def postprocess(self, output: torch.Tensor) -> Dict[str, Any]:
         """后处理（子类需要实现）"""
@@ -258,57 +269,109 @@ class FacialModel(BaseModel):
         }
 
 
+# 模型注册表：模型名称 -> 版本、类型、网络类和预处理配置
+MODEL_CONFIGS: Dict[str, Dict[str, Any]] = {
+    "intraoral": {
+        "version": settings.INTRAORAL_MODEL_VERSION,
+        "model_type": "intraoral",
+        "class": IntraoralModel,
+        "config": {
+            "input_size": 512,
+            "num_classes": 10,
+            "normalize_mean": [0.485, 0.456, 0.406],
+            "normalize_std": [0.229, 0.224, 0.225]
+        }
+    },
+    "facial": {
+        "version": settings.FACIAL_MODEL_VERSION,
+        "model_type": "facial", 
+        "class": FacialModel,
+        "config": {
+            "input_size": 512,
+            "num_features": 20,
+            "normalize_mean": [0.485, 0.456, 0.406],
+            "normalize_std": [0.229, 0.224, 0.225]
+        }
+    }
+}
+
+# 发布到Redis的模型信息有效期（秒）
+MODEL_INFO_TTL = 3600
+
+
 class ModelManager:
     """AI模型管理器"""
     
-    def __init__(self):
-        self.loaded_models: Dict[str, ModelInfo] = {}
+    def __init__(self, executor: Optional[InferenceExecutor] = None):
+        # 已加载模型按最近使用顺序排列（LRU），受数量和内存预算约束
+        self.loaded_models: "OrderedDict[str, ModelInfo]" = OrderedDict()
         self.device = torch.device(settings.DEVICE)
         self.model_cache_size = settings.MODEL_CACHE_SIZE
+        self.max_memory_usage = settings.MAX_MEMORY_USAGE  # MB
         self._loading_locks: Dict[str, asyncio.Lock] = {}
+        self._batchers: Dict[str, InferenceBatcher] = {}
+        self._load_errors: Dict[str, str] = {}
+        self._memory_estimates: Dict[str, float] = {}  # 上次加载实测的内存占用（MB）
+        self._maintenance_task: Optional[asyncio.Task] = None
+        self.eviction_count = 0
+        self.executor = executor or InferenceExecutor()
+        self.result_cache = InferenceResultCache()
         
-        model_logger.info(f"初始化模型管理器", device=str(self.device))
+        model_logger.info(f"初始化模型管理器", device=str(self.device), executor=self.executor.mode)
+    
+    @property
+    def loads_models_locally(self) -> bool:
+        """process模式下模型只在推理子进程中加载，本进程不持有模型"""
+        return self.executor.mode != "process"
     
     async def initialize_models(self):
         """初始化所有模型"""
-        model_logger.info("开始初始化AI模型...")
+        if not self.loads_models_locally:
+            model_logger.info("推理执行器为process模式，模型在推理子进程首次使用时加载")
+            return
         
-        # 模型配置
-        model_configs = {
-            "intraoral": {
-                "version": settings.INTRAORAL_MODEL_VERSION,
-                "model_type": "intraoral",
-                "class": IntraoralModel,
-                "config": {
-                    "input_size": 512,
-                    "num_classes": 10,
-                    "normalize_mean": [0.485, 0.456, 0.406],
-                    "normalize_std": [0.229, 0.224, 0.225]
-                }
-            },
-            "facial": {
-                "version": settings.FACIAL_MODEL_VERSION,
-                "model_type": "facial", 
-                "class": FacialModel,
-                "config": {
-                    "input_size": 512,
-                    "num_features": 20,
-                    "normalize_mean": [0.485, 0.456, 0.406],
-                    "normalize_std": [0.229, 0.224, 0.225]
-                }
-            }
-        }
+        model_logger.info("开始初始化AI模型...")
+        start_time = time.time()
         
         # 加载核心模型
-        for model_name, config in model_configs.items():
+        for model_name, config in MODEL_CONFIGS.items():
             try:
                 await self._load_model(model_name, config)
                 model_logger.success(f"模型加载成功", model_name=model_name)
             except Exception as e:
                 model_logger.error(f"模型加载失败", model_name=model_name, error=str(e))
-                # 继续加载其他模型
+                # 继续加载其他模型，未加载的模型会在首次推理时按需加载
+        
+        model_logger.success(
+            f"模型初始化完成，共加载 {len(self.loaded_models)} 个模型",
+            pid=os.getpid(),
+            startup_time=round(time.time() - start_time, 3),
+            **process_memory()
+        )
+    
+    def preload_models(self):
+        """
+        同步预加载全部模型权重（在gunicorn主进程fork前调用）
+        只加载权重，不运行前向传播：fork前初始化torch线程池会导致worker死锁，
+        推理后端在worker首次加载模型时补全
+        """
+        if not self.loads_models_locally:
+            model_logger.info("推理执行器为process模式，跳过主进程模型预加载")
+            return
+        
+        start_time = time.time()
+        for model_name in MODEL_CONFIGS:
+            try:
+                self.load_model_sync(model_name, setup_backend=False)
+            except Exception as e:
+                model_logger.error("模型预加载失败", model_name=model_name, error=str(e))
         
-        model_logger.success(f"模型初始化完成，共加载 {len(self.loaded_models)} 个模型")
+        model_logger.info(
+            "主进程模型预加载完成",
+            models=list(self.loaded_models.keys()),
+            preload_time=round(time.time() - start_time, 3),
+            **process_memory()
+        )
     
     async def _load_model(self, model_name: str, config: Dict[str, Any]):
         """加载单个模型"""
@@ -317,81 +380,438 @@ class ModelManager:
             self._loading_locks[model_name] = asyncio.Lock()
         
         async with self._loading_locks[model_name]:
-            # 检查是否已经加载
-            if model_name in self.loaded_models and self.loaded_models[model_name].model_instance is not None:
-                return self.loaded_models[model_name]
+            loop = asyncio.get_running_loop()
             
-            start_time = time.time()
-            
-            # 构建模型路径
-            model_path = os.path.join(settings.MODELS_DIR, f"{model_name}_{config['version']}.pth")
+            # 检查是否已经加载
+            existing = self.loaded_models.get(model_name)
+            if existing is not None and existing.model_instance is not None:
+                if existing.backend is None:
+                    # 主进程预加载的模型，在worker中补全推理后端
+                    existing.backend = await loop.run_in_executor(None, self._setup_backend, existing)
+                return existing
             
-            # 创建模型信息对象
-            model_info = ModelInfo(
-                name=model_name,
-                version=config["version"],
-                model_type=config["model_type"],
-                model_path=model_path,
-                config=config["config"]
+            # 先按预估大小淘汰最冷的空闲模型，避免新旧模型同时占用内存
+            await self._close_batchers(
+                self._evict_for(model_name, self._estimate_model_memory(model_name, config))
             )
             
-            # 实例化模型
-            model_class = config["class"]
-            model_instance = model_class(config["config"])
-            
-            # 加载权重（如果存在）
-            if os.path.exists(model_path):
-                try:
-                    checkpoint = torch.load(model_path, map_location=self.device)
-                    model_instance.load_state_dict(checkpoint.get('model_state_dict', checkpoint))
-                    model_logger.info(f"加载模型权重", model_name=model_name, path=model_path)
-                except Exception as e:
-                    model_logger.warning(f"无法加载模型权重，使用随机权重", 
-                                       model_name=model_name, error=str(e))
-            else:
-                model_logger.warning(f"模型文件不存在，使用随机权重", 
-                                   model_name=model_name, path=model_path)
-            
-            # 移动到指定设备
-            model_instance.to(self.device)
-            model_instance.eval()
-            
-            # 计算内存使用
-            memory_usage = self._calculate_model_memory(model_instance)
-            
-            # 更新模型信息
-            model_info.model_instance = model_instance
-            model_info.loaded_at = datetime.now()
-            model_info.memory_usage = memory_usage
+            # 权重加载属于阻塞IO和CPU操作，放到线程中执行
+            try:
+                model_info = await loop.run_in_executor(None, self._build_model_info, model_name, config)
+            except Exception as e:
+                self._load_errors[model_name] = str(e)
+                raise
+            self._load_errors.pop(model_name, None)
             
-            # 创建预处理器
-            model_info.preprocessor = self._create_preprocessor(config["config"])
+            # 实测大小超出预估时继续淘汰
+            await self._close_batchers(self._evict_for(model_name, model_info.memory_usage))
             
             # 存储到已加载模型中
             self.loaded_models[model_name] = model_info
             
-            load_time = time.time() - start_time
-            model_logger.model_load(model_name, config["version"], load_time)
-            
-            # 缓存模型信息
-            await cache_set(
+            # 发布模型信息，供未加载该模型的节点查询
+            await redis_manager.set(
                 CacheKeys.format_key(CacheKeys.MODEL_INFO, model_name=model_name),
                 model_info.to_dict(),
-                ttl=3600
+                ttl=MODEL_INFO_TTL
             )
             
             return model_info
     
-    def _create_preprocessor(self, config: Dict[str, Any]) -> transforms.Compose:
-        """创建图像预处理器"""
-        return transforms.Compose([
-            transforms.Resize((config.get('input_size', 512), config.get('input_size', 512))),
-            transforms.ToTensor(),
-            transforms.Normalize(
-                mean=config.get('normalize_mean', [0.485, 0.456, 0.406]),
-                std=config.get('normalize_std', [0.229, 0.224, 0.225])
+    def _build_model_info(self, model_name: str, config: Dict[str, Any],
+                          setup_backend: bool = True) -> ModelInfo:
+        """实例化模型、加载权重并创建预处理器（同步执行）"""
+        start_time = time.time()
+        
+        # 构建模型路径
+        model_path = os.path.join(settings.MODELS_DIR, f"{model_name}_{config['version']}.pth")
+        
+        # 创建模型信息对象
+        model_info = ModelInfo(
+            name=model_name,
+            version=config["version"],
+            model_type=config["model_type"],
+            model_path=model_path,
+            config=config["config"]
+        )
+        
+        # 实例化模型并加载权重
+        model_instance, model_info.weights_loading = self._instantiate_model(
+            model_name, config["class"], config["config"], model_path
+        )
+        
+        # 移动到指定设备
+        model_instance.to(self.device)
+        model_instance.eval()
+        
+        # 更新模型信息
+        model_info.model_instance = model_instance
+        model_info.loaded_at = datetime.now()
+        model_info.memory_usage = self._calculate_model_memory(model_instance)
+        
+        # 创建预处理器
+        model_info.preprocessor = self._create_preprocessor(config["config"])
+        
+        # 选择推理后端
+        if setup_backend:
+            model_info.backend = self._setup_backend(model_info)
+        
+        load_time = time.time() - start_time
+        model_logger.model_load(model_name, config["version"], load_time)
+        
+        return model_info
+    
+    def _read_weights(self, model_name: str, model_path: str) -> Tuple[Optional[Dict[str, torch.Tensor]], str]:
+        """
+        读取权重state_dict，返回 (state_dict, 加载方式)
+        优先使用同名 .safetensors；CPU上以mmap方式读取 .pth，张量直接引用文件页缓存，
+        多个worker进程共享同一份物理内存
+        """
+        safetensors_path = os.path.splitext(model_path)[0] + ".safetensors"
+        use_mmap = settings.MODEL_WEIGHTS_MMAP and self.device.type == "cpu"
+        
+        try:
+            if os.path.exists(safetensors_path):
+                from safetensors.torch import load_file
+                return load_file(safetensors_path, device=str(self.device)), "safetensors"
+            
+            if not os.path.exists(model_path):
+                model_logger.warning(f"模型文件不存在，使用随机权重", 
+                                   model_name=model_name, path=model_path)
+                return None, "random"
+            
+            checkpoint = None
+            if use_mmap:
+                try:
+                    checkpoint = torch.load(model_path, map_location="cpu", mmap=True)
+                except Exception as e:
+                    # 旧版（非zip）序列化格式不支持mmap
+                    model_logger.warning("权重文件不支持mmap加载，改为常规加载",
+                                         model_name=model_name, error=str(e))
+            mode = "mmap" if checkpoint is not None else "copy"
+            if checkpoint is None:
+                checkpoint = torch.load(model_path, map_location=self.device)
+            
+            return checkpoint.get('model_state_dict', checkpoint), mode
+            
+        except Exception as e:
+            model_logger.warning(f"无法加载模型权重，使用随机权重", 
+                               model_name=model_name, error=str(e))
+            return None, "random"
+    
+    def _instantiate_model(self, model_name: str, model_class: type, config: Dict[str, Any],
+                           model_path: str) -> Tuple[nn.Module, str]:
+        """实例化模型并加载权重，返回 (模型实例, 权重加载方式)"""
+        state_dict, mode = self._read_weights(model_name, model_path)
+        if state_dict is None:
+            return model_class(config), "random"
+        
+        if mode in ("mmap", "safetensors"):
+            try:
+                # 在meta设备上构建网络结构，参数直接指向映射的权重，不分配也不拷贝内存
+                with torch.device("meta"):
+                    model_instance = model_class(config)
+                model_instance.load_state_dict(state_dict, assign=True)
+                model_logger.info(f"加载模型权重", model_name=model_name, path=model_path, mode=mode)
+                return model_instance, mode
+            except Exception as e:
+                model_logger.warning("零拷贝加载权重失败，改为常规加载",
+                                     model_name=model_name, error=str(e))
+        
+        model_instance = model_class(config)
+        try:
+            model_instance.load_state_dict(state_dict)
+            model_logger.info(f"加载模型权重", model_name=model_name, path=model_path, mode="copy")
+            return model_instance, "copy"
+        except Exception as e:
+            model_logger.warning(f"无法加载模型权重，使用随机权重", 
+                               model_name=model_name, error=str(e))
+            return model_class(config), "random"
+    
+    def _setup_backend(self, model_info: ModelInfo) -> InferenceBackend:
+        """创建推理后端并应用优化配置"""
+        return self._apply_optimization(model_info, self._select_backend(model_info))
+    
+    def _select_backend(self, model_info: ModelInfo) -> InferenceBackend:
+        """按配置创建推理后端，加载或一致性校验失败时回退到eager"""
+        eager = EagerBackend(model_info.model_instance)
+        backend_name = settings.backend_for(model_info.name)
+        if backend_name == "eager":
+            return eager
+        
+        try:
+            backend = self._load_checked_backend(backend_name, model_info, eager)
+            model_logger.info("推理后端已启用", model_name=model_info.name, backend=backend_name)
+            return backend
+        except Exception as e:
+            model_logger.warning("推理后端不可用，回退到eager",
+                                 model_name=model_info.name, backend=backend_name, error=str(e))
+            return eager
+    
+    def _load_checked_backend(self, backend_name: str, model_info: ModelInfo,
+                              eager: EagerBackend) -> InferenceBackend:
+        """加载导出产物并与eager输出做一致性校验；产物缺失或过期时按配置自动导出"""
+        path = artifact_path_for(model_info.model_path, backend_name)
+        stale = not os.path.exists(path) or (
+            os.path.exists(model_info.model_path)
+            and os.path.getmtime(path) < os.path.getmtime(model_info.model_path)
+        )
+        
+        exported = False
+        if stale:
+            if not settings.AUTO_EXPORT_BACKENDS:
+                raise FileNotFoundError(f"推理后端产物不存在或已过期: {path}")
+            export_backend(backend_name, model_info.model_instance, model_info.config, model_info.model_path)
+            exported = True
+        
+        # 使用批大小为2的输入校验，同时确认动态批维度可用
+        inputs = example_input(model_info.config, batch_size=2).to(self.device)
+        backend = load_backend(backend_name, model_info.model_instance, model_info.model_path, self.device)
+        parity = check_parity(eager, backend, inputs)
+        
+        # 产物与当前权重不一致（如权重已更新或未找到权重文件），重新导出后再校验一次
+        if not parity["passed"] and not exported and settings.AUTO_EXPORT_BACKENDS:
+            export_backend(backend_name, model_info.model_instance, model_info.config, model_info.model_path)
+            backend = load_backend(backend_name, model_info.model_instance, model_info.model_path, self.device)
+            parity = check_parity(eager, backend, inputs)
+        
+        if not parity["passed"]:
+            raise RuntimeError(f"推理后端一致性校验失败: {parity}")
+        return backend
+    
+    def _apply_optimization(self, model_info: ModelInfo, backend: InferenceBackend,
+                            force: bool = False) -> InferenceBackend:
+        """按 MODEL_OPTIMIZATIONS 应用量化/channels_last/inference_mode，失败时保留原后端"""
+        spec = settings.optimization_for(model_info.name)
+        if not spec:
+            return backend
+        
+        try:
+            profile = OptimizationProfile.parse(spec)
+            optimized, report = optimize_model(
+                model_info.model_instance,
+                model_info.model_path,
+                model_info.config,
+                model_info.preprocessor,
+                profile,
+                self.device,
+                base_backend=backend,
+                force=force
+            )
+            model_info.optimization = report
+            return optimized
+        except Exception as e:
+            model_logger.warning("模型优化失败，使用未优化的后端",
+                                 model_name=model_info.name, profile=spec, error=str(e))
+            return backend
+    
+    async def optimize_model(self, model_name: str) -> Optional[Dict[str, Any]]:
+        """重新执行模型优化（忽略磁盘缓存），替换当前后端并返回报告"""
+        model_info = await self.get_model(model_name)
+        if not settings.optimization_for(model_name):
+            raise ValueError(f"模型 {model_name} 未配置优化选项（MODEL_OPTIMIZATIONS）")
+        
+        loop = asyncio.get_running_loop()
+        base_backend = await loop.run_in_executor(None, self._select_backend, model_info)
+        model_info.backend = await loop.run_in_executor(
+            None, self._apply_optimization, model_info, base_backend, True
+        )
+        return model_info.optimization
+    
+    async def export_model(self, model_name: str, backends: Optional[List[str]] = None,
+                           iterations: int = 20) -> Dict[str, Any]:
+        """
+        导出模型的TorchScript/ONNX产物，并报告各后端的一致性校验结果和延迟
+        不切换当前使用的后端，按报告结果通过 MODEL_BACKENDS 配置
+        """
+        model_info = await self.get_model(model_name)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, self._export_and_benchmark, model_info, backends or list(BACKEND_NAMES), iterations
+        )
+    
+    def _export_and_benchmark(self, model_info: ModelInfo, backends: List[str],
+                              iterations: int) -> Dict[str, Any]:
+        """导出、校验并测量各后端延迟（同步执行）"""
+        eager = EagerBackend(model_info.model_instance)
+        parity_inputs = example_input(model_info.config, batch_size=2).to(self.device)
+        batch_sizes = sorted({1, max(1, settings.BATCH_SIZE)})
+        
+        report: Dict[str, Any] = {}
+        for backend_name in backends:
+            if backend_name not in BACKEND_NAMES:
+                report[backend_name] = {"error": f"不支持的推理后端: {backend_name}"}
+                continue
+            
+            try:
+                if backend_name != "eager":
+                    export_backend(backend_name, model_info.model_instance,
+                                   model_info.config, model_info.model_path)
+                backend = load_backend(backend_name, model_info.model_instance,
+                                       model_info.model_path, self.device)
+                
+                entry: Dict[str, Any] = {
+                    "artifact": None if backend_name == "eager"
+                    else artifact_path_for(model_info.model_path, backend_name),
+                    "parity": check_parity(eager, backend, parity_inputs),
+                    "latency": [
+                        benchmark_backend(
+                            backend,
+                            example_input(model_info.config, batch_size=size).to(self.device),
+                            iterations=iterations
+                        )
+                        for size in batch_sizes
+                    ]
+                }
+                report[backend_name] = entry
+            except Exception as e:
+                model_logger.error("推理后端导出失败", model_name=model_info.name,
+                                   backend=backend_name, error=str(e))
+                report[backend_name] = {"error": str(e)}
+        
+        # 以最大批大小下的平均延迟为准，推荐通过一致性校验的最快后端
+        candidates = [
+            (entry["latency"][-1]["mean_ms"], name) for name, entry in report.items()
+            if "latency" in entry and entry["parity"].get("passed")
+        ]
+        recommended = min(candidates)[1] if candidates else "eager"
+        
+        model_logger.info("推理后端基准完成", model_name=model_info.name,
+                          recommended=recommended,
+                          latency={name: entry["latency"][-1]["mean_ms"]
+                                   for name, entry in report.items() if "latency" in entry})
+        
+        return {
+            "model_name": model_info.name,
+            "model_version": model_info.version,
+            "current_backend": model_info.backend.name if model_info.backend else None,
+            "recommended_backend": recommended,
+            "backends": report
+        }
+    
+    def load_model_sync(self, model_name: str, setup_backend: bool = True) -> ModelInfo:
+        """同步加载模型（供推理子进程和主进程预加载使用）"""
+        if model_name not in MODEL_CONFIGS:
+            raise ValueError(f"未知模型: {model_name}")
+        
+        config = MODEL_CONFIGS[model_name]
+        self._evict_for(model_name, self._estimate_model_memory(model_name, config))
+        model_info = self._build_model_info(model_name, config, setup_backend)
+        self._evict_for(model_name, model_info.memory_usage)
+        self.loaded_models[model_name] = model_info
+        return model_info
+    
+    async def get_model(self, model_name: str) -> ModelInfo:
+        """获取模型，未加载（或已被淘汰）时按需加载，并标记为最近使用"""
+        model_info = self.loaded_models.get(model_name)
+        if model_info is None or model_info.model_instance is None:
+            if model_name not in MODEL_CONFIGS:
+                raise ValueError(f"未知模型: {model_name}")
+            model_info = await self._load_model(model_name, MODEL_CONFIGS[model_name])
+        
+        if model_name in self.loaded_models:
+            self.loaded_models.move_to_end(model_name)
+        return model_info
+    
+    def get_total_memory_usage(self) -> float:
+        """已加载模型的总内存占用（MB）"""
+        return sum(info.memory_usage for info in self.loaded_models.values())
+    
+    def _estimate_model_memory(self, model_name: str, config: Dict[str, Any]) -> float:
+        """
+        加载前预估模型内存占用（MB）：
+        配置中的 memory_mb > 上次加载的实测值 > 权重文件大小
+        """
+        if config.get("memory_mb"):
+            return float(config["memory_mb"])
+        if model_name in self._memory_estimates:
+            return self._memory_estimates[model_name]
+        
+        model_path = os.path.join(settings.MODELS_DIR, f"{model_name}_{config['version']}.pth")
+        for path in (os.path.splitext(model_path)[0] + ".safetensors", model_path):
+            if os.path.exists(path):
+                return os.path.getsize(path) / 1024 / 1024
+        return 0.0
+    
+    def _evict_for(self, incoming: str, memory_mb: float) -> List[str]:
+        """
+        按LRU淘汰空闲模型，直到新模型（预估或实测大小 memory_mb）能放入数量和内存预算
+        正在处理请求的模型不会被淘汰；若没有可淘汰的模型则暂时超出预算
+        """
+        evicted = []
+        
+        while self.loaded_models:
+            others = [name for name in self.loaded_models if name != incoming]
+            count_ok = len(others) < self.model_cache_size
+            memory_ok = (
+                sum(self.loaded_models[name].memory_usage for name in others)
+                + memory_mb <= self.max_memory_usage
             )
-        ])
+            if count_ok and memory_ok:
+                break
+            
+            victim = self._coldest_idle_model(exclude=incoming)
+            if victim is None:
+                model_logger.warning(
+                    "模型缓存超出预算，但所有已加载模型都在使用中",
+                    incoming=incoming,
+                    loaded=list(self.loaded_models.keys()),
+                    total_memory_mb=round(self.get_total_memory_usage(), 2)
+                )
+                break
+            
+            self._drop_model(victim)
+            self.eviction_count += 1
+            evicted.append(victim)
+            model_logger.info("淘汰模型以满足缓存预算", model_name=victim, incoming=incoming)
+        
+        return evicted
+    
+    async def _close_batchers(self, model_names: List[str]):
+        """停止已淘汰模型的批处理队列"""
+        for model_name in model_names:
+            batcher = self._batchers.pop(model_name, None)
+            if batcher is not None:
+                await batcher.close()
+    
+    def _coldest_idle_model(self, exclude: Optional[str] = None) -> Optional[str]:
+        """找出最久未使用且没有活跃请求的模型"""
+        candidates = [
+            info for name, info in self.loaded_models.items()
+            if name != exclude and info.active_requests == 0
+        ]
+        if not candidates:
+            return None
+        
+        coldest = min(candidates, key=lambda info: info.last_used or info.loaded_at or datetime.min)
+        return coldest.name
+    
+    def _drop_model(self, model_name: str):
+        """
+        从缓存中移除模型并释放内存
+        仍有活跃请求时保留ModelInfo上的引用：执行中的批次仍在使用，完成后由GC回收
+        """
+        model_info = self.loaded_models.pop(model_name, None)
+        if model_info is None:
+            return
+        
+        self._memory_estimates[model_name] = model_info.memory_usage
+        if model_info.active_requests == 0:
+            # 后端（TorchScript/ONNX会话）和模型实例互相独立持有权重，都需要释放
+            model_info.backend = None
+            model_info.model_instance = None
+            model_info.preprocessor = None
+        
+        gc.collect()
+        if self.device.type == 'cuda':
+            torch.cuda.empty_cache()
+    
+    def _create_preprocessor(self, config: Dict[str, Any]) -> Preprocessor:
+        """
+        创建图像预处理器
+        接受PIL图像或解码阶段输出的 (H, W, 3) uint8 数组；数组已是输入尺寸时跳过缩放
+        """
+        return preprocessor_for(config)
     
     def _calculate_model_memory(self, model: nn.Module) -> float:
         """计算模型内存使用量（MB）"""
@@ -407,58 +827,179 @@ class ModelManager:
         size_mb = (param_size + buffer_size) / 1024 / 1024
         return round(size_mb, 2)
     
-    async def inference(self, model_name: str, image: Image.Image) -> Dict[str, Any]:
-        """执行模型推理"""
-        if model_name not in self.loaded_models:
-            raise ValueError(f"模型 {model_name} 未加载")
+    async def inference(self, model_name: str, image: Union[Image.Image, np.ndarray]) -> Dict[str, Any]:
+        """执行模型推理（模型按需加载，并发请求通过动态微批处理合并执行）"""
+        if not self.loads_models_locally:
+            if model_name not in MODEL_CONFIGS:
+                raise ValueError(f"未知模型: {model_name}")
+            return await self._get_batcher(model_name).submit(image)
         
-        model_info = self.loaded_models[model_name]
-        model_instance = model_info.model_instance
+        model_info = await self.get_model(model_name)
+        
+        model_info.active_requests += 1
+        try:
+            return await self._get_batcher(model_name).submit(image)
+        finally:
+            model_info.active_requests -= 1
+    
+    async def inference_from_bytes(self, model_name: str, image_bytes: bytes,
+                                   content_hash: Optional[str] = None
+                                   ) -> Tuple[Dict[str, Any], Tuple[int, int]]:
+        """
+        对原始图像字节执行推理，结果按内容摘要缓存
+        命中缓存时跳过图像解码和前向传播；返回 (推理结果, 原始图像尺寸)
+        """
+        if model_name not in MODEL_CONFIGS:
+            raise ValueError(f"未知模型: {model_name}")
+        
+        if not settings.ENABLE_INFERENCE_CACHE:
+            results, image_size = await self._inference_from_bytes(model_name, image_bytes)
+            results["cache_hit"] = False
+            return results, image_size
+        
+        cache_key = self.result_cache_key(model_name, image_bytes, content_hash)
+        computed = False
         
-        if model_instance is None:
-            raise ValueError(f"模型 {model_name} 实例为空")
+        async def compute() -> Dict[str, Any]:
+            nonlocal computed
+            computed = True
+            results, image_size = await self._inference_from_bytes(model_name, image_bytes)
+            return {"results": results, "image_size": list(image_size)}
+        
+        # 同一图像的并发请求（含其他worker）只推理一次；结果不变，过期后重新计算，不返回旧值
+        cached = await self.result_cache.get_or_compute(cache_key, compute)
+        if not computed:
+            model_logger.debug("推理结果缓存命中", model_name=model_name, key=cache_key)
+        results = cached["results"]
+        results["cache_hit"] = not computed
+        return results, tuple(cached["image_size"])
+    
+    async def _inference_from_bytes(self, model_name: str,
+                                    image_bytes: bytes) -> Tuple[Dict[str, Any], Tuple[int, int]]:
+        # 图像解码同样是CPU密集操作，放到线程中执行；直接解码到模型输入尺寸
+        input_size = MODEL_CONFIGS[model_name]["config"].get("input_size", 512)
+        loop = asyncio.get_running_loop()
+        decoded = await loop.run_in_executor(None, decode_image, image_bytes, (input_size, input_size))
+        results = await self.inference(model_name, decoded.array)
+        return results, decoded.original_size
+    
+    def result_cache_key(self, model_name: str, image_bytes: bytes,
+                         content_hash: Optional[str] = None) -> str:
+        """
+        推理结果缓存键：图像内容摘要 + 模型名称 + 模型版本 + 预处理配置摘要
+        模型版本、预处理配置或解码流程变化后旧缓存自然失效
+        """
+        config = MODEL_CONFIGS[model_name]
+        config_hash = hashlib.sha256(
+            json.dumps({**config["config"], "decoder_version": DECODER_VERSION},
+                       sort_keys=True).encode("utf-8")
+        ).hexdigest()[:16]
+        
+        return CacheKeys.format_key(
+            CacheKeys.INFERENCE_RESULT,
+            model_name=model_name,
+            model_version=config["version"],
+            config_hash=config_hash,
+            content_hash=content_hash or hashlib.sha256(image_bytes).hexdigest()
+        )
+    
+    def _get_batcher(self, model_name: str) -> InferenceBatcher:
+        """获取或创建指定模型的批处理队列"""
+        batcher = self._batchers.get(model_name)
+        if batcher is None:
+            async def runner(images: List[Image.Image]) -> List[Dict[str, Any]]:
+                return await self._execute_batch(model_name, images)
+            
+            batcher = InferenceBatcher(
+                model_name=model_name,
+                runner=runner,
+                max_batch_size=settings.BATCH_SIZE,
+                max_wait_ms=settings.BATCH_MAX_WAIT_MS,
+                max_concurrent_batches=self.executor.workers
+            )
+            self._batchers[model_name] = batcher
+        return batcher
+    
+    async def _execute_batch(self, model_name: str, images: List[Image.Image]) -> List[Dict[str, Any]]:
+        """通过推理执行器运行一批推理，不阻塞事件循环"""
+        if not self.loads_models_locally:
+            # 只传模型名称，模型在子进程中加载和常驻
+            return await self.executor.run_batch(model_name, images)
+        
+        # 模型在排队期间被手动卸载时会在这里重新加载
+        model_info = await self.get_model(model_name)
+        
+        # 本批次持有模型引用并计入活跃请求，期间被卸载时不会释放实例，批次能正常完成
+        def local_runner(name: str, batch_images: List[Image.Image]) -> List[Dict[str, Any]]:
+            return self._run_batch(name, batch_images, model_info)
+        
+        model_info.active_requests += 1
+        try:
+            return await self.executor.run_batch(model_name, images, local_runner)
+        finally:
+            model_info.active_requests -= 1
+    
+    def _run_batch(self, model_name: str, images: List[Union[Image.Image, np.ndarray]],
+                   model_info: Optional[ModelInfo] = None) -> List[Dict[str, Any]]:
+        """对一批图像执行一次堆叠前向传播，并按输入顺序拆分后处理结果"""
+        model_info = model_info or self.loaded_models.get(model_name)
+        if model_info is None or model_info.model_instance is None:
+            raise ValueError(f"模型 {model_name} 未加载")
         
+        model_instance = model_info.model_instance
+        backend = model_info.backend or EagerBackend(model_instance)
+        batch_size = len(images)
         start_time = time.time()
         
         try:
-            # 预处理
-            input_tensor = model_info.preprocessor(image).to(self.device)
+            # 一次性预处理为 (N, C, H, W)，写入复用的批缓冲区
+            input_tensor = model_info.preprocessor.batch(images).to(self.device)
             
-            # 推理
-            with torch.no_grad():
-                output = model_instance(input_tensor)
+            # 推理（各后端均返回torch.Tensor）
+            output = backend.run(input_tensor)
             
-            # 后处理
-            results = model_instance.postprocess(output)
+            # 后处理（逐样本拆分，保持单样本后处理逻辑不变）
+            batch_results = [
+                model_instance.postprocess(output[i:i + 1]) for i in range(batch_size)
+            ]
             
             # 更新统计信息
             inference_time = time.time() - start_time
             model_info.last_used = datetime.now()
-            model_info.inference_count += 1
+            model_info.inference_count += batch_size
             
             # 记录推理日志
             model_logger.model_inference(
                 model_name=model_name,
-                batch_size=1,
+                batch_size=batch_size,
                 inference_time=inference_time,
                 memory_usage=model_info.memory_usage
             )
             
             # 添加元数据
-            results.update({
-                "model_name": model_name,
-                "model_version": model_info.version,
-                "inference_time": inference_time,
-                "timestamp": datetime.now().isoformat(),
-                "device": str(self.device)
-            })
+            timestamp = datetime.now().isoformat()
+            for results in batch_results:
+                results.update({
+                    "model_name": model_name,
+                    "model_version": model_info.version,
+                    "inference_time": inference_time,
+                    "batch_size": batch_size,
+                    "backend": backend.name,
+                    "timestamp": timestamp,
+                    "device": str(self.device)
+                })
             
-            return results
+            return batch_results
             
         except Exception as e:
-            model_logger.error(f"模型推理失败", model_name=model_name, error=str(e))
+            model_logger.error(f"模型推理失败", model_name=model_name,
+                               batch_size=batch_size, error=str(e))
             raise
     
+    def get_batching_stats(self) -> Dict[str, Dict[str, Any]]:
+        """获取各模型的批处理统计信息"""
+        return {name: batcher.get_stats() for name, batcher in self._batchers.items()}
+    
     def get_loaded_models(self) -> Dict[str, Dict[str, Any]]:
         """获取已加载的模型信息"""
         return {name: info.to_dict() for name, info in self.loaded_models.items()}
@@ -469,6 +1010,20 @@ class ModelManager:
             return self.loaded_models[model_name].to_dict()
         return None
     
+    async def describe_model(self, model_name: str) -> Optional[Dict[str, Any]]:
+        """
+        模型信息：本进程已加载时返回实时信息，
+        否则读取加载该模型的worker发布的信息（纯API节点不加载模型）
+        """
+        local_info = self.get_model_info(model_name)
+        if local_info is not None:
+            return local_info
+        
+        # 本进程未加载时无从计算，只读取已发布的信息
+        return await redis_manager.get(
+            CacheKeys.format_key(CacheKeys.MODEL_INFO, model_name=model_name)
+        )
+    
     async def unload_model(self, model_name: str) -> bool:
         """卸载模型"""
         if model_name not in self.loaded_models:
@@ -477,14 +1032,15 @@ class ModelManager:
         try:
             model_info = self.loaded_models[model_name]
             
-            # 清理GPU内存
-            if model_info.model_instance is not None:
-                del model_info.model_instance
-                if self.device.type == 'cuda':
-                    torch.cuda.empty_cache()
+            # 没有活跃请求时停止该模型的批处理队列；
+            # 否则保留队列，排队中的请求会触发模型重新加载
+            if model_info.active_requests == 0:
+                batcher = self._batchers.pop(model_name, None)
+                if batcher is not None:
+                    await batcher.close()
             
-            # 移除模型信息
-            del self.loaded_models[model_name]
+            # 释放模型实例并移除模型信息
+            self._drop_model(model_name)
             
             model_logger.info(f"模型卸载成功", model_name=model_name)
             return True
@@ -495,24 +1051,30 @@ class ModelManager:
     
     async def reload_model(self, model_name: str) -> bool:
         """重新加载模型"""
-        # 先卸载
+        if model_name not in MODEL_CONFIGS:
+            return False
+        
+        # 先卸载再按模型注册表重新加载
         await self.unload_model(model_name)
         
-        # 重新加载（需要模型配置）
-        # 这里简化处理，实际应该保存模型配置
-        model_logger.info(f"模型重新加载", model_name=model_name)
-        return True
+        try:
+            await self.get_model(model_name)
+            model_logger.info(f"模型重新加载", model_name=model_name)
+            return True
+        except Exception as e:
+            model_logger.error(f"模型重新加载失败", model_name=model_name, error=str(e))
+            return False
     
     async def health_check(self) -> Dict[str, Any]:
         """模型服务健康检查"""
         try:
             loaded_count = len(self.loaded_models)
-            total_memory = sum(info.memory_usage for info in self.loaded_models.values())
+            total_memory = self.get_total_memory_usage()
             
-            # 检查关键模型是否加载
+            # 模型按需加载，只有加载失败的关键模型才视为缺失
             critical_models = ["intraoral", "facial"]
             missing_models = [model for model in critical_models 
-                            if model not in self.loaded_models]
+                            if model in self._load_errors]
             
             status = "healthy" if not missing_models else "degraded"
             
@@ -520,8 +1082,16 @@ class ModelManager:
                 "status": status,
                 "loaded_models": loaded_count,
                 "total_memory_mb": round(total_memory, 2),
+                "model_cache": {
+                    "max_models": self.model_cache_size,
+                    "max_memory_mb": self.max_memory_usage,
+                    "evictions": self.eviction_count
+                },
                 "missing_models": missing_models,
                 "device": str(self.device),
+                "process_memory": process_memory(),
+                "executor": self.executor.get_info(),
+                "result_cache": self.result_cache.get_stats(),
                 "models": list(self.loaded_models.keys())
             }
             
@@ -538,7 +1108,7 @@ class ModelManager:
         models_to_unload = []
         
         for model_name, model_info in self.loaded_models.items():
-            if model_info.last_used is None:
+            if model_info.last_used is None or model_info.active_requests > 0:
                 continue
                 
             idle_time = (current_time - model_info.last_used).total_seconds()
@@ -551,6 +1121,31 @@ class ModelManager:
         
         if models_to_unload:
             model_logger.info(f"清理长时间未使用的模型", models=models_to_unload)
+    
+    def start_maintenance(self):
+        """启动后台维护任务，定期卸载长时间空闲的模型"""
+        if self._maintenance_task is None or self._maintenance_task.done():
+            self._maintenance_task = asyncio.create_task(self._maintenance_loop())
+    
+    async def _maintenance_loop(self):
+        """后台维护循环"""
+        while True:
+            await asyncio.sleep(settings.MODEL_CLEANUP_INTERVAL)
+            try:
+                self.cleanup_unused_models(max_idle_time=settings.MODEL_IDLE_TIMEOUT)
+            except Exception as e:
+                model_logger.error("模型清理任务失败", error=str(e))
+    
+    async def shutdown(self):
+        """关闭模型管理器，停止所有批处理队列和推理执行器"""
+        if self._maintenance_task is not None:
+            self._maintenance_task.cancel()
+            self._maintenance_task = None
+        
+        for batcher in list(self._batchers.values()):
+            await batcher.close()
+        self._batchers.clear()
+        self.executor.shutdown(wait=False)
 
 
 # 全局模型管理器实例
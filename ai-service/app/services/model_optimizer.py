@@ -0,0 +1,329 @@
+"""
+CPU推理优化
+按模型启用的优化配置（profile），可组合以下选项：
+- dynamic_int8: 训练后动态int8量化（Linear层）
+- static_int8: 训练后静态int8量化（FX图模式），使用校准目录中的样本图像
+- channels_last: NHWC内存布局
+- inference_mode: 使用 torch.inference_mode 替代 no_grad
+量化结果以TorchScript格式缓存在权重文件旁，启动时不再重复量化和校准
+"""
+
+import os
+import copy
+import json
+import hashlib
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import torch
+import torch.nn as nn
+
+from app.core.config import settings
+from app.core.logger import model_logger
+from app.services.image_decoder import decode_image
+from app.services.inference_backends import (
+    InferenceBackend, EagerBackend, example_input, export_torchscript, benchmark_backend
+)
+
+
+OPTIMIZATION_FLAGS = ("dynamic_int8", "static_int8", "channels_last", "inference_mode")
+
+CALIBRATION_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tiff")
+
+
+class OptimizationProfile:
+    """模型优化配置"""
+
+    def __init__(self, flags: List[str]):
+        unknown = [flag for flag in flags if flag not in OPTIMIZATION_FLAGS]
+        if unknown:
+            raise ValueError(f"不支持的优化选项: {', '.join(unknown)}，可选: {', '.join(OPTIMIZATION_FLAGS)}")
+        if "dynamic_int8" in flags and "static_int8" in flags:
+            raise ValueError("dynamic_int8 与 static_int8 不能同时启用")
+        self.flags = sorted(set(flags))
+
+    @classmethod
+    def parse(cls, spec: str) -> "OptimizationProfile":
+        """解析形如 "static_int8+channels_last" 的配置"""
+        return cls([flag.strip() for flag in spec.split("+") if flag.strip()])
+
+    @property
+    def quantization(self) -> Optional[str]:
+        if "dynamic_int8" in self.flags:
+            return "dynamic"
+        if "static_int8" in self.flags:
+            return "static"
+        return None
+
+    @property
+    def channels_last(self) -> bool:
+        return "channels_last" in self.flags
+
+    @property
+    def inference_mode(self) -> bool:
+        return "inference_mode" in self.flags
+
+    @property
+    def name(self) -> str:
+        return "+".join(self.flags)
+
+
+class OptimizedBackend(InferenceBackend):
+    """在已有模块上应用内存布局和推理模式优化"""
+
+    def __init__(self, module: Callable[[torch.Tensor], torch.Tensor], profile: OptimizationProfile,
+                 base_name: str = "eager"):
+        self.module = module
+        self.profile = profile
+        self.name = f"{base_name}+{profile.name}"
+
+    def run(self, input_tensor: torch.Tensor) -> torch.Tensor:
+        context = torch.inference_mode() if self.profile.inference_mode else torch.no_grad()
+        with context:
+            if self.profile.channels_last:
+                input_tensor = input_tensor.contiguous(memory_format=torch.channels_last)
+            return self.module(input_tensor)
+
+
+def load_calibration_inputs(directory: str, preprocessor: Callable[[Any], torch.Tensor],
+                            max_images: int, input_size: int) -> Tuple[List[torch.Tensor], str]:
+    """读取校准目录中的样本图像（与线上相同的解码流程），返回预处理后的张量列表和样本集指纹"""
+    if not directory or not os.path.isdir(directory):
+        return [], ""
+
+    paths = sorted(
+        path for path in Path(directory).iterdir()
+        if path.suffix.lower() in CALIBRATION_EXTENSIONS
+    )[:max_images]
+
+    tensors = []
+    digest = hashlib.sha256()
+    for path in paths:
+        try:
+            decoded = decode_image(path.read_bytes(), (input_size, input_size))
+            tensors.append(preprocessor(decoded.array))
+            stat = path.stat()
+            digest.update(f"{path.name}:{stat.st_size}:{int(stat.st_mtime)}".encode())
+        except Exception as e:
+            model_logger.warning("校准图像读取失败", path=str(path), error=str(e))
+
+    return tensors, digest.hexdigest() if tensors else ""
+
+
+def _batches(tensors: List[torch.Tensor], batch_size: int) -> List[torch.Tensor]:
+    """按批大小堆叠样本"""
+    return [
+        torch.stack(tensors[i:i + batch_size])
+        for i in range(0, len(tensors), batch_size)
+    ]
+
+
+def quantize_dynamic_int8(module: nn.Module) -> nn.Module:
+    """动态int8量化：权重预先量化，激活在运行时量化（仅Linear层）"""
+    return torch.ao.quantization.quantize_dynamic(
+        copy.deepcopy(module).eval(), {nn.Linear}, dtype=torch.qint8
+    )
+
+
+def quantize_static_int8(module: nn.Module, example: torch.Tensor,
+                         calibration: List[torch.Tensor]) -> nn.Module:
+    """静态int8量化：FX图模式插入观察器，用校准数据统计激活范围后转换"""
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+    qconfig_mapping = get_default_qconfig_mapping(torch.backends.quantized.engine)
+    prepared = prepare_fx(copy.deepcopy(module).eval(), qconfig_mapping, (example,))
+
+    with torch.no_grad():
+        for batch in calibration:
+            prepared(batch)
+
+    return convert_fx(prepared)
+
+
+def compare_outputs(reference: InferenceBackend, candidate: InferenceBackend,
+                    batches: List[torch.Tensor]) -> Dict[str, Any]:
+    """对比优化前后的输出：top-1一致率和输出误差"""
+    agree = total = 0
+    abs_diffs = []
+    max_abs_diff = 0.0
+
+    for batch in batches:
+        expected = reference.run(batch).float()
+        actual = candidate.run(batch).float()
+        agree += (expected.argmax(dim=1) == actual.argmax(dim=1)).sum().item()
+        total += batch.shape[0]
+        diff = (expected - actual).abs()
+        abs_diffs.append(diff.mean().item())
+        max_abs_diff = max(max_abs_diff, diff.max().item())
+
+    return {
+        "samples": total,
+        "top1_agreement": round(agree / total, 4) if total else None,
+        "mean_abs_diff": round(sum(abs_diffs) / len(abs_diffs), 6) if abs_diffs else None,
+        "max_abs_diff": round(max_abs_diff, 6),
+    }
+
+
+def cache_paths(model_path: str, profile: OptimizationProfile) -> Tuple[str, str]:
+    """量化模型缓存路径和对应的元数据路径"""
+    base, _ = os.path.splitext(model_path)
+    suffix = f".{profile.quantization}_int8{'.cl' if profile.channels_last else ''}"
+    return f"{base}{suffix}.ts.pt", f"{base}{suffix}.json"
+
+
+def _weights_mtime(model_path: str) -> Optional[float]:
+    return os.path.getmtime(model_path) if os.path.exists(model_path) else None
+
+
+def _load_cached(model_path: str, profile: OptimizationProfile, calibration_fingerprint: str,
+                 device: torch.device) -> Optional[Tuple[torch.jit.ScriptModule, Dict[str, Any]]]:
+    """读取量化缓存，权重、校准集或torch版本变化时视为失效"""
+    artifact_path, meta_path = cache_paths(model_path, profile)
+    if not (os.path.exists(artifact_path) and os.path.exists(meta_path)):
+        return None
+
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except Exception:
+        return None
+
+    # 没有权重文件时每次启动都是随机权重，缓存无法复用
+    weights_mtime = _weights_mtime(model_path)
+    if weights_mtime is None or meta.get("weights_mtime") != weights_mtime:
+        return None
+    if meta.get("torch_version") != torch.__version__:
+        return None
+    if profile.quantization == "static" and meta.get("calibration_fingerprint") != calibration_fingerprint:
+        return None
+
+    module = torch.jit.load(artifact_path, map_location=device)
+    module.eval()
+    return module, meta.get("report", {})
+
+
+def _save_cache(model_path: str, profile: OptimizationProfile, module: nn.Module, example: torch.Tensor,
+                calibration_fingerprint: str, report: Dict[str, Any]):
+    """将量化模型保存为TorchScript并写入元数据"""
+    weights_mtime = _weights_mtime(model_path)
+    if weights_mtime is None:
+        return
+
+    artifact_path, meta_path = cache_paths(model_path, profile)
+    tmp_path = f"{artifact_path}.{os.getpid()}.tmp"
+    try:
+        export_torchscript(module, example, tmp_path)
+        os.replace(tmp_path, artifact_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "profile": profile.name,
+            "weights_mtime": weights_mtime,
+            "calibration_fingerprint": calibration_fingerprint,
+            "torch_version": torch.__version__,
+            "quantized_engine": torch.backends.quantized.engine,
+            "report": report,
+        }, f, ensure_ascii=False, indent=2)
+
+
+def optimize_model(model_instance: nn.Module, model_path: str, config: Dict[str, Any],
+                   preprocessor: Callable[[Any], torch.Tensor], profile: OptimizationProfile,
+                   device: torch.device, base_backend: Optional[InferenceBackend] = None,
+                   force: bool = False) -> Tuple[InferenceBackend, Dict[str, Any]]:
+    """
+    按配置优化模型，返回优化后的推理后端和报告（精度差异、吞吐提升）
+    量化结果优先从磁盘缓存读取；force=True 时重新量化
+    """
+    fp32 = EagerBackend(model_instance)
+    base_backend = base_backend or fp32
+
+    if profile.quantization is None:
+        # 仅布局和推理模式优化，作用于当前后端的模块
+        module = getattr(base_backend, "module", None)
+        if module is None:
+            # ONNX Runtime 自行管理内存布局和图优化
+            return base_backend, {"profile": profile.name, "skipped": f"{base_backend.name}后端不适用"}
+        if profile.channels_last and not isinstance(module, torch.jit.ScriptModule):
+            # nn.Module.to 原地修改参数，在副本上转换，fp32模块和其他后端不受影响
+            module = copy.deepcopy(module).to(memory_format=torch.channels_last)
+        return OptimizedBackend(module, profile, base_name=base_backend.name), {"profile": profile.name}
+
+    if device.type != "cpu":
+        raise RuntimeError("int8量化仅支持CPU推理")
+
+    calibration, fingerprint = load_calibration_inputs(
+        settings.CALIBRATION_DATA_DIR, preprocessor, settings.CALIBRATION_MAX_IMAGES,
+        config.get("input_size", 512)
+    )
+    synthetic = not calibration
+    if synthetic:
+        if profile.quantization == "static":
+            raise RuntimeError(f"静态量化需要校准图像，目录为空: {settings.CALIBRATION_DATA_DIR}")
+        # 动态量化不需要校准，精度对比使用随机输入
+        calibration = list(example_input(config, batch_size=8))
+
+    batch_size = max(1, settings.BATCH_SIZE)
+    batches = [batch.to(device) for batch in _batches(calibration, batch_size)]
+    example = example_input(config).to(device)
+    if profile.channels_last:
+        example = example.contiguous(memory_format=torch.channels_last)
+
+    cached = None if force else _load_cached(model_path, profile, fingerprint, device)
+    if cached is not None:
+        module, report = cached
+        model_logger.info("使用量化模型缓存", model_path=model_path, profile=profile.name)
+        return OptimizedBackend(module, profile, base_name="torchscript"), report
+
+    source = copy.deepcopy(model_instance).eval()
+    if profile.channels_last:
+        source = source.to(memory_format=torch.channels_last)
+        batches = [batch.contiguous(memory_format=torch.channels_last) for batch in batches]
+
+    if profile.quantization == "dynamic":
+        quantized = quantize_dynamic_int8(source)
+    else:
+        quantized = quantize_static_int8(source, example, batches)
+
+    optimized = OptimizedBackend(quantized, profile)
+
+    # 精度差异（相对fp32）和吞吐提升
+    accuracy = compare_outputs(fp32, optimized, batches)
+    bench_input = batches[0]
+    fp32_latency = benchmark_backend(fp32, bench_input)
+    optimized_latency = benchmark_backend(optimized, bench_input)
+
+    report = {
+        "profile": profile.name,
+        "calibration_samples": 0 if synthetic else len(calibration),
+        "synthetic_inputs": synthetic,
+        "accuracy": accuracy,
+        "fp32_latency": fp32_latency,
+        "optimized_latency": optimized_latency,
+        "throughput_gain": round(fp32_latency["mean_ms"] / optimized_latency["mean_ms"], 3)
+        if optimized_latency["mean_ms"] else None,
+    }
+
+    if accuracy["top1_agreement"] is not None and accuracy["top1_agreement"] < settings.QUANTIZATION_MIN_AGREEMENT:
+        model_logger.warning("量化后top-1一致率偏低", model_path=model_path, **accuracy)
+
+    _save_cache(model_path, profile, quantized, example, fingerprint, report)
+    model_logger.info("模型优化完成", model_path=model_path, profile=profile.name,
+                      throughput_gain=report["throughput_gain"],
+                      top1_agreement=accuracy["top1_agreement"])
+
+    return optimized, report
+
+
+# 导出
+__all__ = [
+    "OPTIMIZATION_FLAGS",
+    "OptimizationProfile",
+    "OptimizedBackend",
+    "load_calibration_inputs",
+    "compare_outputs",
+    "optimize_model",
+]
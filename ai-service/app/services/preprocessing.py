@@ -0,0 +1,109 @@
+"""
+图像预处理
+替代 torchvision 的 Resize -> ToTensor -> Normalize 组合：
+- 缩放只做一次（解码阶段已缩放到输入尺寸时跳过）
+- uint8 -> float 转换与归一化融合为一次查表（每个通道256项），不产生中间张量
+- 批处理时直接写入每个线程复用的 (N, C, H, W) float 缓冲区
+"""
+
+import threading
+from functools import lru_cache
+from typing import Any, Dict, List, Sequence, Tuple, Union
+
+import numpy as np
+import torch
+from PIL import Image
+
+from app.core.config import settings
+
+
+ImageInput = Union[Image.Image, np.ndarray]
+
+
+class Preprocessor:
+    """融合预处理器"""
+
+    def __init__(self, input_size: int, mean: Sequence[float], std: Sequence[float]):
+        self.input_size = input_size
+        mean_array = np.asarray(mean, dtype=np.float32)
+        std_array = np.asarray(std, dtype=np.float32)
+
+        # 查找表: lut[c][v] = (v / 255 - mean[c]) / std[c]
+        self._lut = (
+            (np.arange(256, dtype=np.float32)[None, :] / 255.0 - mean_array[:, None]) / std_array[:, None]
+        ).astype(np.float32)
+
+        self._local = threading.local()
+
+    def _to_uint8(self, image: ImageInput) -> np.ndarray:
+        """转换为输入尺寸的 (H, W, 3) uint8 数组；解码阶段的输出直接复用"""
+        size = (self.input_size, self.input_size)
+
+        if isinstance(image, np.ndarray):
+            if image.dtype == np.uint8 and image.shape == (self.input_size, self.input_size, 3):
+                return image
+            image = Image.fromarray(image)
+
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        if image.size != size:
+            image = image.resize(size, Image.BILINEAR)
+        return np.asarray(image)
+
+    def _normalize_into(self, pixels: np.ndarray, out: np.ndarray):
+        """按通道查表，将 (H, W, 3) uint8 写入 (3, H, W) float32"""
+        for channel in range(3):
+            np.take(self._lut[channel], pixels[:, :, channel], out=out[channel], mode="clip")
+
+    def __call__(self, image: ImageInput) -> torch.Tensor:
+        """预处理单张图像，返回新的 (3, H, W) 张量"""
+        out = np.empty((3, self.input_size, self.input_size), dtype=np.float32)
+        self._normalize_into(self._to_uint8(image), out)
+        return torch.from_numpy(out)
+
+    def _batch_buffer(self, batch_size: int) -> np.ndarray:
+        """当前线程的批缓冲区，容量不足时扩容"""
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None or buffer.shape[0] < batch_size:
+            capacity = max(batch_size, settings.BATCH_SIZE)
+            buffer = np.empty((capacity, 3, self.input_size, self.input_size), dtype=np.float32)
+            self._local.buffer = buffer
+        return buffer
+
+    def batch(self, images: List[ImageInput]) -> torch.Tensor:
+        """
+        预处理一批图像，返回 (N, 3, H, W) 张量
+        返回的张量复用当前线程的缓冲区，只在同一线程下一次调用 batch 之前有效
+        """
+        buffer = self._batch_buffer(len(images))
+        for index, image in enumerate(images):
+            self._normalize_into(self._to_uint8(image), buffer[index])
+        return torch.from_numpy(buffer[:len(images)])
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # 线程本地缓冲区不参与复制和序列化
+        state = self.__dict__.copy()
+        state.pop("_local", None)
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+
+@lru_cache(maxsize=None)
+def _get_preprocessor(input_size: int, mean: Tuple[float, ...], std: Tuple[float, ...]) -> Preprocessor:
+    return Preprocessor(input_size, mean, std)
+
+
+def preprocessor_for(config: Dict[str, Any]) -> Preprocessor:
+    """按模型配置获取预处理器，相同配置的模型共享同一实例"""
+    return _get_preprocessor(
+        config.get("input_size", 512),
+        tuple(config.get("normalize_mean", [0.485, 0.456, 0.406])),
+        tuple(config.get("normalize_std", [0.229, 0.224, 0.225])),
+    )
+
+
+# 导出
+__all__ = ["Preprocessor", "preprocessor_for"]
@@ -0,0 +1,301 @@
+"""
+第三方AI服务调用容错
+- 重试：连接错误、超时和 429/502/503/504 按指数退避（全抖动）重试，最多 MAX_ANALYSIS_RETRIES 次，
+  响应带 Retry-After 时至少等待该时间；分析接口对同一输入结果相同，可安全重试
+- 熔断：按接口统计最近请求的失败率，达到阈值后在 THIRD_PARTY_AI_BREAKER_RESET 秒内直接失败，
+  之后放行一个探测请求，成功则恢复，失败则继续熔断；429只表示限流，不计为失败
+- 重试预算：滑动窗口内重试次数不超过请求次数的 THIRD_PARTY_AI_RETRY_BUDGET_RATIO（另有少量保底），
+  上游故障时出站请求量不会因重试成倍增加
+均为每个worker独立计算
+"""
+
+import time
+import random
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+import httpx
+
+from app.core.config import settings
+from app.core.logger import api_logger
+from app.core.metrics import THIRD_PARTY_RETRIES, THIRD_PARTY_REJECTED, THIRD_PARTY_BREAKER_STATE
+from app.services.adaptive_limiter import parse_retry_after
+
+
+# 可重试的响应状态码
+RETRYABLE_STATUS = (429, 502, 503, 504)
+
+# 熔断器状态（指标取值）
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# 重试预算的统计窗口（秒）
+BUDGET_WINDOW = 10
+
+
+class CircuitOpenError(RuntimeError):
+    """接口处于熔断状态，请求未发送"""
+
+    def __init__(self, endpoint: str, retry_in: float):
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+        super().__init__(f"第三方接口 {endpoint} 暂不可用（熔断中），{retry_in:.0f}秒后重试")
+
+
+class CircuitBreaker:
+    """按失败率熔断：最近 window 次结果中失败占比达到阈值（且样本足够）时打开"""
+
+    def __init__(self, endpoint: str, failure_rate: float, window: int, min_calls: int, reset_timeout: float):
+        self.endpoint = endpoint
+        self.failure_rate = failure_rate
+        self.min_calls = max(min_calls, 1)
+        self.reset_timeout = reset_timeout
+
+        self.state = CLOSED
+        self._outcomes: Deque[bool] = deque(maxlen=max(window, self.min_calls))
+        self._opened_at = 0.0
+        self._probing = False
+        self.opened_count = 0
+
+    @property
+    def failures(self) -> int:
+        return sum(1 for ok in self._outcomes if not ok)
+
+    def before_call(self) -> bool:
+        """
+        请求前检查：熔断中直接失败；冷却结束后只放行一个探测请求
+        返回本次请求是否为探测请求
+        """
+        if self.state == CLOSED:
+            return False
+        now = time.monotonic()
+        if self.state == OPEN:
+            retry_in = self._opened_at + self.reset_timeout - now
+            if retry_in > 0:
+                raise CircuitOpenError(self.endpoint, retry_in)
+            self._set_state(HALF_OPEN)
+        if self._probing:
+            raise CircuitOpenError(self.endpoint, self.reset_timeout)
+        self._probing = True
+        return True
+
+    def record_success(self, probe: bool):
+        if probe:
+            # 探测成功：恢复并清空历史结果
+            self._probing = False
+            self._outcomes.clear()
+            self._set_state(CLOSED)
+            api_logger.info("第三方接口熔断恢复", endpoint=self.endpoint)
+        elif self.state == CLOSED:
+            self._outcomes.append(True)
+
+    def record_failure(self, probe: bool):
+        if probe:
+            self._probing = False
+            self._open()
+            return
+        if self.state != CLOSED:
+            # 熔断前发出的请求陆续失败，不延长熔断时间
+            return
+        self._outcomes.append(False)
+        if len(self._outcomes) >= self.min_calls and self.failures / len(self._outcomes) >= self.failure_rate:
+            self.opened_count += 1
+            api_logger.warning(
+                "第三方接口熔断",
+                endpoint=self.endpoint,
+                failures=self.failures,
+                calls=len(self._outcomes),
+                reset_timeout=self.reset_timeout
+            )
+            self._open()
+
+    def record_neutral(self, probe: bool):
+        """既不代表上游故障也不代表恢复（如429限流、本地错误），只结束探测"""
+        if probe:
+            self._probing = False
+
+    def _open(self):
+        self._opened_at = time.monotonic()
+        self._set_state(OPEN)
+
+    def _set_state(self, state: str):
+        self.state = state
+        THIRD_PARTY_BREAKER_STATE.labels(endpoint=self.endpoint).set(_STATE_VALUES[state])
+
+
+class RetryBudget:
+    """滑动窗口重试预算：窗口内重试数 <= 请求数 * ratio + 保底次数"""
+
+    def __init__(self, ratio: float, min_per_second: float, window: int = BUDGET_WINDOW):
+        self.ratio = ratio
+        self.min_retries = min_per_second * window
+        self.window = window
+        # 每秒一个桶：[秒, 请求数, 重试数]
+        self._buckets: Deque[list] = deque()
+
+    def _bucket(self) -> list:
+        now = int(time.monotonic())
+        while self._buckets and self._buckets[0][0] <= now - self.window:
+            self._buckets.popleft()
+        if not self._buckets or self._buckets[-1][0] != now:
+            self._buckets.append([now, 0, 0])
+        return self._buckets[-1]
+
+    def record_request(self):
+        self._bucket()[1] += 1
+
+    def try_retry(self) -> bool:
+        """预算允许时记一次重试并返回True"""
+        bucket = self._bucket()
+        requests = sum(b[1] for b in self._buckets)
+        retries = sum(b[2] for b in self._buckets)
+        if retries >= requests * self.ratio + self.min_retries:
+            return False
+        bucket[2] += 1
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        self._bucket()
+        return {
+            "window_requests": sum(b[1] for b in self._buckets),
+            "window_retries": sum(b[2] for b in self._buckets),
+        }
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """第attempt次重试前的等待时间：指数退避 + 全抖动，不少于Retry-After"""
+    cap = min(settings.THIRD_PARTY_AI_RETRY_MAX_DELAY, settings.THIRD_PARTY_AI_RETRY_BASE_DELAY * (2 ** attempt))
+    delay = random.uniform(0, cap)
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, settings.THIRD_PARTY_AI_RETRY_MAX_DELAY))
+    return delay
+
+
+class EndpointResilience:
+    """单个接口的熔断器和重试预算"""
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.breaker = CircuitBreaker(
+            endpoint,
+            failure_rate=settings.THIRD_PARTY_AI_BREAKER_FAILURE_RATE,
+            window=settings.THIRD_PARTY_AI_BREAKER_WINDOW,
+            min_calls=settings.THIRD_PARTY_AI_BREAKER_MIN_CALLS,
+            reset_timeout=settings.THIRD_PARTY_AI_BREAKER_RESET
+        )
+        self.budget = RetryBudget(
+            ratio=settings.THIRD_PARTY_AI_RETRY_BUDGET_RATIO,
+            min_per_second=settings.THIRD_PARTY_AI_RETRY_MIN_PER_SECOND
+        )
+        self._stats = {"calls": 0, "attempts": 0, "retries": 0, "circuit_rejected": 0, "budget_rejected": 0}
+        THIRD_PARTY_BREAKER_STATE.labels(endpoint=endpoint).set(0)
+
+    async def call(self, send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        """
+        执行请求并按需重试
+        最终仍失败时：传输错误原样抛出，错误响应原样返回（由调用方 raise_for_status）
+        """
+        self._stats["calls"] += 1
+        attempt = 0
+        while True:
+            try:
+                probe = self.breaker.before_call()
+            except CircuitOpenError:
+                self._stats["circuit_rejected"] += 1
+                THIRD_PARTY_REJECTED.labels(endpoint=self.endpoint, reason="circuit_open").inc()
+                raise
+
+            self._stats["attempts"] += 1
+            if attempt == 0:
+                self.budget.record_request()
+            error: Optional[Exception] = None
+            response: Optional[httpx.Response] = None
+            try:
+                response = await send()
+            except httpx.TransportError as e:
+                self.breaker.record_failure(probe)
+                error = e
+                reason = "timeout" if isinstance(e, httpx.TimeoutException) else "transport"
+            except BaseException:
+                self.breaker.record_neutral(probe)
+                raise
+            else:
+                status = response.status_code
+                if status not in RETRYABLE_STATUS:
+                    # 其他4xx是请求本身的问题，不代表上游故障
+                    self.breaker.record_success(probe)
+                    return response
+                if status == 429:
+                    self.breaker.record_neutral(probe)
+                else:
+                    self.breaker.record_failure(probe)
+                reason = str(status)
+
+            if attempt >= settings.MAX_ANALYSIS_RETRIES:
+                return self._give_up(response, error)
+            if not self.budget.try_retry():
+                self._stats["budget_rejected"] += 1
+                THIRD_PARTY_REJECTED.labels(endpoint=self.endpoint, reason="retry_budget").inc()
+                return self._give_up(response, error)
+
+            retry_after = parse_retry_after(response) if response is not None else None
+            delay = backoff_delay(attempt, retry_after)
+            attempt += 1
+            self._stats["retries"] += 1
+            THIRD_PARTY_RETRIES.labels(endpoint=self.endpoint, reason=reason).inc()
+            api_logger.debug("第三方接口重试", endpoint=self.endpoint, attempt=attempt, reason=reason, delay=round(delay, 2))
+            if response is not None:
+                await response.aclose()
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _give_up(response: Optional[httpx.Response], error: Optional[Exception]) -> httpx.Response:
+        if error is not None:
+            raise error
+        return response
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "breaker": self.breaker.state,
+            "window_failures": self.breaker.failures,
+            "opened": self.breaker.opened_count,
+            **self._stats,
+            **self.budget.get_stats()
+        }
+
+
+class ThirdPartyResilience:
+    """按接口划分的容错策略集合，两个第三方客户端共用"""
+
+    def __init__(self):
+        self._endpoints: Dict[str, EndpointResilience] = {}
+
+    def get(self, endpoint: str) -> EndpointResilience:
+        policy = self._endpoints.get(endpoint)
+        if policy is None:
+            policy = EndpointResilience(endpoint)
+            self._endpoints[endpoint] = policy
+        return policy
+
+    async def call(self, endpoint: str, send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        return await self.get(endpoint).call(send)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {endpoint: policy.get_stats() for endpoint, policy in self._endpoints.items()}
+
+
+# 全局容错策略实例
+third_party_resilience = ThirdPartyResilience()
+
+
+# 导出
+__all__ = [
+    "CircuitOpenError",
+    "CircuitBreaker",
+    "RetryBudget",
+    "EndpointResilience",
+    "ThirdPartyResilience",
+    "third_party_resilience",
+    "backoff_delay",
+]
@@ -0,0 +1,108 @@
+"""
+推理结果缓存
+按图像内容摘要缓存模型推理结果，重复上传的图像无需解码和前向传播
+两级缓存：进程内LRU + Redis，Redis层经 get_or_compute 防止热点结果过期时并发重算
+推理结果对同一模型版本不会变化，不返回过期旧值也不提前刷新；本地条目按写入时间过期，不会比Redis条目存活更久
+"""
+
+import copy
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.core.redis import redis_manager
+
+
+class InferenceResultCache:
+    """推理结果两级缓存"""
+
+    def __init__(self, local_size: Optional[int] = None, ttl: Optional[int] = None):
+        self.local_size = local_size if local_size is not None else settings.INFERENCE_CACHE_LOCAL_SIZE
+        self.ttl = ttl or settings.INFERENCE_CACHE_TTL
+
+        # key -> (过期时间, 结果)
+        self._local: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    def _get_local(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            return value
+
+    def _set_local(self, key: str, value: Dict[str, Any], ttl: Optional[float] = None):
+        if self.local_size <= 0:
+            return
+        with self._lock:
+            self._local[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._local.move_to_end(key)
+            while len(self._local) > self.local_size:
+                self._local.popitem(last=False)
+
+    async def _backfill_local(self, key: str, value: Dict[str, Any]):
+        """Redis命中时回填本地缓存，本地条目不晚于Redis条目过期"""
+        remaining = await redis_manager.ttl(key)
+        if remaining == 0 or remaining == -2:
+            return
+        self._set_local(key, value, ttl=remaining if remaining > 0 else None)
+
+    async def get_or_compute(self, key: str,
+                             compute: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """
+        本地LRU未命中时读取Redis或执行计算：同一结果跨worker只计算一次
+        """
+        value = self._get_local(key)
+        if value is not None:
+            self.local_hits += 1
+            return copy.deepcopy(value)
+
+        computed = False
+
+        async def counted() -> Dict[str, Any]:
+            nonlocal computed
+            computed = True
+            return await compute()
+
+        value = await redis_manager.get_or_compute(
+            key, counted, ttl=self.ttl, stale_ttl=0, beta=0, lock_ttl=settings.ANALYSIS_TIMEOUT
+        )
+        if computed:
+            self.misses += 1
+            self._set_local(key, copy.deepcopy(value))
+        else:
+            self.redis_hits += 1
+            await self._backfill_local(key, copy.deepcopy(value))
+        return copy.deepcopy(value)
+
+    def clear_local(self):
+        """清空本地缓存"""
+        with self._lock:
+            self._local.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存命中统计"""
+        total = self.local_hits + self.redis_hits + self.misses
+        return {
+            "local_size": len(self._local),
+            "local_capacity": self.local_size,
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.local_hits + self.redis_hits) / total, 4) if total else 0.0,
+        }
+
+
+# 导出
+__all__ = ["InferenceResultCache"]
@@ -0,0 +1,162 @@
+"""
+单飞（single-flight）去重
+相同键的并发计算只执行一次，其余调用方等待并共享同一结果
+- 进程内：共享同一个Future
+- 跨worker：Redis分布式锁选出执行者，完成后通过发布订阅通知等待者
+"""
+
+import json
+import uuid
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.core.config import settings
+from app.core.logger import cache_logger
+from app.core.redis import redis_manager, CacheKeys
+
+
+class SingleFlightError(RuntimeError):
+    """执行者计算失败时，等待者收到的异常"""
+
+
+class _LeaderCancelled(Exception):
+    """进程内执行者被取消，等待者需要重新竞争"""
+
+
+def _is_outcome(value: Any) -> bool:
+    """是否为执行者留下的结果或错误记录"""
+    return isinstance(value, dict) and ("result" in value or "error" in value)
+
+
+class SingleFlight:
+    """单飞去重器"""
+
+    def __init__(self, lock_ttl: Optional[int] = None, result_ttl: int = 60):
+        # 锁的有效期同时作为等待上限，执行者崩溃后锁过期，等待者可接手
+        self.lock_ttl = lock_ttl or settings.ANALYSIS_TIMEOUT
+        self.result_ttl = result_ttl
+
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+        self.leader_runs = 0
+        self.local_shared = 0
+        self.remote_shared = 0
+
+    async def do(self, key: str, compute: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """
+        执行计算或加入正在进行的相同计算
+        compute 的返回值需要可JSON序列化，以便跨worker共享
+        """
+        while True:
+            future = self._inflight.get(key)
+            if future is None:
+                break
+            try:
+                result = await asyncio.shield(future)
+                self.local_shared += 1
+                return result
+            except _LeaderCancelled:
+                continue
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+
+        try:
+            result = await self._do_distributed(key, compute)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.set_exception(_LeaderCancelled())
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._inflight.pop(key, None)
+            # 没有等待者时避免 "exception was never retrieved" 警告
+            if future.done() and not future.cancelled():
+                future.exception()
+
+    async def _do_distributed(self, key: str,
+                              compute: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """跨worker去重：获得锁的worker执行计算，其余worker等待通知"""
+        lock_key = CacheKeys.format_key(CacheKeys.ANALYSIS_INFLIGHT_LOCK, flight_key=key)
+        result_key = CacheKeys.format_key(CacheKeys.ANALYSIS_INFLIGHT_RESULT, flight_key=key)
+        channel = CacheKeys.format_key(CacheKeys.ANALYSIS_INFLIGHT_CHANNEL, flight_key=key)
+        token = uuid.uuid4().hex
+
+        while True:
+            if await redis_manager.acquire_lock(lock_key, token, self.lock_ttl):
+                self.leader_runs += 1
+                try:
+                    result = await compute()
+                    await redis_manager.set(result_key, {"result": result}, ttl=self.result_ttl)
+                    await redis_manager.publish(channel, {"done": True})
+                    return result
+                except Exception as e:
+                    # 失败同样留下记录，避免晚到的等待者错过通知
+                    await redis_manager.set(result_key, {"error": str(e)}, ttl=self.result_ttl)
+                    await redis_manager.publish(channel, {"error": str(e)})
+                    raise
+                finally:
+                    await redis_manager.release_lock(lock_key, token)
+
+            outcome = await self._wait_for_leader(lock_key, result_key, channel)
+            if outcome is None:
+                # 执行者已消失且没有留下结果，重新竞争执行权
+                continue
+            if "error" in outcome:
+                raise SingleFlightError(outcome["error"])
+
+            self.remote_shared += 1
+            return outcome["result"]
+
+    async def _wait_for_leader(self, lock_key: str, result_key: str,
+                               channel: str) -> Optional[Dict[str, Any]]:
+        """等待其他worker上的执行者完成，返回结果/错误；执行者消失时返回None"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.lock_ttl
+
+        pubsub = redis_manager.pubsub()
+        await pubsub.subscribe(channel)
+        try:
+            while loop.time() < deadline:
+                # 先订阅再查结果，避免错过订阅前已发布的完成通知
+                cached = await redis_manager.get(result_key)
+                if _is_outcome(cached):
+                    return cached
+
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message is not None:
+                    data = json.loads(message["data"])
+                    if "error" in data:
+                        return data
+                    continue
+
+                if not await redis_manager.exists(lock_key):
+                    cached = await redis_manager.get(result_key)
+                    if _is_outcome(cached):
+                        return cached
+                    cache_logger.warning("单飞执行者未留下结果即退出", lock_key=lock_key)
+                    return None
+
+            return None
+        finally:
+            try:
+                await pubsub.unsubscribe(channel)
+                await pubsub.reset()
+            except Exception as e:
+                cache_logger.debug("关闭订阅失败", channel=channel, error=str(e))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取去重统计"""
+        return {
+            "inflight": len(self._inflight),
+            "leader_runs": self.leader_runs,
+            "local_shared": self.local_shared,
+            "remote_shared": self.remote_shared,
+        }
+
+
+# 导出
+__all__ = ["SingleFlight", "SingleFlightError"]
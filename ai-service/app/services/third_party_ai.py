@@ -5,12 +5,16 @@
 
 import httpx
 import asyncio
-from typing import Dict, Any, Optional, List, Union
+from typing import Dict, Any, Optional, List, Tuple, Union
 from pathlib import Path
 import json
 import logging
 
 from app.core.config import settings
+from app.services.adaptive_limiter import third_party_limiter
+from app.services.resilience import third_party_resilience
+from app.services.third_party_cache import third_party_cache
+from app.services.token_manager import TokenManager
 
 logger = logging.getLogger(__name__)
 
@@ -33,11 +37,18 @@ class ThirdPartyAIClient:
                 "Content-Type": "application/json"
             }
         )
+        
+        # 访问令牌（Redis中跨worker共享，到期前主动刷新；与简化版客户端使用同一凭据时共用令牌）
+        self.tokens = TokenManager(self._fetch_token, credential=f"{self.base_url}|{self.api_key}")
     
     async def authenticate(self) -> str:
         """
-        获取访问令牌
+        获取访问令牌（已有有效令牌时直接返回）
         """
+        return await self.tokens.get_token()
+    
+    async def _fetch_token(self) -> Tuple[str, Optional[float]]:
+        """调用认证接口，返回令牌和有效期（秒）"""
         try:
             response = await self.client.post("/auth/token", json={
                 "api_key": self.api_key,
@@ -46,15 +57,8 @@ class ThirdPartyAIClient:
             response.raise_for_status()
             
             result = response.json()
-            token = result.get("access_token")
-            
-            # 更新客户端头部
-            self.client.headers.update({
-                "Authorization": f"Bearer {token}"
-            })
-            
             logger.info("第三方AI服务认证成功")
-            return token
+            return result["access_token"], result.get("expires_in")
             
         except Exception as e:
             logger.error(f"第三方AI服务认证失败: {str(e)}")
@@ -203,27 +207,21 @@ class ThirdPartyAIClient:
         """
         通用2D图像分析方法
         """
-        try:
-            # 确保已认证
-            if "Authorization" not in self.client.headers:
-                await self.authenticate()
-            
+        async def fetch() -> Dict[str, Any]:
             # 准备文件上传
             with open(image_path, "rb") as f:
                 files = {"image": (Path(image_path).name, f, "image/jpeg")}
                 data = {"params": json.dumps(params)}
                 
-                response = await self.client.post(
-                    f"/{endpoint}",
-                    files=files,
-                    data=data
-                )
+                response = await self._send("POST", endpoint, files=files, data=data)
                 response.raise_for_status()
-                
-                result = response.json()
-                logger.info(f"2D分析完成: {endpoint}")
-                return result
-                
+                return response.json()
+        
+        try:
+            result = await third_party_cache.get_or_fetch(endpoint, [image_path], params, fetch)
+            logger.info(f"2D分析完成: {endpoint}")
+            return result
+        
         except Exception as e:
             logger.error(f"2D分析失败 {endpoint}: {str(e)}")
             raise
@@ -232,27 +230,21 @@ class ThirdPartyAIClient:
         """
         通用3D模型分析方法
         """
-        try:
-            # 确保已认证
-            if "Authorization" not in self.client.headers:
-                await self.authenticate()
-            
+        async def fetch() -> Dict[str, Any]:
             # 准备文件上传
             with open(model_path, "rb") as f:
                 files = {"model": (Path(model_path).name, f, "application/octet-stream")}
                 data = {"params": json.dumps(params)}
                 
-                response = await self.client.post(
-                    f"/{endpoint}",
-                    files=files,
-                    data=data
-                )
+                response = await self._send("POST", endpoint, files=files, data=data)
                 response.raise_for_status()
-                
-                result = response.json()
-                logger.info(f"3D分析完成: {endpoint}")
-                return result
-                
+                return response.json()
+        
+        try:
+            result = await third_party_cache.get_or_fetch(endpoint, [model_path], params, fetch)
+            logger.info(f"3D分析完成: {endpoint}")
+            return result
+        
         except Exception as e:
             logger.error(f"3D分析失败 {endpoint}: {str(e)}")
             raise
@@ -261,11 +253,7 @@ class ThirdPartyAIClient:
         """
         通用3D模型对比方法
         """
-        try:
-            # 确保已认证
-            if "Authorization" not in self.client.headers:
-                await self.authenticate()
-            
+        async def fetch() -> Dict[str, Any]:
             # 准备文件上传
             with open(model1_path, "rb") as f1, open(model2_path, "rb") as f2:
                 files = [
@@ -274,17 +262,16 @@ class ThirdPartyAIClient:
                 ]
                 data = {"params": json.dumps(params)}
                 
-                response = await self.client.post(
-                    f"/{endpoint}",
-                    files=files,
-                    data=data
-                )
+                response = await self._send("POST", endpoint, files=files, data=data)
                 response.raise_for_status()
-                
-                result = response.json()
-                logger.info(f"3D对比完成: {endpoint}")
-                return result
-                
+                return response.json()
+        
+        try:
+            # 缓存键按两个模型的顺序区分
+            result = await third_party_cache.get_or_fetch(endpoint, [model1_path, model2_path], params, fetch)
+            logger.info(f"3D对比完成: {endpoint}")
+            return result
+        
         except Exception as e:
             logger.error(f"3D对比失败 {endpoint}: {str(e)}")
             raise
@@ -294,15 +281,43 @@ class ThirdPartyAIClient:
         获取分析任务状态（用于异步任务）
         """
         try:
-            response = await self.client.get(f"/analysis/status/{task_id}")
+            response = await self._send("GET", f"analysis/status/{task_id}", route="analysis/status")
             response.raise_for_status()
             return response.json()
         except Exception as e:
             logger.error(f"获取任务状态失败: {str(e)}")
             raise
     
+    async def _send(self, method: str, endpoint: str, route: Optional[str] = None, **kwargs) -> httpx.Response:
+        """
+        在认证、限流、重试和熔断策略下发送请求
+        route 为限流和熔断使用的接口名（路径含ID时传入模板），默认与 endpoint 相同
+        """
+        route = route or endpoint
+        limiter = third_party_limiter.get(route)
+        
+        async def send(token: str) -> httpx.Response:
+            async with limiter.slot() as slot:
+                response = await self.client.request(
+                    method, f"/{endpoint}", headers={"Authorization": f"Bearer {token}"}, **kwargs
+                )
+                slot.observe(response)
+            return response
+        
+        async def attempt() -> httpx.Response:
+            # 令牌被拒绝（401）时重新认证并立即重发一次，重新认证不占用并发槽位
+            token = await self.tokens.get_token()
+            response = await send(token)
+            if response.status_code == 401:
+                token = await self.tokens.handle_unauthorized(token)
+                response = await send(token)
+            return response
+        
+        return await third_party_resilience.call(route, attempt)
+    
     async def close(self):
         """关闭HTTP客户端"""
+        await self.tokens.stop()
         await self.client.aclose()
 
 
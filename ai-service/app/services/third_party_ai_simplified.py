@@ -1,20 +1,46 @@
 """
 第三方AI服务客户端 - 简化版
 只保留实际需要的7个API接口
+客户端为应用级单例：所有分析任务共享同一个HTTP连接池和访问令牌，由应用生命周期负责启动和关闭
+分析结果按文件内容摘要缓存（third_party_cache），同一文件重复分析不再调用第三方服务
 """
 
 import httpx
 import asyncio
-from typing import Dict, Any, Optional, List, Union
+import time
+from typing import Dict, Any, Optional, List, Tuple, Union
 from pathlib import Path
 import json
 import logging
 
 from app.core.config import settings
+from app.core.metrics import THIRD_PARTY_REQUESTS, THIRD_PARTY_LATENCY, THIRD_PARTY_CONNECTIONS
+from app.services.token_manager import TokenManager
+from app.services.adaptive_limiter import EndpointLimiter, third_party_limiter
+from app.services.resilience import CircuitOpenError, third_party_resilience
+from app.services.third_party_cache import third_party_cache
+
+try:
+    import h2
+except ImportError:  # 可选依赖，HTTP/2需要
+    h2 = None
 
 logger = logging.getLogger(__name__)
 
 
+class _ConnectionTrace:
+    """httpcore trace回调：记录请求是否新建了连接（否则复用了连接池中的连接）"""
+    
+    __slots__ = ("new_connection",)
+    
+    def __init__(self):
+        self.new_connection = False
+    
+    async def __call__(self, event_name: str, info: Dict[str, Any]):
+        if event_name == "connection.connect_tcp.started":
+            self.new_connection = True
+
+
 class SimplifiedThirdPartyAIClient:
     """罗慕科技OpenAPI客户端 - 简化版"""
     
@@ -24,20 +50,76 @@ class SimplifiedThirdPartyAIClient:
         self.api_secret = settings.THIRD_PARTY_AI_SECRET
         self.timeout = settings.THIRD_PARTY_AI_TIMEOUT
         
-        # 创建HTTP客户端
+        # HTTP客户端在 start() 中创建，所有请求共享连接池
+        self.client: Optional[httpx.AsyncClient] = None
+        self.http2 = False
+        
+        # 访问令牌（Redis中跨worker共享，到期前主动刷新）
+        self.tokens = TokenManager(self._fetch_token, credential=f"{self.base_url}|{self.api_key}")
+        
+        self._stats = {
+            "requests": 0,
+            "errors": 0,
+            "auth_retries": 0,
+            "new_connections": 0,
+            "reused_connections": 0
+        }
+    
+    def start(self):
+        """创建共享HTTP客户端（幂等）"""
+        if self.client is not None and not self.client.is_closed:
+            return
+        
+        self.http2 = settings.THIRD_PARTY_AI_HTTP2 and h2 is not None
+        if settings.THIRD_PARTY_AI_HTTP2 and h2 is None:
+            logger.warning("未安装h2，第三方AI服务使用HTTP/1.1")
+        
+        # 不设置默认Content-Type：JSON和multipart请求由httpx按请求体自动设置
         self.client = httpx.AsyncClient(
             base_url=self.base_url,
-            timeout=httpx.Timeout(timeout=self.timeout),
+            timeout=httpx.Timeout(
+                timeout=self.timeout,
+                connect=settings.THIRD_PARTY_AI_CONNECT_TIMEOUT
+            ),
+            limits=httpx.Limits(
+                max_connections=settings.THIRD_PARTY_AI_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.THIRD_PARTY_AI_MAX_KEEPALIVE,
+                keepalive_expiry=settings.THIRD_PARTY_AI_KEEPALIVE_EXPIRY
+            ),
+            http2=self.http2,
             headers={
-                "User-Agent": f"ILM-RSP-AI-Service/{settings.VERSION}",
-                "Content-Type": "application/json"
+                "User-Agent": f"ILM-RSP-AI-Service/{settings.VERSION}"
+            },
+            event_hooks={
+                "request": [self._on_request],
+                "response": [self._on_response]
             }
         )
+        logger.info(
+            f"第三方AI服务连接池已创建: max_connections={settings.THIRD_PARTY_AI_MAX_CONNECTIONS}, "
+            f"max_keepalive={settings.THIRD_PARTY_AI_MAX_KEEPALIVE}, http2={self.http2}"
+        )
+    
+    async def _on_request(self, request: httpx.Request):
+        request.extensions["trace"] = _ConnectionTrace()
+    
+    async def _on_response(self, response: httpx.Response):
+        trace = response.request.extensions.get("trace")
+        if not isinstance(trace, _ConnectionTrace):
+            return
+        result = "new" if trace.new_connection else "reused"
+        self._stats[f"{result}_connections"] += 1
+        THIRD_PARTY_CONNECTIONS.labels(result=result, http_version=response.http_version).inc()
     
     async def authenticate(self) -> str:
         """
-        获取访问令牌
+        获取访问令牌（已有有效令牌时直接返回）
         """
+        return await self.tokens.get_token()
+    
+    async def _fetch_token(self) -> Tuple[str, Optional[float]]:
+        """调用认证接口，返回令牌和有效期（秒）"""
+        self.start()
         try:
             response = await self.client.post("/auth/token", json={
                 "api_key": self.api_key,
@@ -46,20 +128,66 @@ class SimplifiedThirdPartyAIClient:
             response.raise_for_status()
             
             result = response.json()
-            token = result.get("access_token")
-            
-            # 更新客户端头部
-            self.client.headers.update({
-                "Authorization": f"Bearer {token}"
-            })
-            
             logger.info("第三方AI服务认证成功")
-            return token
+            return result["access_token"], result.get("expires_in")
             
         except Exception as e:
             logger.error(f"第三方AI服务认证失败: {str(e)}")
             raise
     
+    async def _request(self, method: str, endpoint: str, route: Optional[str] = None, **kwargs) -> httpx.Response:
+        """
+        带认证、限流、重试和熔断的请求
+        route 为限流、熔断和指标使用的接口名（路径含ID时传入模板），默认与 endpoint 相同
+        """
+        self.start()
+        route = route or endpoint
+        limiter = third_party_limiter.get(route)
+        
+        async def attempt() -> httpx.Response:
+            # 令牌被拒绝（401）时重新认证并立即重发一次，重新认证不占用并发槽位
+            token = await self.tokens.get_token()
+            response = await self._send(limiter, method, endpoint, token, **kwargs)
+            if response.status_code == 401:
+                self._stats["auth_retries"] += 1
+                token = await self.tokens.handle_unauthorized(token)
+                response = await self._send(limiter, method, endpoint, token, **kwargs)
+            return response
+        
+        self._stats["requests"] += 1
+        try:
+            response = await third_party_resilience.call(route, attempt)
+            response.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            self._stats["errors"] += 1
+            THIRD_PARTY_REQUESTS.labels(endpoint=route, status=str(e.response.status_code)).inc()
+            raise
+        except CircuitOpenError:
+            self._stats["errors"] += 1
+            THIRD_PARTY_REQUESTS.labels(endpoint=route, status="circuit_open").inc()
+            raise
+        except Exception:
+            self._stats["errors"] += 1
+            THIRD_PARTY_REQUESTS.labels(endpoint=route, status="error").inc()
+            raise
+        
+        THIRD_PARTY_REQUESTS.labels(endpoint=route, status=str(response.status_code)).inc()
+        return response
+    
+    async def _send(self, limiter: EndpointLimiter, method: str, endpoint: str, token: str,
+                    **kwargs) -> httpx.Response:
+        """在限流器槽位内发送一次请求"""
+        async with limiter.slot() as slot:
+            start = time.perf_counter()
+            try:
+                response = await self.client.request(
+                    method, f"/{endpoint}", headers={"Authorization": f"Bearer {token}"}, **kwargs
+                )
+            finally:
+                THIRD_PARTY_LATENCY.labels(endpoint=limiter.endpoint).observe(time.perf_counter() - start)
+            slot.observe(response)
+        return response
+    
     # ========== 2D 影像分析能力 ==========
     
     async def oral_classification(self, image_path: str) -> Dict[str, Any]:
@@ -155,27 +283,21 @@ class SimplifiedThirdPartyAIClient:
         """
         通用2D图像分析方法
         """
-        try:
-            # 确保已认证
-            if "Authorization" not in self.client.headers:
-                await self.authenticate()
-            
+        async def fetch() -> Dict[str, Any]:
             # 准备文件上传
             with open(image_path, "rb") as f:
                 files = {"image": (Path(image_path).name, f, "image/jpeg")}
                 data = {"params": json.dumps(params)}
                 
-                response = await self.client.post(
-                    f"/{endpoint}",
-                    files=files,
-                    data=data
-                )
-                response.raise_for_status()
-                
-                result = response.json()
-                logger.info(f"2D分析完成: {endpoint}")
-                return result
-                
+                response = await self._request("POST", endpoint, files=files, data=data)
+                return response.json()
+        
+        try:
+            # 同一文件、接口和参数的结果从缓存读取，不重复上传
+            result = await third_party_cache.get_or_fetch(endpoint, [image_path], params, fetch)
+            logger.info(f"2D分析完成: {endpoint}")
+            return result
+        
         except Exception as e:
             logger.error(f"2D分析失败 {endpoint}: {str(e)}")
             raise
@@ -184,27 +306,21 @@ class SimplifiedThirdPartyAIClient:
         """
         通用3D模型分析方法
         """
-        try:
-            # 确保已认证
-            if "Authorization" not in self.client.headers:
-                await self.authenticate()
-            
+        async def fetch() -> Dict[str, Any]:
             # 准备文件上传
             with open(model_path, "rb") as f:
                 files = {"model": (Path(model_path).name, f, "application/octet-stream")}
                 data = {"params": json.dumps(params)}
                 
-                response = await self.client.post(
-                    f"/{endpoint}",
-                    files=files,
-                    data=data
-                )
-                response.raise_for_status()
-                
-                result = response.json()
-                logger.info(f"3D分析完成: {endpoint}")
-                return result
-                
+                response = await self._request("POST", endpoint, files=files, data=data)
+                return response.json()
+        
+        try:
+            # 同一文件、接口和参数的结果从缓存读取，不重复上传
+            result = await third_party_cache.get_or_fetch(endpoint, [model_path], params, fetch)
+            logger.info(f"3D分析完成: {endpoint}")
+            return result
+        
         except Exception as e:
             logger.error(f"3D分析失败 {endpoint}: {str(e)}")
             raise
@@ -214,16 +330,35 @@ class SimplifiedThirdPartyAIClient:
         获取分析任务状态（用于异步任务）
         """
         try:
-            response = await self.client.get(f"/analysis/status/{task_id}")
-            response.raise_for_status()
+            response = await self._request("GET", f"analysis/status/{task_id}", route="analysis/status")
             return response.json()
         except Exception as e:
             logger.error(f"获取任务状态失败: {str(e)}")
             raise
     
+    def get_stats(self) -> Dict[str, Any]:
+        """连接池配置和连接复用统计（本worker）"""
+        connections = self._stats["new_connections"] + self._stats["reused_connections"]
+        return {
+            "running": self.client is not None and not self.client.is_closed,
+            "base_url": self.base_url,
+            "http2": self.http2,
+            "max_connections": settings.THIRD_PARTY_AI_MAX_CONNECTIONS,
+            "max_keepalive": settings.THIRD_PARTY_AI_MAX_KEEPALIVE,
+            **self._stats,
+            "reuse_ratio": round(self._stats["reused_connections"] / connections, 4) if connections else 0.0,
+            "token": self.tokens.get_stats(),
+            "limiters": third_party_limiter.get_stats(),
+            "resilience": third_party_resilience.get_stats(),
+            "cache": third_party_cache.get_stats()
+        }
+    
     async def close(self):
-        """关闭HTTP客户端"""
-        await self.client.aclose()
+        """关闭HTTP客户端，释放连接池"""
+        await self.tokens.stop()
+        if self.client is not None:
+            await self.client.aclose()
+        self.client = None
 
 
 # 模拟API响应（开发阶段使用）
@@ -418,16 +553,56 @@ class MockSimplifiedThirdPartyAIClient:
             }
         }
     
+    def start(self):
+        """模拟启动"""
+        pass
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """模拟统计"""
+        return {"running": True, "mock": True}
+    
     async def close(self):
         """模拟关闭"""
         pass
 
 
+# 全局客户端实例（每个worker一个连接池）
+simplified_ai_client = SimplifiedThirdPartyAIClient()
+_mock_ai_client: Optional[MockSimplifiedThirdPartyAIClient] = None
+
+
 def get_simplified_ai_client() -> Union[SimplifiedThirdPartyAIClient, MockSimplifiedThirdPartyAIClient]:
     """
     获取AI客户端实例 - 简化版
-    根据配置返回真实或模拟客户端
+    根据配置返回真实或模拟客户端，均为进程内共享实例
     """
+    global _mock_ai_client
     if settings.MOCK_THIRD_PARTY_API:
-        return MockSimplifiedThirdPartyAIClient()
-    return SimplifiedThirdPartyAIClient()
+        if _mock_ai_client is None:
+            _mock_ai_client = MockSimplifiedThirdPartyAIClient()
+        return _mock_ai_client
+    return simplified_ai_client
+
+
+async def init_ai_client():
+    """应用启动时创建第三方AI服务连接池，配置了凭据时启动令牌定时刷新"""
+    client = get_simplified_ai_client()
+    client.start()
+    if isinstance(client, SimplifiedThirdPartyAIClient) and client.api_key:
+        client.tokens.start()
+
+
+async def close_ai_client():
+    """应用关闭时释放第三方AI服务连接池"""
+    await get_simplified_ai_client().close()
+
+
+# 导出
+__all__ = [
+    "SimplifiedThirdPartyAIClient",
+    "MockSimplifiedThirdPartyAIClient",
+    "simplified_ai_client",
+    "get_simplified_ai_client",
+    "init_ai_client",
+    "close_ai_client",
+]
@@ -0,0 +1,227 @@
+"""
+第三方AI服务响应缓存
+按 (文件内容sha256, 接口, 参数规范化JSON, 接口版本) 缓存分析结果，同一文件重复分析时不再上传和计费
+- 本地磁盘层（可选，THIRD_PARTY_CACHE_DIR）：每个条目一个JSON文件，按保留时间和总大小淘汰
+- Redis层：经 get_or_compute 写入，同一结果跨worker只请求一次第三方服务；分析结果不会变化，不做提前刷新
+- 只缓存成功的结果；各层命中次数通过 ai_third_party_cache_requests_total 指标暴露
+"""
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+from app.core.config import settings
+from app.core.logger import cache_logger
+from app.core.metrics import THIRD_PARTY_CACHE_REQUESTS
+from app.core.redis import redis_manager, CacheKeys
+
+
+# 计算文件摘要的读取块大小
+DIGEST_CHUNK_SIZE = 1024 * 1024
+
+# 两次磁盘容量检查的最小间隔（秒）
+DISK_PRUNE_INTERVAL = 60
+
+
+def file_digest(path: str) -> str:
+    """分块计算文件内容的sha256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(DIGEST_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def canonical_params(params: Dict[str, Any]) -> str:
+    """参数的规范化JSON：键排序、无多余空白，等价参数得到相同的缓存键"""
+    return json.dumps(params, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+def is_cacheable(result: Any) -> bool:
+    """只缓存成功的分析结果"""
+    return isinstance(result, dict) and result.get("success", True) is not False
+
+
+class DiskCacheTier:
+    """本地磁盘缓存层，同一台机器上的worker共享"""
+
+    def __init__(self, directory: str, ttl: int, max_bytes: int):
+        self.directory = Path(directory)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._last_prune = 0.0
+
+    def _path(self, key: str) -> Path:
+        name = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return self.directory / name[:2] / f"{name}.json"
+
+    def read(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            if time.time() - path.stat().st_mtime > self.ttl:
+                path.unlink(missing_ok=True)
+                return None
+            entry = json.loads(path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            cache_logger.warning("读取第三方响应磁盘缓存失败", path=str(path), error=str(e))
+            return None
+        if entry.get("key") != key:
+            return None
+        # atime不可靠（noatime挂载），读取后更新mtime作为最近使用时间
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry["value"]
+
+    def write(self, key: str, value: Dict[str, Any]):
+        path = self._path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # 先写临时文件再原子替换，并发读取不会读到半个文件
+            tmp = path.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_text(json.dumps({"key": key, "value": value}, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, path)
+        except OSError as e:
+            cache_logger.warning("写入第三方响应磁盘缓存失败", path=str(path), error=str(e))
+            return
+        if time.monotonic() - self._last_prune >= DISK_PRUNE_INTERVAL:
+            self._last_prune = time.monotonic()
+            self.prune()
+
+    def prune(self) -> int:
+        """删除过期条目；总大小超过上限时按最近使用时间从旧到新删除，返回删除的文件数"""
+        entries: List[tuple] = []
+        for path in self.directory.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        now = time.time()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for mtime, size, path in sorted(entries):
+            if now - mtime <= self.ttl and total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        if removed:
+            cache_logger.info("第三方响应磁盘缓存已清理", removed=removed, total_bytes=total)
+        return removed
+
+
+class ThirdPartyResponseCache:
+    """第三方AI服务响应缓存：磁盘 -> Redis -> 第三方服务"""
+
+    def __init__(self, ttl: Optional[int] = None, directory: Optional[str] = None):
+        self.enabled = settings.THIRD_PARTY_CACHE_ENABLED
+        self.ttl = ttl or settings.THIRD_PARTY_CACHE_TTL
+        directory = settings.THIRD_PARTY_CACHE_DIR if directory is None else directory
+        self.disk = DiskCacheTier(
+            directory, settings.THIRD_PARTY_CACHE_DISK_TTL, settings.THIRD_PARTY_CACHE_DISK_MAX_BYTES
+        ) if directory else None
+
+        self._stats = {"disk_hits": 0, "redis_hits": 0, "misses": 0, "uncacheable": 0}
+
+    async def cache_key(self, endpoint: str, paths: Sequence[str], params: Dict[str, Any]) -> str:
+        """缓存键：文件内容摘要（多个文件按顺序合并）+ 接口 + 参数摘要 + 接口版本"""
+        loop = asyncio.get_running_loop()
+        digests = [await loop.run_in_executor(None, file_digest, path) for path in paths]
+        content_hash = digests[0] if len(digests) == 1 else hashlib.sha256(
+            ":".join(digests).encode("utf-8")
+        ).hexdigest()
+        params_hash = hashlib.sha256(canonical_params(params).encode("utf-8")).hexdigest()[:16]
+
+        return CacheKeys.format_key(
+            CacheKeys.THIRD_PARTY_RESULT,
+            api_version=settings.THIRD_PARTY_AI_API_VERSION,
+            endpoint=endpoint,
+            params_hash=params_hash,
+            content_hash=content_hash
+        )
+
+    async def get_or_fetch(self, endpoint: str, paths: Sequence[str], params: Dict[str, Any],
+                           fetch: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """
+        读取缓存，未命中时调用 fetch 请求第三方服务并写入缓存
+        同一文件的并发请求只调用一次第三方服务
+        """
+        if not self.enabled:
+            return await fetch()
+
+        key = await self.cache_key(endpoint, paths, params)
+        loop = asyncio.get_running_loop()
+
+        if self.disk is not None:
+            value = await loop.run_in_executor(None, self.disk.read, key)
+            if value is not None:
+                self._record(endpoint, "disk")
+                return value
+
+        fetched: Optional[Dict[str, Any]] = None
+
+        async def compute() -> Optional[Dict[str, Any]]:
+            nonlocal fetched
+            fetched = await fetch()
+            # 失败结果不写入缓存（get_or_compute 不缓存None）
+            return fetched if is_cacheable(fetched) else None
+
+        value = await redis_manager.get_or_compute(
+            key, compute, ttl=self.ttl, stale_ttl=0, beta=0, lock_ttl=settings.THIRD_PARTY_AI_TIMEOUT
+        )
+        if fetched is not None:
+            self._record(endpoint, "miss")
+            if value is None:
+                self._stats["uncacheable"] += 1
+                return fetched
+        elif value is None:
+            # 共享的是其他调用方未缓存的失败结果，自行请求
+            self._record(endpoint, "miss")
+            return await fetch()
+        else:
+            self._record(endpoint, "redis")
+
+        if self.disk is not None:
+            await loop.run_in_executor(None, self.disk.write, key, value)
+        return value
+
+    def _record(self, endpoint: str, result: str):
+        self._stats["misses" if result == "miss" else f"{result}_hits"] += 1
+        THIRD_PARTY_CACHE_REQUESTS.labels(endpoint=endpoint, result=result).inc()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """缓存命中统计（本worker）"""
+        total = self._stats["disk_hits"] + self._stats["redis_hits"] + self._stats["misses"]
+        hits = self._stats["disk_hits"] + self._stats["redis_hits"]
+        return {
+            "enabled": self.enabled,
+            "disk_enabled": self.disk is not None,
+            **self._stats,
+            "hit_ratio": round(hits / total, 4) if total else 0.0,
+        }
+
+
+# 全局响应缓存实例，两个第三方客户端共用
+third_party_cache = ThirdPartyResponseCache()
+
+
+# 导出
+__all__ = [
+    "ThirdPartyResponseCache",
+    "DiskCacheTier",
+    "third_party_cache",
+    "file_digest",
+    "canonical_params",
+]
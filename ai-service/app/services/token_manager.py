@@ -0,0 +1,199 @@
+"""
+第三方服务访问令牌管理
+- 令牌连同过期时间保存在Redis（AUTH_TOKEN键），所有worker共享，进程内另存一份避免每次请求访问Redis
+- 到期前 THIRD_PARTY_AI_TOKEN_REFRESH_MARGIN 秒由后台任务主动刷新，请求路径上只读取令牌
+- 刷新通过单飞去重：进程内共享同一次刷新，跨worker由分布式锁选出一个worker调用认证接口
+- 请求返回401时按失效令牌刷新一次，持有同一失效令牌的并发请求共享这次刷新
+"""
+
+import time
+import random
+import asyncio
+import hashlib
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.core.logger import api_logger
+from app.core.redis import redis_manager, CacheKeys
+from app.services.single_flight import SingleFlight
+
+
+# 认证接口：返回 (令牌, 有效期秒数)
+TokenFetcher = Callable[[], Awaitable[Tuple[str, Optional[float]]]]
+
+
+def _fingerprint(token: Optional[str]) -> str:
+    """令牌摘要，用于键名和日志，不暴露令牌本身"""
+    if not token:
+        return "none"
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()[:16]
+
+
+class TokenManager:
+    """访问令牌管理器"""
+
+    def __init__(self, fetch: TokenFetcher, credential: str,
+                 default_ttl: Optional[int] = None, refresh_margin: Optional[int] = None,
+                 lock_ttl: Optional[int] = None):
+        self._fetch = fetch
+        self.default_ttl = default_ttl or settings.THIRD_PARTY_AI_TOKEN_TTL
+        self.refresh_margin = refresh_margin if refresh_margin is not None else settings.THIRD_PARTY_AI_TOKEN_REFRESH_MARGIN
+
+        # 按凭据区分，不同账号/环境的令牌互不覆盖
+        credential_hash = hashlib.sha256(credential.encode("utf-8")).hexdigest()[:16]
+        self.key = CacheKeys.format_key(CacheKeys.AUTH_TOKEN, token_hash=credential_hash)
+
+        # 单飞结果只需覆盖一次刷新内的等待者
+        self._flight = SingleFlight(lock_ttl=lock_ttl or settings.THIRD_PARTY_AI_TOKEN_LOCK_TTL, result_ttl=30)
+
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+        self._refresh_at = 0.0
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._loop_task: Optional[asyncio.Task] = None
+
+        self._stats = {
+            "fetches": 0,
+            "shared_adopted": 0,
+            "proactive_refreshes": 0,
+            "unauthorized_refreshes": 0,
+            "refresh_failures": 0
+        }
+
+    def _refresh_time(self, record: Dict[str, Any]) -> float:
+        """开始主动刷新的时间点：提前量不超过令牌有效期的一半"""
+        lifetime = float(record.get("lifetime", self.default_ttl))
+        return float(record["expires_at"]) - min(self.refresh_margin, lifetime / 2)
+
+    def _adopt(self, record: Dict[str, Any]):
+        self._token = record["access_token"]
+        self._expires_at = float(record["expires_at"])
+        self._refresh_at = self._refresh_time(record)
+
+    async def _load_shared(self) -> Optional[Dict[str, Any]]:
+        """读取其他worker刷新后保存的令牌，已过期时返回None"""
+        record = await redis_manager.get(self.key)
+        if not isinstance(record, dict) or "access_token" not in record:
+            return None
+        if time.time() >= float(record.get("expires_at", 0)):
+            return None
+        return record
+
+    async def get_token(self) -> str:
+        """获取有效令牌：临近过期时在后台刷新，已过期或不存在时等待刷新"""
+        now = time.time()
+        if self._token is not None and now < self._expires_at:
+            if now >= self._refresh_at:
+                self._schedule_refresh()
+            return self._token
+
+        shared = await self._load_shared()
+        if shared is not None:
+            self._adopt(shared)
+            self._stats["shared_adopted"] += 1
+            if now >= self._refresh_at:
+                self._schedule_refresh()
+            return self._token
+
+        return await self.refresh(stale=self._token)
+
+    async def refresh(self, stale: Optional[str] = None) -> str:
+        """
+        替换失效令牌 stale，返回新令牌
+        单飞键包含失效令牌摘要：替换同一令牌的刷新在所有worker中只执行一次
+        """
+        flight_key = f"{self.key}:{_fingerprint(stale)}"
+        record = await self._flight.do(flight_key, lambda: self._fetch_and_store(stale))
+        self._adopt(record)
+        return self._token
+
+    async def handle_unauthorized(self, token: str) -> str:
+        """请求返回401：丢弃该令牌并获取新令牌"""
+        self._stats["unauthorized_refreshes"] += 1
+        api_logger.warning("第三方服务令牌被拒绝，重新认证", token=_fingerprint(token))
+        if self._token == token:
+            self._token = None
+            self._expires_at = self._refresh_at = 0.0
+        return await self.refresh(stale=token)
+
+    async def _fetch_and_store(self, stale: Optional[str]) -> Dict[str, Any]:
+        """调用认证接口并保存到Redis；其他worker已完成替换时直接使用其结果"""
+        shared = await self._load_shared()
+        if shared is not None and shared["access_token"] != stale and time.time() < self._refresh_time(shared):
+            self._stats["shared_adopted"] += 1
+            return shared
+
+        token, expires_in = await self._fetch()
+        lifetime = float(expires_in or self.default_ttl)
+        record = {"access_token": token, "expires_at": time.time() + lifetime, "lifetime": lifetime}
+        self._stats["fetches"] += 1
+
+        await redis_manager.set(self.key, record, ttl=max(int(lifetime), 1))
+        api_logger.info("第三方服务令牌已刷新", token=_fingerprint(token), expires_in=lifetime)
+        return record
+
+    def _schedule_refresh(self):
+        """在后台刷新当前令牌，已有刷新进行中时不重复发起"""
+        if self._refresh_task is not None and not self._refresh_task.done():
+            return
+        self._refresh_task = asyncio.create_task(self._proactive_refresh())
+
+    async def _proactive_refresh(self):
+        try:
+            self._stats["proactive_refreshes"] += 1
+            await self.refresh(stale=self._token)
+        except Exception as e:
+            # 旧令牌仍在有效期内，下次读取或定时任务会再次尝试
+            self._stats["refresh_failures"] += 1
+            api_logger.warning("第三方服务令牌主动刷新失败", error=str(e))
+
+    def start(self):
+        """启动定时刷新任务：在令牌到期前刷新"""
+        if self._loop_task is None or self._loop_task.done():
+            self._loop_task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        for task in (self._loop_task, self._refresh_task):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._loop_task = None
+        self._refresh_task = None
+
+    async def _refresh_loop(self):
+        retry_delay = 5.0
+        while True:
+            if self._token is not None:
+                # 加入随机偏移，避免所有worker同时醒来竞争刷新锁
+                jitter = random.uniform(0, (self._expires_at - self._refresh_at) * 0.1)
+                await asyncio.sleep(max(self._refresh_at - time.time() + jitter, 0))
+            try:
+                if self._token is None:
+                    await self.get_token()
+                elif time.time() >= self._refresh_at:
+                    self._stats["proactive_refreshes"] += 1
+                    await self.refresh(stale=self._token)
+                retry_delay = 5.0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._stats["refresh_failures"] += 1
+                api_logger.warning("第三方服务令牌定时刷新失败", error=str(e), retry_in=retry_delay)
+                await asyncio.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, 60.0)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """令牌状态和刷新统计"""
+        return {
+            "has_token": self._token is not None,
+            "expires_in": round(self._expires_at - time.time(), 1) if self._token else None,
+            **self._stats,
+            "flight": self._flight.get_stats()
+        }
+
+
+# 导出
+__all__ = ["TokenManager"]
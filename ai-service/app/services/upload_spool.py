@@ -0,0 +1,88 @@
+"""
+上传文件落盘
+按块读取上传文件并写入磁盘：超过大小限制立即中止，边写边计算内容摘要，
+下游通过文件路径读取内容，不在内存中保留完整副本
+"""
+
+import os
+import uuid
+import hashlib
+from dataclasses import dataclass
+from typing import Optional
+
+import aiofiles
+from starlette.datastructures import UploadFile
+
+from app.core.config import settings
+
+
+class UploadTooLargeError(ValueError):
+    """上传文件超过大小限制"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        super().__init__(f"文件大小超过限制 ({max_size / 1024 / 1024}MB)")
+
+
+@dataclass
+class SpooledUpload:
+    """已落盘的上传文件"""
+    path: str
+    filename: str
+    size: int
+    sha256: str
+
+    def discard(self):
+        """删除落盘文件"""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+async def spool_upload(file: UploadFile, max_size: int, directory: Optional[str] = None,
+                       path: Optional[str] = None) -> SpooledUpload:
+    """
+    将上传文件分块写入 path（默认在 directory 下生成临时文件名）
+    超过 max_size 时删除已写入部分并抛出 UploadTooLargeError；写入完成前目标路径不出现不完整文件
+    """
+    # 请求体已声明的大小超限时无需读取
+    declared_size = getattr(file, "size", None)
+    if declared_size is not None and declared_size > max_size:
+        raise UploadTooLargeError(max_size)
+
+    if path is None:
+        directory = directory or settings.BATCH_SPOOL_DIR
+        path = os.path.join(directory, uuid.uuid4().hex)
+    partial_path = f"{path}.part"
+
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(partial_path, "wb") as out:
+            while True:
+                chunk = await file.read(settings.UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadTooLargeError(max_size)
+                digest.update(chunk)
+                await out.write(chunk)
+        os.replace(partial_path, path)
+    except BaseException:
+        try:
+            os.remove(partial_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+    return SpooledUpload(path=path, filename=file.filename or "", size=size, sha256=digest.hexdigest())
+
+
+# 导出
+__all__ = [
+    "SpooledUpload",
+    "UploadTooLargeError",
+    "spool_upload",
+]
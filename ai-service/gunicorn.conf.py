@@ -0,0 +1,41 @@
+"""
+gunicorn配置
+PRELOAD_MODELS=true 时在主进程fork前加载模型权重，worker以写时复制方式共享，
+配合mmap权重加载（MODEL_WEIGHTS_MMAP），每个模型的权重在宿主机上只占一份物理内存
+API节点默认只入队、不执行推理，仅在 ANALYSIS_INPROCESS_WORKER=true 时预加载才有意义
+"""
+
+import gc
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("GUNICORN_WORKERS", "4"))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "300"))
+keepalive = 2
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", "1000"))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", "100"))
+
+
+def on_starting(server):
+    """主进程启动时预加载模型权重"""
+    from app.core.config import settings
+
+    if not settings.PRELOAD_MODELS:
+        return
+    if not settings.ANALYSIS_INPROCESS_WORKER:
+        # 分析由独立的 worker.py 执行，API进程不使用模型
+        server.log.warning("未启用 ANALYSIS_INPROCESS_WORKER，API进程不执行推理，已跳过预加载")
+        return
+    if settings.DEVICE != "cpu":
+        # CUDA上下文不能跨fork共享
+        server.log.warning("PRELOAD_MODELS 仅支持CPU部署，已跳过预加载")
+        return
+
+    from app.services.model_manager import model_manager
+    model_manager.preload_models()
+
+
+def pre_fork(server, worker):
+    """fork前冻结已有对象，避免worker中的GC扫描修改对象头而触发写时复制"""
+    gc.freeze()
@@ -17,6 +17,7 @@ import httpx
 # 应用配置
 from app.core.config import settings
 from app.core.logger import setup_logging, api_logger
+from app.core.redis import init_redis, close_redis
 
 # API路由 - 使用简化版
 from app.api.v1.analysis_simplified import router as analysis_router
@@ -26,7 +27,7 @@ from app.api.v1.health import router as health_router
 from app.middleware.timing import TimingMiddleware
 
 # 服务管理
-from app.services.third_party_ai_simplified import get_simplified_ai_client
+from app.services.third_party_ai_simplified import get_simplified_ai_client, init_ai_client, close_ai_client
 
 
 @asynccontextmanager
@@ -43,7 +44,15 @@ async def lifespan(app: FastAPI):
     api_logger.info("   2D: oral_classification, cephalometric_57, panoramic_segmentation, lesion_detection")
     api_logger.info("   3D: model_downsampling_display, model_downsampling_segmentation, teeth_features")
     
-    # 测试第三方AI服务连接
+    # Redis用于在worker之间共享第三方服务访问令牌，不可用时各worker独立认证
+    try:
+        await init_redis()
+        api_logger.info("✅ Redis连接初始化完成")
+    except Exception as e:
+        api_logger.warning(f"⚠️ Redis不可用，访问令牌不跨worker共享: {str(e)}")
+    
+    # 创建第三方AI服务连接池（应用内共享）并测试连接
+    await init_ai_client()
     try:
         ai_client = get_simplified_ai_client()
         if not settings.MOCK_THIRD_PARTY_API and settings.THIRD_PARTY_AI_KEY:
@@ -61,12 +70,13 @@ async def lifespan(app: FastAPI):
     # 关闭时
     api_logger.info("🛑 AI分析服务关闭中...")
     try:
-        ai_client = get_simplified_ai_client()
-        await ai_client.close()
+        await close_ai_client()
         api_logger.info("✅ 第三方AI客户端已关闭")
     except Exception as e:
         api_logger.error(f"❌ 关闭第三方AI客户端失败: {str(e)}")
     
+    await close_redis()
+    
     api_logger.info("✅ AI分析服务已关闭")
 
 
@@ -27,6 +27,7 @@ from app.middleware.timing import TimingMiddleware
 
 # 服务管理
 from app.services.third_party_ai import third_party_ai_client
+from app.services.third_party_ai_simplified import init_ai_client, close_ai_client
 
 
 @asynccontextmanager
@@ -38,6 +39,9 @@ async def lifespan(app: FastAPI):
     api_logger.info(f"🌍 运行环境: {settings.ENVIRONMENT}")
     api_logger.info(f"🤖 第三方AI服务: {settings.THIRD_PARTY_AI_BASE_URL}")
     
+    # 健康检查报告共享连接池的连接和熔断状态
+    await init_ai_client()
+    
     # 测试第三方AI服务连接
     try:
         if not settings.MOCK_THIRD_PARTY_API and settings.THIRD_PARTY_AI_KEY:
@@ -56,6 +60,7 @@ async def lifespan(app: FastAPI):
     api_logger.info("🛑 AI报告解读服务关闭中...")
     try:
         await third_party_ai_client.close()
+        await close_ai_client()
         api_logger.info("✅ 第三方AI客户端已关闭")
     except Exception as e:
         api_logger.error(f"❌ 关闭第三方AI客户端失败: {str(e)}")
@@ -9,7 +9,6 @@ from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.responses import JSONResponse
 from fastapi.openapi.utils import get_openapi
 
@@ -20,6 +19,7 @@ from app.core.redis import init_redis, close_redis
 from app.middleware.logging import LoggingMiddleware
 from app.middleware.timing import TimingMiddleware
 from app.middleware.error_handler import ErrorHandlerMiddleware
+from app.middleware.compression import StreamingGZipMiddleware
 
 # 导入路由
 from app.api.v1.analysis import router as analysis_router
@@ -44,11 +44,24 @@ async def lifespan(app: FastAPI):
         await init_redis()
         logger.info("✅ Redis连接初始化完成")
         
-        # 初始化AI模型
-        from app.services.model_manager import ModelManager
-        model_manager = ModelManager()
-        await model_manager.initialize_models()
-        logger.info("✅ AI模型初始化完成")
+        # 创建第三方AI服务连接池（健康检查报告其连接和熔断状态）
+        from app.services.third_party_ai_simplified import init_ai_client
+        await init_ai_client()
+        logger.info("✅ 第三方AI服务连接池已创建")
+        
+        # 初始化AI模型（纯API节点只负责入队，可关闭预加载）
+        from app.services.model_manager import model_manager
+        if settings.LOAD_MODELS_ON_STARTUP or settings.ANALYSIS_INPROCESS_WORKER:
+            await model_manager.initialize_models()
+            model_manager.start_maintenance()
+            logger.info("✅ AI模型初始化完成")
+        
+        # 开发环境可在API进程内运行分析队列worker
+        if settings.ANALYSIS_INPROCESS_WORKER:
+            from app.services.analysis_queue import AnalysisWorker
+            app.state.analysis_worker = AnalysisWorker()
+            app.state.analysis_worker_task = asyncio.create_task(app.state.analysis_worker.run())
+            logger.info("✅ 进程内分析队列worker已启动")
         
         logger.info("🎉 AI分析服务启动完成")
         
@@ -62,6 +75,19 @@ async def lifespan(app: FastAPI):
     logger.info("🛑 正在关闭AI分析服务...")
     
     try:
+        worker = getattr(app.state, "analysis_worker", None)
+        if worker is not None:
+            worker.stop()
+            await app.state.analysis_worker_task
+        
+        from app.services.analysis_progress import progress_broker
+        await progress_broker.close()
+        
+        from app.services.third_party_ai_simplified import close_ai_client
+        await close_ai_client()
+        
+        from app.services.model_manager import model_manager
+        await model_manager.shutdown()
         await close_database()
         await close_redis()
         logger.info("✅ 服务关闭完成")
@@ -134,7 +160,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-app.add_middleware(GZipMiddleware, minimum_size=1000)
+app.add_middleware(
+    StreamingGZipMiddleware,
+    minimum_size=1000,
+    exclude_paths=[r"/events(/[^/]+)?$", r"/batch/stream$"]
+)
 app.add_middleware(ErrorHandlerMiddleware)
 app.add_middleware(TimingMiddleware)
 app.add_middleware(LoggingMiddleware)
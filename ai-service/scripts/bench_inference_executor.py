@@ -0,0 +1,101 @@
+"""
+推理执行器基准测试
+在持续饱和的推理负载下测量 /health/ping 的响应延迟，对比 inline/thread/process 三种执行器模式
+
+用法:
+    python scripts/bench_inference_executor.py --duration 10 --concurrency 16
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from fastapi import FastAPI
+from PIL import Image
+
+from app.api.v1.health import router as health_router
+from app.services.inference_executor import InferenceExecutor, EXECUTOR_MODES
+from app.services.model_manager import ModelManager
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """计算百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run_mode(mode: str, duration: float, concurrency: int, workers: int) -> Dict[str, float]:
+    """在指定执行器模式下运行一次基准测试"""
+    manager = ModelManager(executor=InferenceExecutor(mode=mode, workers=workers))
+    await manager.initialize_models()
+
+    app = FastAPI()
+    app.include_router(health_router, prefix="/health")
+
+    image = Image.new("RGB", (1024, 768), color=(180, 120, 110))
+    stop_at = time.perf_counter() + duration
+    inference_count = 0
+
+    async def inference_load():
+        nonlocal inference_count
+        while time.perf_counter() < stop_at:
+            await manager.inference("intraoral", image)
+            inference_count += 1
+
+    ping_latencies: List[float] = []
+
+    async def ping_probe(client: httpx.AsyncClient):
+        while time.perf_counter() < stop_at:
+            started = time.perf_counter()
+            response = await client.get("/health/ping")
+            response.raise_for_status()
+            ping_latencies.append((time.perf_counter() - started) * 1000)
+            await asyncio.sleep(0.01)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await asyncio.gather(
+            ping_probe(client),
+            *[inference_load() for _ in range(concurrency)]
+        )
+
+    await manager.shutdown()
+
+    return {
+        "ping_p50_ms": statistics.median(ping_latencies) if ping_latencies else 0.0,
+        "ping_p99_ms": percentile(ping_latencies, 99),
+        "ping_max_ms": max(ping_latencies) if ping_latencies else 0.0,
+        "pings": len(ping_latencies),
+        "inferences_per_sec": inference_count / duration,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="推理执行器事件循环延迟基准测试")
+    parser.add_argument("--duration", type=float, default=10.0, help="每种模式的测试时长（秒）")
+    parser.add_argument("--concurrency", type=int, default=16, help="并发推理请求数")
+    parser.add_argument("--workers", type=int, default=2, help="thread/process模式的worker数")
+    parser.add_argument("--modes", default=",".join(EXECUTOR_MODES), help="要测试的模式，逗号分隔")
+    args = parser.parse_args()
+
+    print(f"{'mode':<10}{'p50(ms)':>10}{'p99(ms)':>10}{'max(ms)':>10}{'pings':>8}{'infer/s':>10}")
+    for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+        result = await run_mode(mode, args.duration, args.concurrency, args.workers)
+        print(
+            f"{mode:<10}{result['ping_p50_ms']:>10.2f}{result['ping_p99_ms']:>10.2f}"
+            f"{result['ping_max_ms']:>10.2f}{result['pings']:>8}{result['inferences_per_sec']:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
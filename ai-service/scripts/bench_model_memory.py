@@ -0,0 +1,99 @@
+"""
+模型权重内存基准测试
+模拟gunicorn多worker部署，对比三种权重加载方式下每个worker的启动耗时和内存占用：
+- copy: 每个worker常规 torch.load，权重各自占用私有内存
+- mmap: 每个worker以mmap方式加载，共享页缓存
+- preload: 主进程预加载（mmap）后fork，worker直接复用
+
+用法:
+    python scripts/bench_model_memory.py --workers 4
+    MODELS_DIR 下缺少权重文件时会先生成随机权重文件
+"""
+
+import os
+import sys
+import time
+import argparse
+import multiprocessing
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torch
+
+from app.core.config import settings
+from app.core.metrics import process_memory
+from app.services.model_manager import ModelManager, MODEL_CONFIGS
+from app.services.inference_executor import InferenceExecutor
+from app.services.inference_backends import example_input
+
+
+MODES = ("copy", "mmap", "preload")
+
+
+def ensure_weights():
+    """为缺少权重文件的模型生成随机权重，保证各模式加载相同的文件"""
+    for model_name, config in MODEL_CONFIGS.items():
+        path = os.path.join(settings.MODELS_DIR, f"{model_name}_{config['version']}.pth")
+        if not os.path.exists(path):
+            model = config["class"](config["config"])
+            torch.save({"model_state_dict": model.state_dict()}, path)
+            print(f"已生成随机权重: {path}")
+
+
+def worker_main(manager: ModelManager, queue: multiprocessing.Queue):
+    """模拟worker：加载（或复用）模型，执行一次前向传播后报告内存"""
+    started = time.perf_counter()
+    for model_name in MODEL_CONFIGS:
+        model_info = manager.loaded_models.get(model_name)
+        if model_info is None:
+            model_info = manager.load_model_sync(model_name, setup_backend=False)
+        # 访问全部权重页，模拟真实推理后的驻留内存
+        with torch.no_grad():
+            model_info.model_instance(example_input(model_info.config))
+    load_time = time.perf_counter() - started
+
+    queue.put({"pid": os.getpid(), "load_time": load_time, **process_memory()})
+
+
+def run_mode(mode: str, workers: int) -> List[Dict[str, Any]]:
+    """在指定加载方式下启动一组worker进程"""
+    settings.MODEL_WEIGHTS_MMAP = mode != "copy"
+    manager = ModelManager(executor=InferenceExecutor(mode="inline"))
+    if mode == "preload":
+        manager.preload_models()
+
+    ctx = multiprocessing.get_context("fork")
+    queue = ctx.Queue()
+    processes = [ctx.Process(target=worker_main, args=(manager, queue)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    results = [queue.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模型权重加载内存基准测试")
+    parser.add_argument("--workers", type=int, default=4, help="模拟的worker数")
+    parser.add_argument("--modes", default=",".join(MODES), help="要测试的加载方式，逗号分隔")
+    args = parser.parse_args()
+
+    ensure_weights()
+    # fork前不初始化torch线程池
+    torch.set_num_threads(1)
+
+    print(f"{'mode':<10}{'load(s)':>10}{'rss(MB)':>10}{'pss(MB)':>10}{'private(MB)':>13}{'sum pss(MB)':>13}")
+    for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+        results = run_mode(mode, args.workers)
+        count = len(results)
+        avg = lambda key: sum(r.get(key, 0.0) for r in results) / count
+        print(
+            f"{mode:<10}{avg('load_time'):>10.3f}{avg('rss_mb'):>10.1f}{avg('pss_mb'):>10.1f}"
+            f"{avg('private_dirty_mb'):>13.1f}{sum(r.get('pss_mb', 0.0) for r in results):>13.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
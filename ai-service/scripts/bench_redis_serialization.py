@@ -0,0 +1,130 @@
+"""
+Redis缓存值序列化微基准测试
+对比原序列化路径（json.dumps + JSON/pickle依次尝试解析）与信封格式（orjson/msgpack + 可选压缩）
+在1KB–1MB分析结果上的编码/解码耗时和存储大小
+
+用法:
+    python scripts/bench_redis_serialization.py --iterations 200
+    python scripts/bench_redis_serialization.py --sizes 1024,65536 --codecs none,zstd
+"""
+
+import os
+import sys
+import json
+import time
+import pickle
+import random
+import argparse
+import statistics
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core import serialization
+from app.core.config import settings
+
+
+def make_result(target_size: int) -> Dict[str, Any]:
+    """生成接近目标大小（JSON字节数）的分析结果：逐牙位的检测框、置信度和轮廓点"""
+    rng = random.Random(target_size)
+    result = {
+        "analysis_type": "panoramic",
+        "confidence": 0.93,
+        "summary": "全景片分析完成，检测到龋齿风险牙位",
+        "teeth": {},
+    }
+    tooth = 0
+    while len(json.dumps(result, ensure_ascii=False)) < target_size:
+        tooth += 1
+        result["teeth"][f"{tooth:03d}"] = {
+            "bbox": [rng.randint(0, 3000) for _ in range(4)],
+            "confidence": round(rng.random(), 4),
+            "findings": rng.choice(["正常", "龋齿", "根尖周病变", "阻生"]),
+            "contour": [[round(rng.uniform(0, 3000), 1), round(rng.uniform(0, 1500), 1)] for _ in range(32)],
+        }
+    return result
+
+
+def legacy_dumps(value: Any) -> bytes:
+    return json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+
+def legacy_loads(raw: bytes) -> Any:
+    try:
+        return json.loads(raw.decode("utf-8"))
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        try:
+            return pickle.loads(raw)
+        except Exception:
+            return raw.decode("utf-8")
+
+
+def use_codec(codec: str):
+    """切换信封格式使用的压缩算法"""
+    settings.REDIS_COMPRESSION = codec
+    serialization._compressor = None
+
+
+def timed(func: Callable[[], Any], iterations: int) -> float:
+    """中位数耗时（微秒）"""
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1e6)
+    return statistics.median(samples)
+
+
+def run(sizes: List[int], codecs: List[str], iterations: int):
+    print(f"orjson={'yes' if serialization.orjson else 'no'} msgpack={'yes' if serialization.msgpack else 'no'} "
+          f"zstd={'yes' if serialization.zstandard else 'no'} lz4={'yes' if serialization.lz4_frame else 'no'} "
+          f"threshold={settings.REDIS_COMPRESSION_THRESHOLD}")
+    print(f"{'size':>8} {'path':<12} {'bytes':>9} {'ratio':>6} {'encode_us':>10} {'decode_us':>10}")
+
+    for size in sizes:
+        value = make_result(size)
+
+        raw = legacy_dumps(value)
+        assert legacy_loads(raw) == value
+        encode = timed(lambda: legacy_dumps(value), iterations)
+        decode = timed(lambda: legacy_loads(raw), iterations)
+        print(f"{size:>8} {'legacy':<12} {len(raw):>9} {1.0:>6.2f} {encode:>10.1f} {decode:>10.1f}")
+        baseline = len(raw)
+
+        for codec in codecs:
+            use_codec(codec)
+            if codec != "none" and serialization.compression_codec() != codec:
+                print(f"{size:>8} {'env+' + codec:<12} {'(未安装)':>9}")
+                continue
+            raw = serialization.dumps(value)
+            assert serialization.loads(raw) == value
+            encode = timed(lambda: serialization.dumps(value), iterations)
+            decode = timed(lambda: serialization.loads(raw), iterations)
+            print(f"{size:>8} {'env+' + codec:<12} {len(raw):>9} {baseline / len(raw):>6.2f} "
+                  f"{encode:>10.1f} {decode:>10.1f}")
+
+    # 非JSON字符串：原路径需要两次解析失败
+    text = "分析任务已完成" * 20
+    raw = text.encode("utf-8")
+    legacy = timed(lambda: legacy_loads(raw), iterations)
+    enveloped = serialization.dumps(text)
+    current = timed(lambda: serialization.loads(enveloped), iterations)
+    print(f"\n字符串解码: legacy {legacy:.1f}us, envelope {current:.1f}us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Redis缓存值序列化基准测试")
+    parser.add_argument("--sizes", default="1024,16384,131072,1048576", help="结果大小（字节），逗号分隔")
+    parser.add_argument("--codecs", default="none,lz4,zstd", help="压缩算法，逗号分隔")
+    parser.add_argument("--iterations", type=int, default=100)
+    args = parser.parse_args()
+
+    run(
+        [int(size) for size in args.sizes.split(",")],
+        [codec.strip() for codec in args.codecs.split(",")],
+        args.iterations
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+故障注入的第三方AI服务模拟器
+模拟罗慕科技OpenAPI的认证和分析接口，可按比例注入错误、超时、限流、令牌过期和整段故障，
+用于验证第三方客户端的重试、熔断、重试预算、限流和响应缓存行为
+
+用法:
+    # 启动模拟服务，服务端点指向它
+    python scripts/mock_vendor.py serve --port 9100 --error-rate 0.2 --latency-ms 200
+    THIRD_PARTY_AI_BASE_URL=http://127.0.0.1:9100/api/v1 MOCK_THIRD_PARTY_API=false python main-final.py
+
+    # 运行中调整故障（如模拟30秒故障）
+    curl -X POST localhost:9100/_faults -H 'Content-Type: application/json' -d '{"outage": 30}'
+
+    # 启动模拟服务并用简化版客户端压测，输出成功率、出站放大倍数和熔断统计
+    python scripts/mock_vendor.py drive --requests 500 --concurrency 32 --error-rate 0.3
+    python scripts/mock_vendor.py drive --requests 600 --arrival-rate 30 --outage-at 5 --outage 8 --timeout-rate 0.05
+    python scripts/mock_vendor.py drive --requests 300 --unique-files 20
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from collections import Counter
+from typing import Any, Dict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+# 模拟器支持的分析接口
+ENDPOINTS = [
+    "oral/classification",
+    "cephalometric/points/57",
+    "panoramic/segmentation",
+    "oral/lesions/intraoral",
+    "3d/downsampling/display",
+    "3d/downsampling/segmentation",
+    "3d/features/teeth",
+]
+
+
+class FaultState:
+    """当前故障配置和计数"""
+
+    def __init__(self, args: argparse.Namespace):
+        self.faults: Dict[str, Any] = {
+            "error_rate": args.error_rate,
+            "error_status": args.error_status,
+            "timeout_rate": args.timeout_rate,
+            "hang_seconds": args.hang_seconds,
+            "latency_ms": args.latency_ms,
+            "capacity": args.capacity,
+            "retry_after": args.retry_after,
+            "token_ttl": args.token_ttl,
+        }
+        self.outage_until = 0.0
+        self.active = 0
+        self.tokens: Dict[str, float] = {}
+        self.counts: Counter = Counter()
+
+    def start_outage(self, seconds: float):
+        self.outage_until = time.monotonic() + seconds
+
+
+def create_app(state: FaultState) -> FastAPI:
+    app = FastAPI(title="Mock OpenAPI vendor")
+
+    @app.post("/api/v1/auth/token")
+    async def auth_token():
+        state.counts["auth"] += 1
+        token = f"mock-{random.getrandbits(64):016x}"
+        state.tokens[token] = time.monotonic() + state.faults["token_ttl"]
+        return {"access_token": token, "expires_in": state.faults["token_ttl"]}
+
+    @app.post("/_faults")
+    async def update_faults(request: Request):
+        """运行中调整故障配置，{"outage": 秒数} 开始一段整体故障"""
+        changes = await request.json()
+        if "outage" in changes:
+            state.start_outage(float(changes.pop("outage")))
+        state.faults.update(changes)
+        return {"faults": state.faults, "outage_remaining": max(state.outage_until - time.monotonic(), 0)}
+
+    @app.get("/_stats")
+    async def stats():
+        return dict(state.counts)
+
+    async def analyze(request: Request, endpoint: str) -> JSONResponse:
+        faults = state.faults
+        state.counts["attempts"] += 1
+
+        token = request.headers.get("Authorization", "")[len("Bearer "):]
+        if state.tokens.get(token, 0) < time.monotonic():
+            state.counts["401"] += 1
+            return JSONResponse({"error": "invalid token"}, status_code=401)
+
+        await request.body()
+        if time.monotonic() < state.outage_until:
+            state.counts["outage"] += 1
+            return JSONResponse({"error": "service unavailable"}, status_code=503)
+
+        if faults["capacity"] and state.active >= faults["capacity"]:
+            state.counts["429"] += 1
+            return JSONResponse({"error": "too many requests"}, status_code=429,
+                                headers={"Retry-After": str(faults["retry_after"])})
+
+        state.active += 1
+        try:
+            roll = random.random()
+            if roll < faults["timeout_rate"]:
+                state.counts["hang"] += 1
+                await asyncio.sleep(faults["hang_seconds"])
+            elif roll < faults["timeout_rate"] + faults["error_rate"]:
+                state.counts[str(faults["error_status"])] += 1
+                return JSONResponse({"error": "injected failure"}, status_code=faults["error_status"])
+
+            await asyncio.sleep(random.uniform(0.5, 1.5) * faults["latency_ms"] / 1000)
+            state.counts["ok"] += 1
+            return JSONResponse({"success": True, "data": {"endpoint": endpoint, "confidence": 0.9}})
+        finally:
+            state.active -= 1
+
+    for endpoint in ENDPOINTS:
+        async def handler(request: Request, endpoint: str = endpoint):
+            return await analyze(request, endpoint)
+        app.add_api_route(f"/api/v1/{endpoint}", handler, methods=["POST"])
+
+    return app
+
+
+async def drive(args: argparse.Namespace, state: FaultState):
+    """在本进程启动模拟服务，用简化版客户端并发调用"""
+    server = uvicorn.Server(uvicorn.Config(create_app(state), host="127.0.0.1", port=args.port, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    from app.core.config import settings
+    settings.THIRD_PARTY_AI_BASE_URL = f"http://127.0.0.1:{args.port}/api/v1"
+    settings.THIRD_PARTY_AI_KEY = "mock-key"
+    settings.THIRD_PARTY_AI_TIMEOUT = args.client_timeout
+    from app.services.third_party_ai_simplified import SimplifiedThirdPartyAIClient
+
+    client = SimplifiedThirdPartyAIClient()
+    client.start()
+    await client.authenticate()
+
+    # 不同内容的文件数：默认每次调用一个新文件（不命中响应缓存），较小时可观察缓存命中
+    images = []
+    for _ in range(args.unique_files or args.requests):
+        image = tempfile.NamedTemporaryFile(suffix=".jpg", delete=False)
+        image.write(os.urandom(32 * 1024))
+        image.close()
+        images.append(image.name)
+
+    if args.outage:
+        async def schedule_outage():
+            await asyncio.sleep(args.outage_at)
+            state.start_outage(args.outage)
+        asyncio.create_task(schedule_outage())
+
+    outcomes: Counter = Counter()
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one(i: int, delay: float):
+        await asyncio.sleep(delay)
+        async with semaphore:
+            try:
+                await client.oral_classification(images[i % len(images)])
+                outcomes["success"] += 1
+            except Exception as e:
+                outcomes[type(e).__name__] += 1
+
+    start = time.perf_counter()
+    interval = 1 / args.arrival_rate if args.arrival_rate > 0 else 0.0
+    await asyncio.gather(*[one(i, i * interval) for i in range(args.requests)])
+    elapsed = time.perf_counter() - start
+
+    stats = client.get_stats()
+    await client.close()
+    server.should_exit = True
+    await server_task
+    for path in images:
+        os.unlink(path)
+
+    attempts = state.counts["attempts"]
+    print(f"调用 {args.requests} 次，耗时 {elapsed:.1f}s")
+    print(f"结果: {dict(outcomes)}")
+    print(f"模拟服务收到: {dict(state.counts)}")
+    print(f"出站放大倍数: {attempts / args.requests:.2f}")
+    print("容错统计:", json.dumps(stats["resilience"], ensure_ascii=False, indent=2))
+    print("限流统计:", json.dumps(stats["limiters"], ensure_ascii=False, indent=2))
+    print("缓存统计:", json.dumps(stats["cache"], ensure_ascii=False, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="故障注入的第三方AI服务模拟器")
+    parser.add_argument("mode", choices=["serve", "drive"], help="serve: 只启动模拟服务；drive: 启动并压测")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回错误状态码的比例")
+    parser.add_argument("--error-status", type=int, default=503, help="注入错误使用的状态码")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="挂起不响应的比例")
+    parser.add_argument("--hang-seconds", type=float, default=30.0, help="挂起时长（秒）")
+    parser.add_argument("--latency-ms", type=float, default=100.0, help="正常响应的平均延迟")
+    parser.add_argument("--capacity", type=int, default=0, help="最大并发处理数，超出返回429，0表示不限")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="429响应的Retry-After（秒）")
+    parser.add_argument("--token-ttl", type=float, default=3600.0, help="令牌有效期（秒）")
+    # drive模式
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--unique-files", type=int, default=0, help="使用的不同文件数，0表示每次调用一个新文件")
+    parser.add_argument("--arrival-rate", type=float, default=0.0, help="每秒发起的调用数，0表示同时发起")
+    parser.add_argument("--client-timeout", type=int, default=5, help="客户端请求超时（秒）")
+    parser.add_argument("--outage-at", type=float, default=0.0, help="压测开始后多少秒开始整体故障")
+    parser.add_argument("--outage", type=float, default=0.0, help="整体故障持续时间（秒），0表示不注入")
+    args = parser.parse_args()
+
+    state = FaultState(args)
+    if args.mode == "serve":
+        uvicorn.run(create_app(state), host=args.host, port=args.port, log_level="warning")
+    else:
+        asyncio.run(drive(args, state))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+按模式清理Redis缓存
+逐步SCAN并分批UNLINK，可限速，高峰期执行也不会阻塞Redis；运行中的worker会同步移除近端缓存副本
+
+用法:
+    python scripts/purge_cache.py "model:result:panoramic:*"
+    python scripts/purge_cache.py "analysis:result:*" --count 1000 --chunk 200 --pause-ms 50
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+from typing import Any, Dict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings
+from app.core.redis import init_redis, close_redis, redis_manager
+
+
+async def purge(pattern: str, count: int, chunk: int, pause_ms: int):
+    await init_redis()
+    start = time.perf_counter()
+
+    def report(progress: Dict[str, Any]):
+        elapsed = time.perf_counter() - start
+        print(f"\r已扫描 {progress['scanned']}  已删除 {progress['deleted']}  批次 {progress['chunks']}  "
+              f"{progress['deleted'] / elapsed if elapsed else 0:.0f} 键/秒", end="", flush=True)
+
+    try:
+        deleted = await redis_manager.delete_pattern(
+            pattern, count=count, chunk_size=chunk, pause_ms=pause_ms, on_progress=report
+        )
+        print(f"\n完成: 删除 {deleted} 个键，耗时 {time.perf_counter() - start:.1f}s")
+    finally:
+        await close_redis()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按模式清理Redis缓存")
+    parser.add_argument("pattern", help="键模式（Redis glob语法）")
+    parser.add_argument("--count", type=int, default=settings.REDIS_SCAN_COUNT, help="每次SCAN的COUNT")
+    parser.add_argument("--chunk", type=int, default=settings.REDIS_DELETE_CHUNK, help="每次UNLINK的最大键数")
+    parser.add_argument("--pause-ms", type=int, default=settings.REDIS_DELETE_PAUSE_MS, help="每批删除后的暂停时间（毫秒）")
+    args = parser.parse_args()
+
+    asyncio.run(purge(args.pattern, args.count, args.chunk, args.pause_ms))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+儿童口腔快速筛查报告平台 - 分析队列worker
+从Redis Streams分析队列拉取任务并执行AI分析，与API节点独立部署和扩容
+
+用法:
+    python worker.py                        # 消费全部分析类型
+    python worker.py --types intraoral      # 只消费指定类型（按模型划分推理节点）
+    python worker.py --concurrency 4
+"""
+
+import signal
+import asyncio
+import argparse
+
+from app.core.config import settings
+from app.core.logger import logger
+from app.core.redis import init_redis, close_redis
+
+
+async def main(analysis_types, concurrency):
+    logger.info("🚀 启动分析队列worker...")
+
+    await init_redis()
+
+    from app.services.model_manager import model_manager
+    from app.services.analysis_queue import AnalysisWorker
+
+    await model_manager.initialize_models()
+    model_manager.start_maintenance()
+
+    worker = AnalysisWorker(analysis_types=analysis_types, concurrency=concurrency)
+
+    # 收到终止信号后停止拉取新任务，等待执行中的任务完成
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, worker.stop)
+
+    try:
+        await worker.run()
+    finally:
+        logger.info("🛑 正在关闭分析队列worker...", **worker.get_stats())
+        await model_manager.shutdown()
+        await close_redis()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="分析队列worker")
+    parser.add_argument("--types", default="", help="要消费的分析类型，逗号分隔（默认全部）")
+    parser.add_argument("--concurrency", type=int, default=settings.MAX_CONCURRENT_ANALYSES,
+                        help="最大并发分析数")
+    args = parser.parse_args()
+
+    types = [t.strip() for t in args.types.split(",") if t.strip()] or None
+    asyncio.run(main(types, args.concurrency))